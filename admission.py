@@ -0,0 +1,189 @@
+"""Admission control перед эндпоинтами, которые ходят в БД.
+
+Каждый класс эндпоинтов (read, stats, write) ограничен двумя способами:
+- token bucket на клиента: сверх RATE запросов в секунду (с запасом BURST)
+  клиент получает 429 с Retry-After;
+- число одновременных запросов класса в воркере: лишние ждут в короткой
+  очереди не дольше QUEUE_TIMEOUT, а при переполненной очереди или
+  истёкшем ожидании получают 503.
+
+Так поток запросов одного клиента не выедает пул соединений у остальных,
+а при перегрузке запросы отклоняются сразу, не дожидаясь таймаута пула.
+Сервисные клиенты (бот, который ходит в API за всех своих пользователей)
+token bucket'ом не ограничиваются, только числом одновременных запросов.
+Счётчики живут в памяти процесса: под gunicorn лимиты действуют в каждом
+воркере отдельно.
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+
+from prometheus_client import Counter, Gauge, Histogram
+
+import settings
+
+# ===== Metrics =====
+ADMISSION_REQUESTS = Counter(
+    'admission_requests_total', 'Запросы по исходу admission control', ['endpoint_class', 'outcome']
+)
+ADMISSION_IN_FLIGHT = Gauge(
+    'admission_in_flight', 'Выполняющиеся запросы класса', ['endpoint_class'],
+    multiprocess_mode='livesum'
+)
+ADMISSION_QUEUED = Gauge(
+    'admission_queued', 'Запросы, ждущие свободного места', ['endpoint_class'],
+    multiprocess_mode='livesum'
+)
+ADMISSION_WAIT = Histogram(
+    'admission_queue_wait_seconds', 'Ожидание в очереди admission control', ['endpoint_class'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+
+
+class RateLimited(Exception):
+    """Клиент превысил лимит; retry_after — через сколько секунд появится токен"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Слишком много запросов, повторите через {retry_after} с")
+        self.retry_after = retry_after
+
+
+class Overloaded(Exception):
+    """Нет свободного места и очередь не дождалась его: запрос отклонён"""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBuckets:
+    """Token bucket на каждого клиента: rate токенов в секунду, не больше burst.
+
+    Хранится не больше max_clients корзин; дольше всех не появлявшийся клиент
+    вытесняется (его корзина к этому времени всё равно почти полна).
+    """
+
+    def __init__(self, rate, burst, max_clients=settings.ADMISSION_MAX_CLIENTS):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()  # client -> (tokens, monotonic time)
+
+    def take(self, client):
+        """0, если токен взят, иначе сколько секунд ждать следующего"""
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0
+        else:
+            wait = (1 - tokens) / self.rate
+        self._buckets[client] = (tokens, now)
+        if len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class ConcurrencyLimiter:
+    """Не больше limit одновременных владельцев, до max_queue ждут по очереди.
+
+    В отличие от asyncio.Semaphore ожидание ограничено временем и длиной
+    очереди, а освободившееся место передаётся первому ждущему напрямую.
+    """
+
+    def __init__(self, limit, max_queue, timeout):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.active = 0
+        self._waiters = deque()
+
+    @property
+    def queued(self):
+        return len(self._waiters)
+
+    async def acquire(self):
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise Overloaded("Сервер перегружен, повторите запрос позже")
+
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        expire = loop.call_later(self.timeout, self._expire, waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # Место могло быть передано в тот же момент, когда запрос отменили
+            if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                self.release()
+            raise
+        finally:
+            expire.cancel()
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def _expire(self, waiter):
+        if not waiter.done():
+            waiter.set_exception(Overloaded("Сервер перегружен: истекло ожидание в очереди",
+                                            retry_after=max(1, math.ceil(self.timeout))))
+
+    def release(self):
+        # Место переходит к первому живому ждущему, active не меняется
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+class EndpointClass:
+    """Лимиты одного класса эндпоинтов; 0 в rate или concurrency — без ограничения"""
+
+    def __init__(self, name, rate, burst, concurrency, queue, queue_timeout):
+        self.name = name
+        self.buckets = TokenBuckets(rate, burst) if rate > 0 else None
+        self.limiter = ConcurrencyLimiter(concurrency, queue, queue_timeout) if concurrency > 0 else None
+
+        self._in_flight = ADMISSION_IN_FLIGHT.labels(name)
+        self._queued = ADMISSION_QUEUED.labels(name)
+        self._wait = ADMISSION_WAIT.labels(name)
+        self._outcomes = {outcome: ADMISSION_REQUESTS.labels(name, outcome)
+                          for outcome in ('admitted', 'rate_limited', 'shed')}
+
+    async def admit(self, client):
+        """Занять место для запроса клиента; RateLimited или Overloaded, если нельзя.
+
+        client None — сервисный клиент: лимит запросов в секунду к нему не применяется.
+        """
+        if self.buckets is not None and client is not None:
+            wait = self.buckets.take(client)
+            if wait:
+                self._outcomes['rate_limited'].inc()
+                raise RateLimited(max(1, math.ceil(wait)))
+        if self.limiter is not None:
+            started = time.perf_counter()
+            self._queued.inc()
+            try:
+                await self.limiter.acquire()
+            except Overloaded:
+                self._outcomes['shed'].inc()
+                raise
+            finally:
+                self._queued.dec()
+                self._wait.observe(time.perf_counter() - started)
+        self._in_flight.inc()
+        self._outcomes['admitted'].inc()
+
+    def release(self):
+        self._in_flight.dec()
+        if self.limiter is not None:
+            self.limiter.release()
+
+
+classes = {name: EndpointClass(name, **limits) for name, limits in settings.ADMISSION_CLASSES.items()}
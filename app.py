@@ -1,14 +1,69 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, EmailStr
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from datetime import datetime
-from typing import List, Optional
+import asyncio
+import hmac
+import math
 import time
-from psycopg2 import OperationalError
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+
+from fastapi import Body, FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, EmailStr
+from typing import List, Literal, Optional, Union
 from prometheus_fastapi_instrumentator import Instrumentator
 
-app = FastAPI(title="TODO API", version="1.0.0")
+import admission
+import db
+import events
+import settings
+import transfer
+from batching import QueueFull, WriteBatcher
+from cache import CacheEntry, apply_event, conditional, make_etag, todos_cache, users_cache
+from db import PoolTimeout
+from health import DatabaseMonitor
+from pagination import encode_cursor, ndjson_response
+from repository import repository
+from serialization import RowsResponse
+from storage import BUCKETS, IntegrityError, bucket_start
+
+monitor = DatabaseMonitor(repository.ping)
+todo_batcher = WriteBatcher('todos_create', repository.create_todos, fatal=db.UNAVAILABLE)
+event_hub = events.EventHub()
+# Кэш каждого воркера сбрасывается по изменениям из всех воркеров
+event_hub.listeners.append(apply_event)
+
+# Хранилище в памяти публикует изменения само, без LISTEN/NOTIFY
+POSTGRES = settings.STORAGE_BACKEND == 'postgres'
+if not POSTGRES:
+    repository.on_change = event_hub.publish
+
+async def warm_up():
+    """Открыть хранилище (минимальное число соединений пула) и подготовить запросы"""
+    await repository.open()
+    await asyncio.gather(*(repository.warm_up() for _ in range(settings.DB_POOL_MIN_SIZE)))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Прогрев ограничен по времени: недоступная БД не задерживает старт,
+    # приложение просто не будет готово (/readyz), пока её не увидит монитор
+    try:
+        await asyncio.wait_for(warm_up(), settings.STARTUP_WARMUP_TIMEOUT)
+        if POSTGRES:
+            print("✓ Пул соединений прогрет")
+    except Exception as e:
+        print(f"✗ Не удалось прогреть пул соединений: {str(e) or type(e).__name__}")
+    monitor.start()
+    if POSTGRES:
+        event_hub.start()
+    if settings.WRITE_BATCHING:
+        todo_batcher.start()
+    yield
+    # Сначала дописать очередь, потом закрывать пул
+    await todo_batcher.stop()
+    await event_hub.stop()
+    await monitor.stop()
+    await repository.close()
+
+app = FastAPI(title="TODO API", version="1.0.0", lifespan=lifespan)
 
 instrumentator = Instrumentator().instrument(app).expose(app)
 # ===== Models =====
@@ -37,52 +92,123 @@ class Todo(BaseModel):
     task: str
     completed: bool
     created_at: str
+    completed_at: Optional[str] = None
+
+class TodoSearchResult(Todo):
+    rank: float
+
+class TodoPatch(BaseModel):
+    id: int
+    task: Optional[str] = None
+    completed: Optional[bool] = None
+
+class BulkItemResult(BaseModel):
+    index: int
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+class BulkResult(BaseModel):
+    message: str
+    succeeded: int
+    failed: int
+    results: List[BulkItemResult]
 
 # ===== Database =====
-def get_db_connection_with_retry(max_retries=10, delay=2):
-    """Подключение к БД с повторами"""
-    for attempt in range(max_retries):
-        try:
-            conn = psycopg2.connect(
-                host='postgres',
-                database='myapp',
-                user='admin',
-                password='admin',
-                port=5432
-            )
-            return conn
-        except OperationalError as e:
-            if attempt < max_retries - 1:
-                print(f"✗ Попытка {attempt + 1}/{max_retries}: {e}")
-                time.sleep(delay)
-            else:
-                raise
-
-def get_db_connection():
-    return get_db_connection_with_retry()
-
-def init_schema():
-    """Инициализация БД из schema.sql"""
+def db_error(e: Exception) -> HTTPException:
+    """HTTP-ошибка для исключения при работе с БД"""
+    if isinstance(e, PoolTimeout):
+        return HTTPException(status_code=503, detail="БД перегружена, повторите запрос позже")
+    return HTTPException(status_code=500, detail=f"Ошибка БД: {str(e)}")
+
+# ===== Read-your-writes =====
+READ_PRIMARY_COOKIE = 'read_primary_until'
+
+async def read_your_writes(request: Request, call_next):
+    """Чтения с primary для клиента, который только что писал.
+
+    Успешная запись ставит cookie read_primary_until (unix-время), и до этого
+    момента чтения клиента минуют реплики. Клиенты без cookie могут попросить
+    того же заголовком X-Read-Your-Writes: 1.
+    """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        with open('/app/schema.sql', 'r') as f:
-            schema = f.read()
-        
-        cursor.execute(schema)
-        conn.commit()
-        cursor.close()
-        conn.close()
-        print("✓ База данных инициализирована")
-    except Exception as e:
-        print(f"✗ Ошибка инициализации БД: {e}")
+        until = float(request.cookies.get(READ_PRIMARY_COOKIE, 0))
+    except ValueError:
+        until = 0
+    if until > time.time() or request.headers.get('x-read-your-writes') == '1':
+        with db.read_from_primary():
+            response = await call_next(request)
+    else:
+        response = await call_next(request)
+
+    if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+        seconds = settings.READ_YOUR_WRITES_SECONDS
+        response.set_cookie(READ_PRIMARY_COOKIE, f'{time.time() + seconds:.3f}',
+                            max_age=math.ceil(seconds), httponly=True, samesite='lax')
+    return response
+
+# Без реплик все запросы и так идут в primary
+if db.replicas.replicas:
+    app.middleware("http")(read_your_writes)
+
+# ===== Admission control =====
+def endpoint_class(method: str, path: str) -> Optional[str]:
+    """Класс лимитов admission.py для запроса; None — запрос не ограничивается"""
+    if path.startswith('/stats') or path == '/todos/search':
+        return 'stats'
+    if path.startswith(('/users', '/todos')):
+        return 'read' if method in ('GET', 'HEAD') else 'write'
+    # Пробы, метрики, /events и /export, /import (у них свой лимит) — без admission
+    return None
+
+def client_id(request: Request) -> Optional[str]:
+    """Ключ token bucket'а клиента; None — сервисный клиент (ADMISSION_SERVICE_TOKEN)"""
+    token = settings.ADMISSION_SERVICE_TOKEN
+    if token and hmac.compare_digest(request.headers.get('x-service-token', '').encode(), token.encode()):
+        return None
+    if settings.ADMISSION_TRUST_PROXY:
+        forwarded = request.headers.get('x-forwarded-for')
+        if forwarded:
+            return forwarded.rsplit(',', 1)[-1].strip()
+    return request.client.host if request.client else 'unknown'
+
+class AdmissionControl:
+    """ASGI-middleware: 429 для клиента сверх своего лимита, 503 при нехватке мест
+    под запросы класса.
+
+    Место освобождается, когда приложение закончило ответ целиком, в том
+    числе потоковый, или когда ответ прерван: отключение клиента отменяет
+    отправку тела, и finally срабатывает всё равно.
+    """
+
+    def __init__(self, app):
+        self.app = app
 
-init_schema()
+    async def __call__(self, scope, receive, send):
+        name = endpoint_class(scope['method'], scope['path']) if scope['type'] == 'http' else None
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+        limits = admission.classes[name]
+        try:
+            await limits.admit(client_id(Request(scope)))
+        except (admission.RateLimited, admission.Overloaded) as e:
+            status = 429 if isinstance(e, admission.RateLimited) else 503
+            response = JSONResponse({"detail": str(e)}, status_code=status,
+                                    headers={"Retry-After": str(e.retry_after)})
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limits.release()
+
+# Подключается последним, чтобы отклонять запросы раньше остальных middleware
+if settings.ADMISSION:
+    app.add_middleware(AdmissionControl)
 
 # ===== Main Endpoints =====
 @app.get("/")
-def read_root():
+async def read_root():
     """Главная страница с информацией об API"""
     return {
         "message": "FastAPI TODO API с управлением пользователями!",
@@ -90,151 +216,174 @@ def read_root():
         "redoc": "/redoc",
         "endpoints": {
             "users": {
-                "GET /users": "Получить всех пользователей",
+                "GET /users": "Получить всех пользователей (фильтр email)",
                 "POST /users": "Создать нового пользователя",
                 "GET /users/{id}": "Получить пользователя по ID",
             },
             "todos": {
-                "GET /todos": "Получить все задачи",
+                "GET /todos": "Получить задачи (limit, after, stream, include_archived)",
                 "POST /todos": "Создать новую задачу",
-                "GET /todos/{id}": "Получить задачу по ID",
+                "GET /todos/{id}": "Получить задачу по ID (include_archived)",
                 "PUT /todos/{id}": "Обновить задачу",
                 "DELETE /todos/{id}": "Удалить задачу",
+                "POST /todos/bulk": "Создать много задач за одну транзакцию",
+                "PATCH /todos/bulk": "Обновить много задач за одну транзакцию",
+                "DELETE /todos/bulk": "Удалить много задач за одну транзакцию",
+                "GET /todos/search": "Поиск задач по тексту (q, user_id, completed, limit, offset)",
+            },
+            "events": {
+                "GET /events": "Поток изменений users и todos (SSE, фильтр user_id)",
+            },
+            "transfer": {
+                "GET /export/{table}": "Выгрузить users или todos (вместе с архивом) целиком (format=csv|ndjson)",
+                "POST /import/{table}": "Загрузить файл в users или todos (format, on_conflict=skip|update)",
             },
             "stats": {
-                "GET /stats": "Статистика по задачам",
-                "GET /stats/users": "Статистика по пользователям",
+                "GET /stats": "Статистика по задачам (include_archived)",
+                "GET /stats/users": "Статистика по пользователям (include_archived)",
+                "GET /stats/timeseries": "Созданные и завершённые задачи по часам или дням (bucket, start, end, user_id)",
+            },
+            "probes": {
+                "GET /livez": "Процесс жив (без обращения к БД)",
+                "GET /readyz": "Готов принимать трафик: последняя фоновая проверка БД успешна",
+                "GET /health": "Состояние БД и пула соединений",
             }
         }
     }
 
+# Пробы не ходят в БД: они отдают результат фоновой проверки монитора
+@app.get("/livez")
+async def liveness():
+    """Процесс жив и обслуживает запросы"""
+    return {"status": "alive"}
+
+@app.get("/readyz")
+async def readiness():
+    """Готовность к трафику: 503, пока БД недоступна"""
+    status = monitor.status()
+    if not monitor.ready:
+        return JSONResponse({"status": "not ready", **status}, status_code=503)
+    return {"status": "ready", **status}
+
 @app.get("/health")
-def health_check():
+async def health_check():
     """Проверка здоровья приложения"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1")
-        cursor.close()
-        conn.close()
-        return {"status": "healthy", "database": "connected"}
-    except Exception as e:
-        return {"status": "unhealthy", "error": str(e)}
+    if not monitor.ready:
+        return {"status": "unhealthy", "error": monitor.status()["error"]}
+    return {"status": "healthy", **repository.status()}
+
+# ===== Cache =====
+async def cached(cache, key, loader):
+    """Запись по id из кэша процесса.
+
+    Промахи читаются с primary: значение с отстающей реплики пережило бы в
+    кэше запись, которая его уже сбросила. Клиент в режиме read-your-writes
+    кэш минует — так он видит свою запись, даже если событие о ней ещё не
+    дошло до этого воркера.
+    """
+    async def load():
+        with db.read_from_primary():
+            return await loader()
+    return await cache.get_or_load(key, load, refresh=db.reading_from_primary())
 
 # ===== User Endpoints =====
 @app.get("/users", response_model=List[User])
-def get_users():
-    """Получить всех пользователей"""
+async def get_users(email: Optional[str] = Query(None, description="Только пользователь с этим email")):
+    """Получить всех пользователей (или одного по email — пустой список, если его нет)"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        cursor.execute('SELECT id, name, email, created_at::text FROM users ORDER BY id')
-        users = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
-        
-        return [dict(user) for user in users]
+        if email is not None:
+            user = await repository.get_user_by_email(email)
+            return [user] if user else []
+        return RowsResponse(*await repository.list_users(), name='users')
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка БД: {str(e)}")
+        raise db_error(e)
 
 @app.post("/users", response_model=dict, status_code=201)
-def create_user(user: UserCreate):
+async def create_user(user: UserCreate):
     """Создать нового пользователя"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            'INSERT INTO users (name, email) VALUES (%s, %s) RETURNING id',
-            (user.name, user.email)
-        )
-        
-        user_id = cursor.fetchone()[0]
-        conn.commit()
-        cursor.close()
-        conn.close()
-        
+        user_id = await repository.create_user(user.name, user.email)
+
+        users_cache.invalidate(user_id)
         return {
             "message": "Пользователь создан",
             "id": user_id,
             "name": user.name,
             "email": user.email
         }
-    except psycopg2.IntegrityError:
+    except IntegrityError:
         raise HTTPException(status_code=400, detail="Email уже существует")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка БД: {str(e)}")
+        raise db_error(e)
 
 @app.get("/users/{user_id}", response_model=User)
-def get_user(user_id: int):
-    """Получить пользователя по ID"""
+async def get_user(user_id: int, request: Request, response: Response):
+    """Получить пользователя по ID (из кэша; ETag и If-None-Match → 304)"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        cursor.execute('SELECT id, name, email, created_at::text FROM users WHERE id = %s', (user_id,))
-        user = cursor.fetchone()
-        
-        cursor.close()
-        conn.close()
-        
+        user = await cached(users_cache, user_id, lambda: repository.get_user(user_id))
+
         if not user:
             raise HTTPException(status_code=404, detail="Пользователь не найден")
-        
-        return dict(user)
+
+        return conditional(request, response, user)
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка БД: {str(e)}")
+        raise db_error(e)
+
+# ===== Pagination =====
+PageLimit = Query(settings.PAGE_SIZE_DEFAULT, ge=1, le=settings.PAGE_SIZE_MAX,
+                  description="Размер страницы")
+PageAfter = Query(None, description="Курсор из заголовка X-Next-Cursor предыдущей страницы")
+StreamFlag = Query(False, description="Отдать все задачи потоком NDJSON без пагинации")
+ArchivedFlag = Query(False, description="Включить завершённые задачи из архива (todos_archive)")
+
+async def todos_page(limit: int, after: Optional[str], stream: bool,
+                     user_id: Optional[int] = None, include_archived: bool = False):
+    """Страница задач (keyset по created_at, id) или поток NDJSON"""
+    try:
+        if stream:
+            return await ndjson_response(repository.stream_todos(after, user_id, include_archived))
+
+        columns, todos = await repository.list_todos(limit, after, user_id, include_archived)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Непустая страница уже доказывает, что пользователь есть
+    if not todos and user_id is not None and not await repository.user_exists(user_id):
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+
+    headers = {}
+    if len(todos) == limit:
+        headers['X-Next-Cursor'] = encode_cursor(dict(zip(columns, todos[-1])))
+    return RowsResponse(columns, todos, headers=headers, name='todos')
 
 # ===== Todo Endpoints =====
 @app.get("/todos", response_model=List[Todo])
-def get_todos():
-    """Получить все задачи"""
+async def get_todos(limit: int = PageLimit, after: Optional[str] = PageAfter,
+                    stream: bool = StreamFlag, include_archived: bool = ArchivedFlag):
+    """Получить задачи постранично, от новых к старым"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        cursor.execute('''
-            SELECT id, user_id, task, completed, created_at::text 
-            FROM todos 
-            ORDER BY created_at DESC
-        ''')
-        todos = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
-        
-        return [dict(todo) for todo in todos]
+        return await todos_page(limit, after, stream, include_archived=include_archived)
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка БД: {str(e)}")
+        raise db_error(e)
 
 @app.post("/todos", response_model=dict, status_code=201)
-def create_todo(todo: TodoCreate):
+async def create_todo(todo: TodoCreate):
     """Создать новую задачу"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Проверка существования пользователя
-        cursor.execute('SELECT id FROM users WHERE id = %s', (todo.user_id,))
-        if not cursor.fetchone():
-            cursor.close()
-            conn.close()
+        item = (todo.user_id, todo.task, todo.completed)
+        if todo_batcher.running:
+            # Ответ — после фиксации пачки, в которую попала задача
+            todo_id = await todo_batcher.submit(item)
+        else:
+            # Несуществующего пользователя отсекает внешний ключ, без отдельного SELECT
+            todo_id = await repository.create_todo(*item)
+        if todo_id is None:
             raise HTTPException(status_code=404, detail="Пользователь не найден")
-        
-        cursor.execute(
-            'INSERT INTO todos (user_id, task, completed, created_at) VALUES (%s, %s, %s, %s) RETURNING id',
-            (todo.user_id, todo.task, todo.completed, datetime.now())
-        )
-        
-        todo_id = cursor.fetchone()[0]
-        conn.commit()
-        cursor.close()
-        conn.close()
-        
+
         return {
             "message": "Задача добавлена",
             "id": todo_id,
@@ -243,57 +392,168 @@ def create_todo(todo: TodoCreate):
         }
     except HTTPException:
         raise
+    except QueueFull:
+        raise HTTPException(status_code=503, detail="Очередь записи переполнена, повторите запрос позже",
+                            headers={"Retry-After": "1"})
+    except Exception as e:
+        raise db_error(e)
+
+# ===== Bulk Endpoints =====
+def check_bulk_size(items: list):
+    if not items:
+        raise HTTPException(status_code=400, detail="Пустой список")
+    if len(items) > settings.BULK_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Не больше {settings.BULK_MAX_ITEMS} элементов за запрос"
+        )
+
+def mark_duplicates(results: List[dict]) -> List[int]:
+    """Пометить ошибкой повторы id в запросе; индексы первых вхождений"""
+    seen = set()
+    valid = []
+    for i, result in enumerate(results):
+        if result["id"] in seen:
+            result["error"] = "Задача повторяется в запросе"
+        else:
+            seen.add(result["id"])
+            valid.append(i)
+    return valid
+
+def bulk_result(message: str, results: List[dict]) -> dict:
+    failed = sum(1 for result in results if result.get('error'))
+    return {
+        "message": message,
+        "succeeded": len(results) - failed,
+        "failed": failed,
+        "results": results,
+    }
+
+@app.post("/todos/bulk", response_model=BulkResult)
+async def create_todos_bulk(todos: List[TodoCreate]):
+    """Создать много задач одним многострочным INSERT; если БД отвергла
+    пачку — по одной, с ошибкой у отвергнутых задач"""
+    check_bulk_size(todos)
+    items = [(todo.user_id, todo.task, todo.completed) for todo in todos]
+    errors = {}
+    try:
+        ids = await repository.create_todos(items)
+    except db.UNAVAILABLE as e:
+        raise db_error(e)
+    except Exception:
+        # Одна задача, которую БД не принимает, не должна отменять остальные:
+        # как WriteBatcher, пишем по одной, ошибку получает только она
+        ids = []
+        for i, item in enumerate(items):
+            try:
+                ids += await repository.create_todos([item])
+            except db.UNAVAILABLE as e:
+                raise db_error(e)
+            except Exception as e:
+                ids.append(None)
+                errors[i] = f"Задача не записана: {str(e).strip() or type(e).__name__}"
+
+    results = []
+    for i, todo_id in enumerate(ids):
+        if i in errors:
+            results.append({"index": i, "error": errors[i]})
+        elif todo_id is None:
+            results.append({"index": i, "error": "Пользователь не найден"})
+        else:
+            results.append({"index": i, "id": todo_id})
+    return bulk_result("Задачи добавлены", results)
+
+@app.patch("/todos/bulk", response_model=BulkResult)
+async def update_todos_bulk(todos: List[TodoPatch]):
+    """Обновить много задач одним UPDATE (не переданные поля не меняются)"""
+    check_bulk_size(todos)
+    results = [{"index": i, "id": todo.id} for i, todo in enumerate(todos)]
+    valid = mark_duplicates(results)
+
+    try:
+        updated = await repository.update_todos(
+            [(todos[i].id, todos[i].task, todos[i].completed) for i in valid]
+        )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка БД: {str(e)}")
+        raise db_error(e)
+    todos_cache.invalidate(*updated)
+
+    for i in valid:
+        if todos[i].id not in updated:
+            results[i]["error"] = "Задача не найдена"
+    return bulk_result("Задачи обновлены", results)
+
+@app.delete("/todos/bulk", response_model=BulkResult)
+async def delete_todos_bulk(ids: List[int] = Body(...)):
+    """Удалить много задач одним DELETE"""
+    check_bulk_size(ids)
+    results = [{"index": i, "id": todo_id} for i, todo_id in enumerate(ids)]
+    valid = mark_duplicates(results)
+    try:
+        deleted = await repository.delete_todos({ids[i] for i in valid})
+    except Exception as e:
+        raise db_error(e)
+    todos_cache.invalidate(*deleted)
+
+    for i in valid:
+        if ids[i] not in deleted:
+            results[i]["error"] = "Задача не найдена"
+    return bulk_result("Задачи удалены", results)
+
+# ===== Search =====
+@app.get("/todos/search", response_model=List[TodoSearchResult])
+async def search_todos(q: str = Query(..., min_length=1, max_length=200, description="Слова или подстрока"),
+                       user_id: Optional[int] = None, completed: Optional[bool] = None,
+                       limit: int = Query(settings.SEARCH_LIMIT_DEFAULT, ge=1, le=settings.PAGE_SIZE_MAX),
+                       offset: int = Query(0, ge=0, le=settings.SEARCH_MAX_RESULTS)):
+    """Найти задачи по тексту, самые релевантные первыми (следующая страница — X-Next-Offset).
+
+    Ранжируются все совпадения, поэтому время ответа растёт с их числом: запрос
+    из частых слов дороже редкого. Листать можно в пределах первых
+    SEARCH_MAX_RESULTS результатов.
+    """
+    q = q.strip()
+    if not q:
+        raise HTTPException(status_code=400, detail="Пустой поисковый запрос")
+    try:
+        columns, todos = await repository.search_todos(q, limit, offset, user_id, completed)
+    except Exception as e:
+        raise db_error(e)
+
+    headers = {}
+    if len(todos) == limit and offset + limit < settings.SEARCH_MAX_RESULTS:
+        headers['X-Next-Offset'] = str(offset + limit)
+    return RowsResponse(columns, todos, headers=headers, name='todos_search')
 
 @app.get("/todos/{todo_id}", response_model=Todo)
-def get_todo(todo_id: int):
-    """Получить задачу по ID"""
+async def get_todo(todo_id: int, request: Request, response: Response,
+                   include_archived: bool = ArchivedFlag):
+    """Получить задачу по ID (из кэша; ETag и If-None-Match → 304)"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        cursor.execute('''
-            SELECT id, user_id, task, completed, created_at::text 
-            FROM todos 
-            WHERE id = %s
-        ''', (todo_id,))
-        todo = cursor.fetchone()
-        
-        cursor.close()
-        conn.close()
-        
+        todo = await cached(todos_cache, todo_id, lambda: repository.get_todo(todo_id))
+        # Архивную задачу не кладём в кэш: иначе её отдал бы и запрос без include_archived
+        if not todo and include_archived:
+            archived = await repository.get_archived_todo(todo_id)
+            if archived:
+                todo = CacheEntry(archived, make_etag(archived), 0)
+
         if not todo:
             raise HTTPException(status_code=404, detail="Задача не найдена")
-        
-        return dict(todo)
+
+        return conditional(request, response, todo)
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка БД: {str(e)}")
+        raise db_error(e)
 
 @app.put("/todos/{todo_id}", response_model=dict)
-def update_todo(todo_id: int, todo: TodoUpdate):
+async def update_todo(todo_id: int, todo: TodoUpdate):
     """Обновить задачу"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT id FROM todos WHERE id = %s', (todo_id,))
-        if not cursor.fetchone():
-            cursor.close()
-            conn.close()
+        if not await repository.update_todo(todo_id, todo.task, todo.completed):
             raise HTTPException(status_code=404, detail="Задача не найдена")
-        
-        cursor.execute(
-            'UPDATE todos SET task = %s, completed = %s WHERE id = %s',
-            (todo.task, todo.completed, todo_id)
-        )
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
-        
+        todos_cache.invalidate(todo_id)
+
         return {
             "message": "Задача обновлена",
             "id": todo_id,
@@ -303,122 +563,180 @@ def update_todo(todo_id: int, todo: TodoUpdate):
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка БД: {str(e)}")
+        raise db_error(e)
 
 @app.delete("/todos/{todo_id}", response_model=dict)
-def delete_todo(todo_id: int):
+async def delete_todo(todo_id: int):
     """Удалить задачу"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT task FROM todos WHERE id = %s', (todo_id,))
-        result = cursor.fetchone()
-        if not result:
-            cursor.close()
-            conn.close()
+        task = await repository.delete_todo(todo_id)
+        if task is None:
             raise HTTPException(status_code=404, detail="Задача не найдена")
-        
-        task_name = result[0]
-        
-        cursor.execute('DELETE FROM todos WHERE id = %s', (todo_id,))
-        conn.commit()
-        cursor.close()
-        conn.close()
-        
+        todos_cache.invalidate(todo_id)
+
         return {
             "message": "Задача удалена",
             "id": todo_id,
-            "task": task_name
+            "task": task
         }
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка БД: {str(e)}")
+        raise db_error(e)
 
-@app.get("/todos/user/{user_id}")
-def get_user_todos(user_id: int):
-    """Получить все задачи пользователя"""
+@app.get("/todos/user/{user_id}", response_model=List[Todo])
+async def get_user_todos(user_id: int, limit: int = PageLimit,
+                         after: Optional[str] = PageAfter, stream: bool = StreamFlag,
+                         include_archived: bool = ArchivedFlag):
+    """Получить задачи пользователя постранично, от новых к старым"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Проверка существования пользователя
-        cursor.execute('SELECT id FROM users WHERE id = %s', (user_id,))
-        if not cursor.fetchone():
-            cursor.close()
-            conn.close()
+        # Поток начинается до первой строки, поэтому пользователя проверяем заранее
+        if stream and not await repository.user_exists(user_id):
             raise HTTPException(status_code=404, detail="Пользователь не найден")
-        
-        cursor.execute('''
-            SELECT id, user_id, task, completed, created_at::text 
-            FROM todos 
-            WHERE user_id = %s
-            ORDER BY created_at DESC
-        ''', (user_id,))
-        todos = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
-        
-        return [dict(todo) for todo in todos]
+
+        return await todos_page(limit, after, stream, user_id, include_archived)
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка БД: {str(e)}")
+        raise db_error(e)
+
+# ===== Events =====
+@app.get("/events")
+async def change_events(user_id: Optional[int] = None):
+    """Изменения users и todos в реальном времени (text/event-stream).
+
+    События: todo.created, todo.updated, todo.deleted, todo.bulk, user.created,
+    import, archive и resync — после resync стоит перечитать данные: часть событий
+    могла потеряться.
+    """
+    subscription = event_hub.subscribe(user_id)
+    return StreamingResponse(events.stream(event_hub, subscription), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# ===== Export / Import =====
+TransferTable = Literal['users', 'todos']
+TransferFormat = Literal['csv', 'ndjson']
+
+# У каждой выгрузки и загрузки своё соединение вне пула
+transfer_slots = asyncio.Semaphore(settings.TRANSFER_MAX_CONCURRENT)
+
+def transfer_unavailable() -> HTTPException:
+    return HTTPException(status_code=501, detail="Выгрузка и загрузка через COPY есть только у хранилища postgres")
+
+def transfer_busy() -> HTTPException:
+    return HTTPException(status_code=503, detail="Слишком много выгрузок и загрузок, повторите позже",
+                         headers={"Retry-After": "5"})
+
+@app.get("/export/{table}")
+async def export_table(table: TransferTable, format: TransferFormat = 'csv'):
+    """Выгрузить таблицу целиком потоком из COPY TO STDOUT"""
+    if not POSTGRES:
+        raise transfer_unavailable()
+    if transfer_slots.locked():
+        raise transfer_busy()
+    await transfer_slots.acquire()
+    chunks = transfer.export_chunks(table, format)
+    # Первый кусок читается до заголовков: ошибка БД станет обычной HTTP-ошибкой
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = b''
+    except Exception as e:
+        transfer_slots.release()
+        raise db_error(e)
+
+    async def body():
+        try:
+            yield first
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            await chunks.aclose()
+            transfer_slots.release()
+
+    return StreamingResponse(body(), media_type=transfer.MEDIA_TYPES[format], headers={
+        "Content-Disposition": f'attachment; filename="{table}.{format}"',
+    })
+
+@app.post("/import/{table}")
+async def import_table(table: TransferTable, request: Request, format: TransferFormat = 'csv',
+                       on_conflict: Literal['skip', 'update'] = 'skip'):
+    """Загрузить файл из тела запроса через COPY FROM STDIN и временную таблицу.
+
+    CSV — с заголовком из имён колонок; NDJSON — объект на строку.
+    Отсутствующие id и created_at заполняются как при обычной вставке.
+    """
+    if not POSTGRES:
+        raise transfer_unavailable()
+    if transfer_slots.locked():
+        raise transfer_busy()
+    try:
+        async with transfer_slots:
+            result = await transfer.import_stream(table, format, request.stream(), on_conflict)
+    except transfer.InvalidData as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except IntegrityError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise db_error(e)
+
+    # Загрузка могла изменить любые строки
+    users_cache.clear()
+    todos_cache.clear()
+    return {"message": "Данные загружены", "table": table, **result}
 
 # ===== Stats Endpoints =====
 @app.get("/stats")
-def get_stats():
-    """Статистика по задачам"""
+async def get_stats(include_archived: bool = ArchivedFlag):
+    """Статистика по задачам (из счётчиков user_todo_stats)"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        cursor.execute('''
-            SELECT 
-                COUNT(*) as total,
-                SUM(CASE WHEN completed = true THEN 1 ELSE 0 END) as completed,
-                SUM(CASE WHEN completed = false THEN 1 ELSE 0 END) as pending
-            FROM todos
-        ''')
-        
-        stats = cursor.fetchone()
-        cursor.close()
-        conn.close()
-        
-        return dict(stats)
+        return await repository.get_stats(include_archived)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка БД: {str(e)}")
+        raise db_error(e)
 
 @app.get("/stats/users")
-def get_users_stats():
-    """Статистика по пользователям и их задачам"""
+async def get_users_stats(include_archived: bool = ArchivedFlag):
+    """Статистика по пользователям и их задачам (из счётчиков user_todo_stats)"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        cursor.execute('''
-            SELECT 
-                u.id,
-                u.name,
-                u.email,
-                COUNT(t.id) as total_todos,
-                SUM(CASE WHEN t.completed = true THEN 1 ELSE 0 END) as completed_todos,
-                SUM(CASE WHEN t.completed = false THEN 1 ELSE 0 END) as pending_todos
-            FROM users u
-            LEFT JOIN todos t ON u.id = t.user_id
-            GROUP BY u.id, u.name, u.email
-            ORDER BY u.id
-        ''')
-        
-        stats = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        
-        return [dict(stat) for stat in stats]
+        return RowsResponse(*await repository.get_users_stats(include_archived), name='users_stats')
+    except Exception as e:
+        raise db_error(e)
+
+def local_time(moment):
+    """Дата — в полночь, время с часовым поясом — в локальное без пояса, как created_at в БД"""
+    if not isinstance(moment, datetime):
+        return datetime.combine(moment, datetime.min.time())
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    return moment
+
+@app.get("/stats/timeseries")
+async def get_stats_timeseries(bucket: Literal['hour', 'day'] = 'day',
+                               start: Optional[Union[datetime, date]] = Query(None, description="По умолчанию — за STATS_TIMESERIES_DEFAULT_BUCKETS интервалов до end"),
+                               end: Optional[Union[datetime, date]] = Query(None, description="По умолчанию — сейчас"),
+                               user_id: Optional[int] = None):
+    """Созданные и завершённые задачи по часам или дням, от start до end включительно
+    (из сводок todo_rollup_*): время ответа зависит от числа интервалов, а не от
+    числа задач. Удаление и архивация задач историю не меняют."""
+    step = BUCKETS[bucket]
+    end = bucket_start(local_time(end) if end else datetime.now(), bucket)
+    start = bucket_start(local_time(start), bucket) if start else end - step * (settings.STATS_TIMESERIES_DEFAULT_BUCKETS - 1)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start позже end")
+    if (end - start) // step + 1 > settings.STATS_TIMESERIES_MAX_BUCKETS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Не больше {settings.STATS_TIMESERIES_MAX_BUCKETS} интервалов за запрос"
+        )
+    try:
+        if user_id is not None and not await repository.user_exists(user_id):
+            raise HTTPException(status_code=404, detail="Пользователь не найден")
+        columns, rows = await repository.get_timeseries(bucket, start, end, user_id)
+        return RowsResponse(columns, rows, name='stats_timeseries')
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка БД: {str(e)}")
+        raise db_error(e)
 
 if __name__ == '__main__':
     import uvicorn
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import time
+
+from prometheus_client import Counter, Gauge, Histogram
+
+import settings
+
+# ===== Metrics =====
+BATCH_SIZE = Histogram(
+    'write_batch_size', 'Записей в одной пачке', ['batcher'],
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+BATCH_SECONDS = Histogram(
+    'write_batch_flush_seconds', 'Время записи одной пачки', ['batcher'],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+BATCH_QUEUE = Gauge(
+    'write_batch_queue', 'Записи, ожидающие отправки в БД', ['batcher'],
+    multiprocess_mode='livesum'
+)
+BATCH_REJECTED = Counter(
+    'write_batch_rejected_total', 'Записи, отклонённые из-за переполненной очереди', ['batcher']
+)
+
+log = logging.getLogger('batching')
+
+
+class QueueFull(Exception):
+    """Очередь записи переполнена: клиенту стоит повторить запрос позже"""
+
+
+class WriteBatcher:
+    """Write-behind: одиночные записи копятся в очереди и уходят в БД пачками.
+
+    flush(items) получает список элементов и возвращает список результатов
+    той же длины. Пачка отправляется через max_delay секунд после первого
+    элемента или сразу, если в очереди уже есть max_size. Пока пачка пишется,
+    копится следующая, так что под нагрузкой пачки растут сами. Каждый
+    submit() ждёт своего результата, то есть фиксации своей пачки.
+
+    Если пачка не записалась, её элементы пишутся по одному: ошибку получает
+    только тот, чья запись её вызвала. Исключения из fatal (БД недоступна)
+    сразу достаются всей пачке — повторы лишь умножили бы ожидание.
+    """
+
+    def __init__(self, name, flush, max_size=settings.WRITE_BATCH_MAX_SIZE,
+                 max_delay=settings.WRITE_BATCH_MAX_DELAY, max_queue=settings.WRITE_BATCH_QUEUE_SIZE,
+                 fatal=()):
+        self.name = name
+        self.flush = flush
+        self.fatal = fatal
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.max_queue = max_queue
+        self._queue = None
+        self._task = None
+
+        self._size_hist = BATCH_SIZE.labels(name)
+        self._flush_hist = BATCH_SECONDS.labels(name)
+        self._queued = BATCH_QUEUE.labels(name)
+        self._rejected = BATCH_REJECTED.labels(name)
+
+    @property
+    def running(self):
+        return self._task is not None
+
+    def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue(self.max_queue)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Дописать то, что уже в очереди, и остановиться"""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, item):
+        """Результат flush() для item; QueueFull, если очередь заполнена"""
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((item, future))
+        except asyncio.QueueFull:
+            self._rejected.inc()
+            raise QueueFull(f"Очередь {self.name} заполнена ({self.max_queue})")
+        self._queued.inc()
+        # shield: отменённый запрос не отменяет запись, она уже в очереди
+        return await asyncio.shield(future)
+
+    def _drain(self, batch):
+        """Добрать в пачку то, что уже лежит в очереди; True — встречен сигнал остановки"""
+        while len(batch) < self.max_size and not self._queue.empty():
+            entry = self._queue.get_nowait()
+            if entry is None:
+                return True
+            batch.append(entry)
+        return False
+
+    async def _collect(self, first):
+        batch = [first]
+        if self._drain(batch):
+            return batch, True
+        if len(batch) < self.max_size and self.max_delay > 0:
+            await asyncio.sleep(self.max_delay)
+            return batch, self._drain(batch)
+        return batch, False
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is None:
+                break
+            batch, stopping = await self._collect(first)
+            await self._write(batch)
+        # Остаток очереди после сигнала остановки — теми же пачками
+        rest = []
+        while not self._queue.empty():
+            entry = self._queue.get_nowait()
+            if entry is not None:
+                rest.append(entry)
+        for start in range(0, len(rest), self.max_size):
+            await self._write(rest[start:start + self.max_size])
+
+    async def _write(self, batch):
+        self._queued.dec(len(batch))
+        self._size_hist.observe(len(batch))
+        started = time.perf_counter()
+        try:
+            results = await self.flush([item for item, _ in batch])
+        except Exception as e:
+            if len(batch) > 1 and not isinstance(e, self.fatal):
+                log.warning("Пачка %s из %d записей не записана, пишем по одной: %s",
+                            self.name, len(batch), e)
+                for entry in batch:
+                    await self._write_one(entry)
+                return
+            log.warning("Пачка %s из %d записей не записана: %s", self.name, len(batch), e)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._flush_hist.observe(time.perf_counter() - started)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def _write_one(self, entry):
+        item, future = entry
+        try:
+            result = (await self.flush([item]))[0]
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(result)
@@ -0,0 +1,307 @@
+"""Нагрузочный тест API: наполнение БД, проигрывание трассы запросов, сравнение прогонов.
+
+    python bench/loadtest.py seed --users 100 --todos 100000
+    python bench/loadtest.py run --trace bench/trace.jsonl --concurrency 32 \\
+        --duration 30 --out results/new.json
+    python bench/loadtest.py compare results/base.json results/new.json
+
+Трасса — JSONL, по запросу в строке:
+    {"method": "GET", "path": "/todos/{todo_id}", "weight": 5}
+    {"method": "POST", "path": "/todos", "json": {"user_id": "{user_id}", "task": "bench"}}
+Необязательные поля: name (как подписать эндпоинт в отчёте, по умолчанию
+"METHOD путь-без-query"), weight (сколько раз строка входит в смесь, 1),
+json (тело запроса). {user_id} и {todo_id} в пути и теле заменяются
+случайными существующими id. Строки трассы выполняются по кругу в своём
+порядке, пока не истечёт --duration или не наберётся --requests.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PLACEHOLDERS = ('{user_id}', '{todo_id}')
+
+
+# ===== Seed =====
+def cmd_seed(args):
+    from manage import connect
+
+    conn = connect(args.wait)
+    try:
+        with conn:
+            with conn.cursor() as cursor:
+                if args.truncate:
+                    # Архив ссылается на users, сводки — история удалённых задач
+                    cursor.execute('''
+                        TRUNCATE todos, todos_archive, users, todo_rollup_hourly, todo_rollup_daily
+                        RESTART IDENTITY
+                    ''')
+                    cursor.execute('DELETE FROM user_todo_stats')
+                cursor.execute('''
+                    INSERT INTO users (name, email)
+                    SELECT 'Bench user ' || n, 'bench-' || n || '@example.com'
+                    FROM generate_series(1, %s) AS n
+                    ON CONFLICT (email) DO NOTHING
+                ''', (args.users,))
+                cursor.execute(
+                    "SELECT array_agg(id) FROM users WHERE email LIKE 'bench-%%@example.com'"
+                )
+                user_ids = cursor.fetchone()[0]
+                # Задачи распределены по времени, чтобы keyset-страницы были разными
+                cursor.execute('''
+                    INSERT INTO todos (user_id, task, completed, created_at)
+                    SELECT (%(users)s::int[])[1 + n %% cardinality(%(users)s::int[])],
+                           'Bench task ' || n,
+                           n %% 3 = 0,
+                           now() - n * interval '1 second'
+                    FROM generate_series(1, %(todos)s) AS n
+                ''', {'users': user_ids, 'todos': args.todos})
+        print(f"✓ Пользователей: {len(user_ids)}, добавлено задач: {args.todos}")
+    finally:
+        conn.close()
+
+
+# ===== Trace =====
+def load_trace(path):
+    entries = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            entry = json.loads(line)
+            if 'method' not in entry or 'path' not in entry:
+                raise ValueError(f"{path}:{number}: нужны поля method и path")
+            entry['method'] = entry['method'].upper()
+            entry.setdefault('name', f"{entry['method']} {entry['path'].split('?')[0]}")
+            entries.extend([entry] * int(entry.get('weight', 1)))
+    if not entries:
+        raise ValueError(f"{path}: пустая трасса")
+    return entries
+
+
+def fill(value, ids):
+    """Подставить случайные id вместо {user_id}/{todo_id} в строках и телах"""
+    if isinstance(value, str):
+        if value in PLACEHOLDERS:
+            return random.choice(ids[value])
+        for placeholder in PLACEHOLDERS:
+            while placeholder in value:
+                value = value.replace(placeholder, str(random.choice(ids[placeholder])), 1)
+        return value
+    if isinstance(value, dict):
+        return {k: fill(v, ids) for k, v in value.items()}
+    if isinstance(value, list):
+        return [fill(v, ids) for v in value]
+    return value
+
+
+async def known_ids(session):
+    """Существующие id пользователей и задач, чтобы запросы попадали в данные"""
+    async with session.get('/users') as resp:
+        users = [user['id'] for user in await resp.json()]
+    async with session.get('/todos', params={'limit': 1000}) as resp:
+        todos = [todo['id'] for todo in await resp.json()]
+    if not users or not todos:
+        raise RuntimeError("В БД нет пользователей или задач: сначала выполните seed")
+    return {'{user_id}': users, '{todo_id}': todos}
+
+
+# ===== Run =====
+async def worker(session, requests, deadline, samples, ids):
+    for entry in requests:
+        if deadline is not None and time.monotonic() >= deadline:
+            return
+        path = fill(entry['path'], ids)
+        body = fill(entry.get('json'), ids)
+        started = time.perf_counter()
+        try:
+            async with session.request(entry['method'], path, json=body) as resp:
+                await resp.read()
+                status = resp.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            status = type(e).__name__
+        samples[entry['name']].append((time.perf_counter() - started, status))
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def succeeded(status):
+    return isinstance(status, int) and status < 400
+
+
+def summarize(latencies_and_statuses, elapsed):
+    """Сводка по эндпоинту. rps и задержки — только по успешным (2xx/3xx)
+    ответам: быстрые 429 и 503 от admission control иначе выглядели бы
+    ускорением. Ошибкой считается любой другой ответ или исключение,
+    throttled — сколько из них 429."""
+    latencies = sorted(latency for latency, status in latencies_and_statuses if succeeded(status))
+    statuses = Counter(str(status) for _, status in latencies_and_statuses)
+    ms = lambda value: round(value * 1000, 2) if value is not None else None
+    return {
+        'count': len(latencies_and_statuses),
+        'errors': len(latencies_and_statuses) - len(latencies),
+        'throttled': statuses.get('429', 0),
+        'rps': round(len(latencies) / elapsed, 1),
+        'mean_ms': ms(sum(latencies) / len(latencies)) if latencies else None,
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p95_ms': ms(percentile(latencies, 95)),
+        'p99_ms': ms(percentile(latencies, 99)),
+        'max_ms': ms(latencies[-1]) if latencies else None,
+        'statuses': dict(statuses),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args):
+    trace = load_trace(args.trace)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(args.url, connector=connector, timeout=timeout) as session:
+        ids = await known_ids(session)
+        cycle = itertools.cycle(trace)
+        if args.requests:
+            cycle = itertools.islice(cycle, args.requests)
+        deadline = None if args.requests else time.monotonic() + args.duration
+
+        samples = defaultdict(list)
+        started = time.perf_counter()
+        # Итератор общий: каждый воркер берёт следующую строку трассы
+        await asyncio.gather(*(
+            worker(session, cycle, deadline, samples, ids) for _ in range(args.concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+
+    return {
+        'meta': {
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'url': args.url,
+            'trace': args.trace,
+            'concurrency': args.concurrency,
+            'elapsed_s': round(elapsed, 2),
+            'commit': git_commit(),
+        },
+        'total': summarize([s for values in samples.values() for s in values], elapsed),
+        'endpoints': {name: summarize(values, elapsed) for name, values in sorted(samples.items())},
+    }
+
+
+def print_report(result):
+    header = (f"{'endpoint':<32} {'count':>7} {'err':>5} {'429':>5} {'rps':>8} "
+              f"{'p50':>8} {'p95':>8} {'p99':>8}")
+    print(header)
+    print('-' * len(header))
+    rows = list(result['endpoints'].items()) + [('TOTAL', result['total'])]
+    for name, s in rows:
+        print(f"{name:<32} {s['count']:>7} {s['errors']:>5} {s['throttled']:>5} {s['rps']:>8} "
+              f"{str(s['p50_ms']):>8} {str(s['p95_ms']):>8} {str(s['p99_ms']):>8}")
+    if result['total']['throttled']:
+        print("✗ Часть запросов отклонена лимитами (429): для замеров поднимите ADMISSION_* "
+              "или выключите ADMISSION")
+
+
+def cmd_run(args):
+    result = asyncio.run(run(args))
+    print_report(result)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, 'w') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"✓ Результаты сохранены в {args.out}")
+    return 1 if result['total']['errors'] else 0
+
+
+# ===== Compare =====
+def cmd_compare(args):
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    regressions = 0
+    print(f"{'endpoint':<32} {'p95 base':>9} {'p95 new':>9} {'Δp95':>7} {'rps base':>9} {'rps new':>9} {'Δrps':>7}")
+    rows = [(name, base['endpoints'].get(name), stats) for name, stats in new['endpoints'].items()]
+    rows.append(('TOTAL', base['total'], new['total']))
+    for name, old, cur in rows:
+        if old is None or not old['p95_ms'] or not old['rps']:
+            print(f"{name:<32} {'—':>9} {str(cur['p95_ms']):>9}")
+            continue
+        if not cur['p95_ms'] or not cur['rps']:
+            regressions += 1
+            print(f"{name:<32} {old['p95_ms']:>9} {'—':>9} {'':>7} {old['rps']:>9} {cur['rps']:>9} {'':>7} ✗")
+            continue
+        d_p95 = (cur['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100
+        d_rps = (cur['rps'] - old['rps']) / old['rps'] * 100
+        # Доля ошибок выросла — быстрее стало не то, что измеряли
+        more_errors = cur['errors'] / max(cur['count'], 1) > old['errors'] / max(old['count'], 1)
+        bad = d_p95 > args.threshold or d_rps < -args.threshold or more_errors
+        regressions += bad
+        mark = "✗" if bad else " "
+        print(f"{name:<32} {old['p95_ms']:>9} {cur['p95_ms']:>9} {d_p95:>+6.1f}% "
+              f"{old['rps']:>9} {cur['rps']:>9} {d_rps:>+6.1f}% {mark}")
+
+    if regressions:
+        print(f"✗ Регрессий (порог {args.threshold}%): {regressions}")
+        return 1
+    print("✓ Регрессий нет")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('seed', help="наполнить БД пользователями и задачами")
+    p.add_argument('--users', type=int, default=100)
+    p.add_argument('--todos', type=int, default=100_000)
+    p.add_argument('--truncate', action='store_true',
+                   help="сначала очистить users, todos, архив и сводки")
+    p.add_argument('--wait', type=float, default=30, help="сколько секунд ждать доступности БД")
+    p.set_defaults(func=cmd_seed)
+
+    p = commands.add_parser('run', help="проиграть трассу запросов против API")
+    p.add_argument('--url', default=os.getenv('BENCH_URL', 'http://localhost:5000'))
+    p.add_argument('--trace', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'trace.jsonl'))
+    p.add_argument('--concurrency', type=int, default=32)
+    p.add_argument('--duration', type=float, default=30, help="длительность прогона, секунд")
+    p.add_argument('--requests', type=int, help="вместо --duration: сколько запросов сделать")
+    p.add_argument('--timeout', type=float, default=30, help="таймаут одного запроса, секунд")
+    p.add_argument('--out', help="куда сохранить результаты в JSON")
+    p.set_defaults(func=cmd_run)
+
+    p = commands.add_parser('compare', help="сравнить два сохранённых прогона")
+    p.add_argument('base')
+    p.add_argument('new')
+    p.add_argument('--threshold', type=float, default=10,
+                   help="регрессия: p95 вырос или rps упал больше чем на столько процентов")
+    p.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""Микробенчмарк сериализации списка задач: строк в секунду.
+
+    python bench/serialization.py [--rows 10000] [--repeat 20] [--db]
+
+before — путь FastAPI по умолчанию: dict-строки → валидация List[Todo]
+→ JSON-совместимые данные → json.dumps. after — RowsResponse: кортежи →
+dict(zip) → orjson. С --db строки читаются из таблицы todos (нужен
+DATABASE_URL), и в замер входит разбор строк драйвером.
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+from pydantic import TypeAdapter
+from psycopg2.extras import RealDictCursor
+
+import settings
+from app import Todo
+from serialization import RowsResponse
+
+COLUMNS = ['id', 'user_id', 'task', 'completed', 'created_at', 'completed_at']
+TODOS = TypeAdapter(List[Todo])
+
+
+def synthetic_rows(n):
+    created_at = str(datetime.now())
+    # Время завершения есть только у завершённых задач
+    return [(i, i % 100, f"Задача номер {i}", i % 3 == 0, created_at, created_at if i % 3 == 0 else None)
+            for i in range(n)]
+
+
+def before(dict_rows):
+    # Так FastAPI 0.104 обрабатывает возвращённый список при response_model
+    validated = TODOS.validate_python(dict_rows)
+    content = TODOS.dump_python(validated, mode='json')
+    return json.dumps(content, ensure_ascii=False, allow_nan=False,
+                      indent=None, separators=(',', ':')).encode()
+
+
+def after(columns, rows):
+    return RowsResponse(columns, rows).body
+
+
+def measure(label, fn, rows, repeat):
+    fn()  # прогрев
+    # Как timeit: полная сборка мусора, вызванная чужими объектами, не попадает в замер
+    gc.collect()
+    gc.disable()
+    try:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            body = fn()
+        elapsed = time.perf_counter() - started
+    finally:
+        gc.enable()
+    rate = rows * repeat / elapsed
+    print(f"{label:<8} {rate:>12,.0f} строк/с  ({elapsed / repeat * 1000:.1f} мс на {rows} строк, "
+          f"{len(body)} байт)")
+    return rate
+
+
+def from_db(limit):
+    query = ('SELECT id, user_id, task, completed, created_at::text, completed_at::text FROM todos '
+             'ORDER BY todos.created_at DESC, todos.id DESC LIMIT %s')
+    conn = psycopg2.connect(settings.DATABASE_URL)
+
+    def fetch_dicts():
+        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(query, (limit,))
+            return cursor.fetchall()
+
+    def fetch_tuples():
+        with conn.cursor() as cursor:
+            cursor.execute(query, (limit,))
+            return [column[0] for column in cursor.description], cursor.fetchall()
+
+    return fetch_dicts, fetch_tuples
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--db', action='store_true', help="читать строки из БД, а не генерировать")
+    args = parser.parse_args(argv)
+
+    if args.db:
+        fetch_dicts, fetch_tuples = from_db(args.rows)
+        rows = len(fetch_dicts())
+        before_fn = lambda: before(fetch_dicts())
+        after_fn = lambda: after(*fetch_tuples())
+    else:
+        tuples = synthetic_rows(args.rows)
+        dicts = [dict(zip(COLUMNS, row)) for row in tuples]
+        rows = args.rows
+        before_fn = lambda: before(dicts)
+        after_fn = lambda: after(COLUMNS, tuples)
+
+    if before_fn() != after_fn():
+        print("✗ Тела ответов отличаются")
+        return 1
+    slow = measure('before', before_fn, rows, args.repeat)
+    fast = measure('after', after_fn, rows, args.repeat)
+    print(f"✓ Ускорение: x{fast / slow:.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+
+import aiohttp
+
+from config import (
+    API_CONNECT_TIMEOUT, API_POOL_SIZE, API_RETRIES, API_RETRY_AFTER_MAX, API_RETRY_BACKOFF,
+    API_SERVICE_TOKEN, API_TIMEOUT, APP_URL,
+)
+
+logger = logging.getLogger(__name__)
+
+# Ответы, после которых GET имеет смысл повторить
+RETRY_STATUSES = {502, 503, 504}
+
+
+def retry_after(headers):
+    """Секунды из Retry-After или None (заголовка нет или в нём дата)"""
+    try:
+        return max(0.0, float(headers.get('Retry-After', '')))
+    except ValueError:
+        return None
+
+
+class ApiError(Exception):
+    """Ошибка обращения к TODO API (HTTP-статус >= 400 или сеть).
+
+    retry_after — секунды из заголовка Retry-After, если API его прислало.
+    """
+
+    def __init__(self, status, detail, retry_after=None):
+        super().__init__(f"{status}: {detail}")
+        self.status = status
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class ApiClient:
+    """Клиент TODO API, общий для всех обработчиков.
+
+    Одна aiohttp-сессия держит keep-alive соединения к APP_URL. GET-запросы
+    повторяются с экспоненциальной задержкой, а одинаковые GET, пришедшие
+    одновременно, выполняются одним запросом: все ждут один и тот же
+    результат, поэтому изменять его нельзя.
+
+    429 от admission control API означает, что запрос не выполнялся: он
+    повторяется любым методом через Retry-After секунд, если ждать не
+    дольше retry_after_max. service_token отправляется в X-Service-Token,
+    чтобы API не ограничивало бота лимитом одного клиента.
+    """
+
+    def __init__(self, base_url=APP_URL, timeout=API_TIMEOUT, connect_timeout=API_CONNECT_TIMEOUT,
+                 retries=API_RETRIES, backoff=API_RETRY_BACKOFF, pool_size=API_POOL_SIZE,
+                 retry_after_max=API_RETRY_AFTER_MAX, service_token=API_SERVICE_TOKEN):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.retry_after_max = retry_after_max
+        self.headers = {'X-Service-Token': service_token} if service_token else None
+        self._session = None
+        self._inflight = {}
+
+    async def start(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                self.base_url, connector=connector, timeout=self.timeout, headers=self.headers
+            )
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    # ===== Requests =====
+    async def get(self, path, **params):
+        """GET с повторами; одновременные одинаковые запросы объединяются"""
+        return await self._get(path, params, page=False)
+
+    async def get_page(self, path, **params):
+        """Страница списка и курсор следующей (X-Next-Cursor; None — страница последняя).
+
+        Параметры со значением None не передаются.
+        """
+        params = {name: value for name, value in params.items() if value is not None}
+        return await self._get(path, params, page=True)
+
+    async def _get(self, path, params, page):
+        key = (path, tuple(sorted(params.items())), page)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._get_with_retry(path, params, page))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Отмена одного ожидающего не должна отменять запрос остальным
+        return await asyncio.shield(task)
+
+    async def post(self, path, json=None):
+        return await self._request('POST', path, json=json)
+
+    async def put(self, path, json=None):
+        return await self._request('PUT', path, json=json)
+
+    async def patch(self, path, json=None):
+        return await self._request('PATCH', path, json=json)
+
+    async def delete(self, path, json=None):
+        return await self._request('DELETE', path, json=json)
+
+    async def _get_with_retry(self, path, params, page=False):
+        for attempt in range(self.retries + 1):
+            try:
+                return await self._request('GET', path, page=page, params=params or None)
+            except ApiError as e:
+                if e.status not in RETRY_STATUSES or attempt == self.retries:
+                    raise
+                delay = self.backoff * 2 ** attempt
+                logger.warning("GET %s: %s, повтор через %.1f с", path, e, delay)
+                await asyncio.sleep(delay)
+
+    async def _request(self, method, path, page=False, **kwargs):
+        for attempt in range(self.retries + 1):
+            try:
+                return await self._send(method, path, page, **kwargs)
+            except ApiError as e:
+                if (e.status != 429 or attempt == self.retries
+                        or e.retry_after is None or e.retry_after > self.retry_after_max):
+                    raise
+                logger.warning("%s %s: %s, повтор через %.1f с", method, path, e, e.retry_after)
+                await asyncio.sleep(e.retry_after)
+
+    async def _send(self, method, path, page=False, **kwargs):
+        if self._session is None:
+            raise RuntimeError("ApiClient не запущен: вызовите start()")
+        try:
+            async with self._session.request(method, path, **kwargs) as resp:
+                try:
+                    data = await resp.json(content_type=None)
+                except ValueError:
+                    # Например, HTML-страница ошибки от nginx
+                    data = None
+                if resp.status >= 400:
+                    detail = data.get('detail') if isinstance(data, dict) else resp.reason
+                    raise ApiError(resp.status, detail, retry_after(resp.headers))
+                if page:
+                    return data, resp.headers.get('X-Next-Cursor')
+                return data
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            # Для повторов сетевой сбой выглядит как 503
+            raise ApiError(503, f"API недоступно: {e.__class__.__name__}") from e
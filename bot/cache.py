@@ -0,0 +1,87 @@
+import time
+from collections import OrderedDict
+
+from api import ApiError
+from config import BOT_CACHE_MAX_CHATS, BOT_CACHE_MAX_USERS, BOT_PAGE_CACHE_TTL
+
+
+def bot_email(telegram_id):
+    """Email пользователя API, который соответствует Telegram-пользователю"""
+    return f"bot_{telegram_id}@example.com"
+
+
+class UserDirectory:
+    """Telegram-пользователь → id пользователя API.
+
+    Пользователь ищется через GET /users?email= и создаётся при первом
+    обращении. Пользователи API не удаляются, поэтому найденный id
+    кэшируется без срока (самые давние вытесняются сверх max_size).
+    """
+
+    def __init__(self, api, max_size=BOT_CACHE_MAX_USERS):
+        self.api = api
+        self.max_size = max_size
+        self._ids = OrderedDict()
+
+    async def resolve(self, telegram_user):
+        user_id = self._ids.get(telegram_user.id)
+        if user_id is None:
+            user_id = await self._find_or_create(telegram_user)
+            self._ids[telegram_user.id] = user_id
+            if len(self._ids) > self.max_size:
+                self._ids.popitem(last=False)
+        else:
+            self._ids.move_to_end(telegram_user.id)
+        return user_id
+
+    async def _find_or_create(self, telegram_user):
+        email = bot_email(telegram_user.id)
+        users = await self.api.get("/users", email=email)
+        if users:
+            return users[0]['id']
+        try:
+            result = await self.api.post("/users", json={
+                "name": telegram_user.full_name or f"Telegram {telegram_user.id}",
+                "email": email,
+            })
+        except ApiError as e:
+            # Другой обработчик (или реплика) успел создать его раньше
+            if e.status != 400:
+                raise
+            users = await self.api.get("/users", email=email)
+            if not users:
+                raise
+            return users[0]['id']
+        return result['id']
+
+
+class PageCache:
+    """Страницы задач по чатам: (чат, курсор) → (задачи, курсор следующей).
+
+    Страница живёт ttl секунд; invalidate(chat_id) сбрасывает все страницы
+    чата после изменения его задач. Помнится не больше max_chats чатов.
+    """
+
+    def __init__(self, ttl=BOT_PAGE_CACHE_TTL, max_chats=BOT_CACHE_MAX_CHATS):
+        self.ttl = ttl
+        self.max_chats = max_chats
+        self._chats = OrderedDict()
+
+    def get(self, chat_id, cursor):
+        """(задачи, курсор следующей) или None, если страницы нет или она устарела"""
+        pages = self._chats.get(chat_id)
+        entry = pages.get(cursor) if pages else None
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        self._chats.move_to_end(chat_id)
+        return entry[1], entry[2]
+
+    def put(self, chat_id, cursor, todos, next_cursor):
+        pages = self._chats.setdefault(chat_id, {})
+        pages[cursor] = (time.monotonic() + self.ttl, todos, next_cursor)
+        self._chats.move_to_end(chat_id)
+        if len(self._chats) > self.max_chats:
+            self._chats.popitem(last=False)
+
+    def invalidate(self, chat_id):
+        self._chats.pop(chat_id, None)
@@ -7,3 +7,60 @@ BOT_TOKEN = os.getenv('BOT_TOKEN')
 APP_HOST = os.getenv('APP_HOST', 'localhost')
 APP_PORT = int(os.getenv('APP_PORT', 5000))
 APP_URL = f"http://{APP_HOST}:{APP_PORT}"
+
+# ===== API client =====
+API_TIMEOUT = float(os.getenv('API_TIMEOUT', 10))
+API_CONNECT_TIMEOUT = float(os.getenv('API_CONNECT_TIMEOUT', 3))
+API_RETRIES = int(os.getenv('API_RETRIES', 2))
+API_RETRY_BACKOFF = float(os.getenv('API_RETRY_BACKOFF', 0.3))
+API_POOL_SIZE = int(os.getenv('API_POOL_SIZE', 20))
+# 429 повторяется через Retry-After секунд, если ждать не дольше стольких
+API_RETRY_AFTER_MAX = float(os.getenv('API_RETRY_AFTER_MAX', 5))
+# Совпадает с ADMISSION_SERVICE_TOKEN API: тогда бота не ограничивает лимит одного клиента
+API_SERVICE_TOKEN = os.getenv('API_SERVICE_TOKEN', '')
+
+# ===== Todo browsing =====
+# Задач на странице «Мои TODO»; страницы кэшируются по чатам на BOT_PAGE_CACHE_TTL
+# секунд и сбрасываются после добавления, завершения и удаления задач из бота
+BOT_PAGE_SIZE = int(os.getenv('BOT_PAGE_SIZE', 10))
+BOT_PAGE_CACHE_TTL = float(os.getenv('BOT_PAGE_CACHE_TTL', 60))
+# Сколько чатов помнят страницы и сколько Telegram-пользователей — своих пользователей API
+BOT_CACHE_MAX_CHATS = int(os.getenv('BOT_CACHE_MAX_CHATS', 10_000))
+BOT_CACHE_MAX_USERS = int(os.getenv('BOT_CACHE_MAX_USERS', 10_000))
+
+# ===== Serving mode =====
+# polling — один процесс опрашивает Telegram; webhook — Telegram сам присылает
+# обновления, и их могут обрабатывать несколько реплик за nginx
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_BASE_URL = os.getenv('WEBHOOK_BASE_URL', '')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/bot/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+WEB_HOST = os.getenv('WEB_HOST', '0.0.0.0')
+WEB_PORT = int(os.getenv('WEB_PORT', 8081))
+# Другой адрес Bot API, например локальный fake_telegram.py для тестов
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+
+# ===== FSM storage =====
+# memory — состояния в памяти процесса, годится для одной реплики в режиме polling;
+# postgres — общие для всех реплик и переживают рестарт, но боту нужна БД
+# (docker-compose включает postgres; несколько реплик webhook без него не работают)
+FSM_STORAGE = os.getenv('FSM_STORAGE', 'memory')
+FSM_DATABASE_URL = os.getenv(
+    'FSM_DATABASE_URL',
+    "postgresql://{user}:{password}@{host}:{port}/{name}".format(
+        user=os.getenv('POSTGRESQL_USER', 'admin'),
+        password=os.getenv('POSTGRESQL_PASSWORD', 'admin'),
+        host=os.getenv('POSTGRESQL_HOST', 'postgres'),
+        port=os.getenv('POSTGRESQL_PORT', 5432),
+        name=os.getenv('POSTGRESQL_NAME', 'myapp'),
+    )
+)
+FSM_POOL_SIZE = int(os.getenv('FSM_POOL_SIZE', 5))
+
+# ===== Change events =====
+# 1 — бот слушает поток GET /events и присылает изменения в чаты, подписанные командой /watch
+BOT_EVENTS = os.getenv('BOT_EVENTS', '1') == '1'
+# Telegram id администраторов через запятую: только в их личных чатах /watch
+# присылает изменения чужих задач (/watch 1) и всех пользователей (/watch all)
+BOT_ADMIN_IDS = frozenset(int(i) for i in os.getenv('BOT_ADMIN_IDS', '').split(',') if i.strip())
+EVENTS_RETRY_DELAY = float(os.getenv('EVENTS_RETRY_DELAY', 3))
@@ -0,0 +1,89 @@
+"""Локальная заглушка Telegram Bot API для тестов бота без интернета.
+
+    python fake_telegram.py            # слушает :8090
+    TELEGRAM_API_URL=http://localhost:8090 BOT_MODE=webhook \\
+        WEBHOOK_BASE_URL=http://localhost:8081 python main.py
+
+POST /push с JSON Update пересылает его на зарегистрированный webhook,
+GET /calls показывает, какие методы Bot API вызывал бот.
+"""
+import asyncio
+import itertools
+import os
+import time
+
+import aiohttp
+from aiohttp import web
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Fake TODO Bot", "username": "fake_todo_bot"}
+
+class FakeTelegram:
+    def __init__(self):
+        self.calls = []
+        self.webhook_url = ""
+        self.webhook_secret = None
+        self.message_ids = itertools.count(1)
+
+    def message(self, params):
+        return {
+            "message_id": int(params.get("message_id") or next(self.message_ids)),
+            "date": int(time.time()),
+            "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+            "from": BOT_USER,
+            "text": params.get("text", ""),
+        }
+
+    async def method(self, request):
+        name = request.match_info["method"]
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+        self.calls.append({"method": name, "params": params})
+
+        if name == "getMe":
+            result = BOT_USER
+        elif name == "getWebhookInfo":
+            result = {"url": self.webhook_url, "has_custom_certificate": False,
+                      "pending_update_count": 0}
+        elif name == "setWebhook":
+            self.webhook_url = params.get("url", "")
+            self.webhook_secret = params.get("secret_token")
+            result = True
+        elif name == "deleteWebhook":
+            self.webhook_url = ""
+            result = True
+        elif name == "getUpdates":
+            await asyncio.sleep(1)
+            result = []
+        elif name in ("sendMessage", "editMessageText"):
+            result = self.message(params)
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def push(self, request):
+        """Отправить Update на webhook так же, как это делает Telegram"""
+        if not self.webhook_url:
+            return web.json_response({"error": "webhook не зарегистрирован"}, status=409)
+        headers = {}
+        if self.webhook_secret:
+            headers["X-Telegram-Bot-Api-Secret-Token"] = self.webhook_secret
+        async with aiohttp.ClientSession() as session:
+            async with session.post(self.webhook_url, json=await request.json(),
+                                    headers=headers) as resp:
+                return web.json_response({"status": resp.status})
+
+    async def list_calls(self, request):
+        return web.json_response(self.calls)
+
+def create_app():
+    fake = FakeTelegram()
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", fake.method)
+    app.router.add_post("/push", fake.push)
+    app.router.add_get("/calls", fake.list_calls)
+    return app
+
+if __name__ == "__main__":
+    web.run_app(create_app(), port=int(os.getenv("FAKE_TELEGRAM_PORT", 8090)))
@@ -1,11 +1,15 @@
 from aiogram import Router, F
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject, ExceptionTypeFilter
+from aiogram.filters.callback_data import CallbackData
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.types.error_event import ErrorEvent
+import html
 import json
-import aiohttp
-from config import APP_URL
+from api import ApiClient, ApiError
+from cache import PageCache, UserDirectory
+from config import APP_URL, BOT_ADMIN_IDS, BOT_PAGE_SIZE
 
 router = Router()
 
@@ -14,6 +18,16 @@ class BotStates(StatesGroup):
     waiting_user_name = State()
     waiting_user_email = State()
 
+class TodoPage(CallbackData, prefix="todos"):
+    """Страница «Мои TODO»: номер страницы, её курсор — в данных FSM (todo_cursors)"""
+    page: int
+
+class TodoAction(CallbackData, prefix="todo"):
+    """Кнопка задачи на странице: action — done или delete"""
+    action: str
+    id: int
+    page: int
+
 # Клавиатура меню
 def get_main_menu():
     kb = InlineKeyboardMarkup(inline_keyboard=[
@@ -38,10 +52,8 @@ async def cmd_start(msg: Message):
     )
 
 @router.callback_query(F.data == "health")
-async def health_cb(callback: CallbackQuery):
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f"{APP_URL}/health") as resp:
-            data = await resp.json()
+async def health_cb(callback: CallbackQuery, api: ApiClient):
+    data = await api.get("/health")
     status = "🟢 OK" if data.get("status") == "healthy" else "🔴 ERROR"
     await callback.message.edit_text(
         f"🏥 Health Check\n\n<code>{json.dumps(data, indent=2, ensure_ascii=False)}</code>",
@@ -51,10 +63,8 @@ async def health_cb(callback: CallbackQuery):
     await callback.answer()
 
 @router.callback_query(F.data == "stats")
-async def stats_cb(callback: CallbackQuery):
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f"{APP_URL}/stats") as resp:
-            data = await resp.json()
+async def stats_cb(callback: CallbackQuery, api: ApiClient):
+    data = await api.get("/stats")
     await callback.message.edit_text(
         f"📊 Общая статистика\n\n"
         f"Всего: {data.get('total', 0)} 📝\n"
@@ -66,33 +76,126 @@ async def stats_cb(callback: CallbackQuery):
     await callback.answer()
 
 @router.callback_query(F.data == "users")
-async def users_cb(callback: CallbackQuery):
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f"{APP_URL}/users") as resp:
-            users = await resp.json()
+async def users_cb(callback: CallbackQuery, api: ApiClient):
+    users = await api.get("/users")
     text = "👥 Пользователи:\n\n" + "\n".join(
         [f"• {u['name']} ({u['email']})" for u in users[:10]]
     )
     await callback.message.edit_text(text, reply_markup=get_main_menu())
     await callback.answer()
 
-@router.callback_query(F.data == "my_todos")
-async def my_todos_cb(callback: CallbackQuery, state: FSMContext):
-    # Для простоты показываем все TODO (можно добавить user_id)
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f"{APP_URL}/todos") as resp:
-            todos = await resp.json()
-    
+# ===== Мои TODO =====
+# Задачи пользователя API, соответствующего Telegram-пользователю, страницами
+# по BOT_PAGE_SIZE через GET /todos/user/{id}: одна страница — один
+# небольшой запрос, а повторный показ берётся из кэша чата. Курсоры
+# открытых страниц лежат в данных FSM, поэтому «назад» работает и на
+# другой реплике бота.
+def todos_keyboard(todos, page, has_next):
+    rows = []
+    for todo in todos:
+        buttons = [InlineKeyboardButton(
+            text=f"🗑 {todo['id']}",
+            callback_data=TodoAction(action="delete", id=todo['id'], page=page).pack()
+        )]
+        if not todo['completed']:
+            buttons.insert(0, InlineKeyboardButton(
+                text=f"✅ {todo['id']}",
+                callback_data=TodoAction(action="done", id=todo['id'], page=page).pack()
+            ))
+        rows.append(buttons)
+    nav = []
+    if page > 0:
+        nav.append(InlineKeyboardButton(text="◀️", callback_data=TodoPage(page=page - 1).pack()))
+    if has_next:
+        nav.append(InlineKeyboardButton(text="▶️", callback_data=TodoPage(page=page + 1).pack()))
+    if nav:
+        rows.append(nav)
+    rows.append([InlineKeyboardButton(text="🏠 Меню", callback_data="menu")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+async def load_todos_page(chat_id, user_id, page, state, api, pages):
+    """(номер страницы, задачи, курсор следующей); курсоры страниц — в данных FSM"""
+    cursors = (await state.get_data()).get("todo_cursors") or [None]
+    # Кнопка со старого сообщения может указывать дальше известных страниц
+    page = min(page, len(cursors) - 1)
+    cursor = cursors[page]
+    cached = pages.get(chat_id, cursor)
+    if cached is None:
+        cached = await api.get_page(f"/todos/user/{user_id}", limit=BOT_PAGE_SIZE, after=cursor)
+        pages.put(chat_id, cursor, *cached)
+    todos, next_cursor = cached
+    following = [next_cursor] if next_cursor else []
+    if cursors[page + 1:page + 2] != following:
+        cursors = cursors[:page + 1] + following
+        await state.update_data(todo_cursors=cursors)
+    return page, todos, next_cursor
+
+async def show_todos(callback: CallbackQuery, page, state, api, users, pages):
+    user_id = await users.resolve(callback.from_user)
+    chat_id = callback.message.chat.id
+    page, todos, next_cursor = await load_todos_page(chat_id, user_id, page, state, api, pages)
+    # Последнюю задачу страницы удалили — показываем предыдущую
+    if not todos and page > 0:
+        page, todos, next_cursor = await load_todos_page(chat_id, user_id, page - 1, state, api, pages)
+
     if not todos:
         await callback.message.edit_text("📭 TODO пусто", reply_markup=get_main_menu())
         return
-    
-    text = "📋 TODO:\n\n"
-    for todo in todos[:10]:
+
+    text = f"📋 Мои TODO (стр. {page + 1}):\n\n"
+    for todo in todos:
         status = "✅" if todo['completed'] else "⏳"
-        text += f"{status} <code>{todo['task']}</code>\n"
-    
-    await callback.message.edit_text(text, reply_markup=get_main_menu(), parse_mode="HTML")
+        text += f"{status} <code>{todo['id']}</code> {html.escape(todo['task'])}\n"
+    await callback.message.edit_text(
+        text, reply_markup=todos_keyboard(todos, page, next_cursor is not None), parse_mode="HTML"
+    )
+
+@router.callback_query(F.data == "my_todos")
+async def my_todos_cb(callback: CallbackQuery, state: FSMContext, api: ApiClient,
+                      users: UserDirectory, pages: PageCache):
+    await show_todos(callback, 0, state, api, users, pages)
+    await callback.answer()
+
+@router.callback_query(TodoPage.filter())
+async def todo_page_cb(callback: CallbackQuery, callback_data: TodoPage, state: FSMContext,
+                       api: ApiClient, users: UserDirectory, pages: PageCache):
+    await show_todos(callback, callback_data.page, state, api, users, pages)
+    await callback.answer()
+
+@router.callback_query(TodoAction.filter())
+async def todo_action_cb(callback: CallbackQuery, callback_data: TodoAction, state: FSMContext,
+                         api: ApiClient, users: UserDirectory, pages: PageCache):
+    todo_id = callback_data.id
+    if callback_data.action == "done":
+        found = await complete_todo(api, todo_id)
+        notice = f"✅ Задача {todo_id} завершена"
+    else:
+        found = await delete_todo(api, todo_id)
+        notice = f"🗑 Задача {todo_id} удалена"
+    pages.invalidate(callback.message.chat.id)
+    await show_todos(callback, callback_data.page, state, api, users, pages)
+    await callback.answer(notice if found else f"Задача {todo_id} не найдена")
+
+async def complete_todo(api, todo_id):
+    """Завершить задачу, не трогая текст (PATCH /todos/bulk); False, если её нет"""
+    result = await api.patch("/todos/bulk", json=[{"id": todo_id, "completed": True}])
+    return not result["results"][0].get("error")
+
+async def delete_todo(api, todo_id):
+    """Удалить задачу; False, если её нет"""
+    try:
+        await api.delete(f"/todos/{todo_id}")
+    except ApiError as e:
+        if e.status != 404:
+            raise
+        return False
+    return True
+
+@router.callback_query(F.data == "menu")
+async def menu_cb(callback: CallbackQuery):
+    await callback.message.edit_text(
+        "🚀 <b>TODO Bot Frontend</b>", reply_markup=get_main_menu(), parse_mode="HTML"
+    )
     await callback.answer()
 
 @router.callback_query(F.data == "add_todo")
@@ -107,16 +210,16 @@ async def add_todo_cb(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 @router.message(BotStates.waiting_task)
-async def process_task(msg: Message, state: FSMContext):
+async def process_task(msg: Message, state: FSMContext, api: ApiClient,
+                       users: UserDirectory, pages: PageCache):
     task = msg.text.strip()
     
-    async with aiohttp.ClientSession() as session:
-        async with session.post(f"{APP_URL}/todos", json={
-            "user_id": 1,      # ← ИСПРАВЛЕНО!
-            "task": task,
-            "completed": False
-        }) as resp:
-            result = await resp.json()
+    await api.post("/todos", json={
+        "user_id": await users.resolve(msg.from_user),
+        "task": task,
+        "completed": False
+    })
+    pages.invalidate(msg.chat.id)
     
     await msg.answer("✅ Задача добавлена!", reply_markup=get_main_menu())
     await state.clear()
@@ -133,48 +236,107 @@ async def manage_cb(callback: CallbackQuery):
     await callback.message.edit_text(
         "⚙️ <b>Управление задачами:</b>\n\n"
         "• <code>/complete ID</code> - завершить задачу\n"
-        "• <code>/delete ID</code> - удалить задачу\n\n"
-        "<i>ID смотрите в списке TODO</i>",
+        "• <code>/delete ID</code> - удалить задачу\n"
+        "• <code>/search текст</code> - найти задачи\n"
+        "• <code>/watch</code> - присылать изменения ваших задач\n"
+        "• <code>/unwatch</code> - не присылать изменения\n\n"
+        "<i>ID и кнопки ✅/🗑 — в списке «Мои TODO»</i>",
         reply_markup=get_main_menu(),
         parse_mode="HTML"
     )
 
 @router.message(Command("complete"))
-async def cmd_complete(msg: Message):
+async def cmd_complete(msg: Message, api: ApiClient, pages: PageCache):
     try:
         todo_id = int(msg.text.split()[1])
-        async with aiohttp.ClientSession() as session:
-            async with session.put(f"{APP_URL}/todos/{todo_id}", json={
-                "task": "Завершено", "completed": True
-            }) as resp:
-                result = await resp.json()
-        await msg.answer(f"✅ Задача {todo_id} завершена!")
-    except:
+    except (IndexError, ValueError):
         await msg.answer("❌ Используйте: /complete 1")
+        return
+    if not await complete_todo(api, todo_id):
+        await msg.answer(f"❌ Задача {todo_id} не найдена")
+        return
+    pages.invalidate(msg.chat.id)
+    await msg.answer(f"✅ Задача {todo_id} завершена!")
 
 @router.message(Command("delete"))
-async def cmd_delete(msg: Message):
+async def cmd_delete(msg: Message, api: ApiClient, pages: PageCache):
     try:
         todo_id = int(msg.text.split()[1])
-        async with aiohttp.ClientSession() as session:
-            async with session.delete(f"{APP_URL}/todos/{todo_id}") as resp:
-                result = await resp.json()
-        await msg.answer(f"🗑 Задача {todo_id} удалена!")
-    except:
+    except (IndexError, ValueError):
         await msg.answer("❌ Используйте: /delete 1")
+        return
+    if not await delete_todo(api, todo_id):
+        await msg.answer(f"❌ Задача {todo_id} не найдена")
+        return
+    pages.invalidate(msg.chat.id)
+    await msg.answer(f"🗑 Задача {todo_id} удалена!")
+
+@router.message(Command("search"))
+async def cmd_search(msg: Message, command: CommandObject, api: ApiClient):
+    query = (command.args or "").strip()
+    if not query:
+        await msg.answer("❌ Используйте: /search молоко")
+        return
+    todos = await api.get("/todos/search", q=query, limit=10)
+    if not todos:
+        await msg.answer("🔍 Ничего не найдено")
+        return
+
+    text = f"🔍 Найдено по «{html.escape(query)}»:\n\n"
+    for todo in todos:
+        status = "✅" if todo['completed'] else "⏳"
+        text += f"{status} <code>{todo['id']}</code> {html.escape(todo['task'])}\n"
+    await msg.answer(text, parse_mode="HTML")
+
+@router.message(Command("watch"))
+async def cmd_watch(msg: Message, command: CommandObject, watchers, users: UserDirectory):
+    # В уведомлениях текст задач: свои задачи — любому, чужие и все сразу —
+    # только администраторам (BOT_ADMIN_IDS) в личном чате с ботом
+    args = (command.args or "").strip()
+    if not args:
+        user_id = await users.resolve(msg.from_user)
+        scope = "ваших задач"
+    elif msg.chat.id not in BOT_ADMIN_IDS:
+        await msg.answer("❌ Чужие задачи доступны только администраторам. Свои: /watch")
+        return
+    elif args == "all":
+        user_id, scope = None, "задач всех пользователей"
+    else:
+        try:
+            user_id = int(args)
+        except ValueError:
+            await msg.answer("❌ Используйте: /watch, /watch 1 или /watch all")
+            return
+        scope = f"задач пользователя {user_id}"
+    await watchers.add(msg.chat.id, user_id)
+    await msg.answer(f"🔔 Буду присылать изменения {scope}. Отключить: /unwatch")
+
+@router.message(Command("unwatch"))
+async def cmd_unwatch(msg: Message, watchers):
+    if await watchers.remove(msg.chat.id):
+        await msg.answer("🔕 Уведомления отключены")
+    else:
+        await msg.answer("Уведомления и так не включены")
 
 @router.callback_query(F.data == "create_user")
-async def create_user_cb(callback: CallbackQuery):
-    async with aiohttp.ClientSession() as session:
-        async with session.post(f"{APP_URL}/users", json={
-            "name": "Telegram Bot User",
-            "email": f"bot_{callback.from_user.id}@example.com"
-        }) as resp:
-            result = await resp.json()
+async def create_user_cb(callback: CallbackQuery, api: ApiClient, users: UserDirectory):
+    # Пользователь API у Telegram-пользователя один: найти или создать
+    user_id = await users.resolve(callback.from_user)
+    result = await api.get(f"/users/{user_id}")
     
     await callback.message.edit_text(
-        f"✅ Пользователь создан!\n<code>{json.dumps(result, indent=2)}</code>",
+        f"✅ Ваш пользователь API:\n<code>{json.dumps(result, indent=2, ensure_ascii=False)}</code>",
         reply_markup=get_main_menu(),
         parse_mode="HTML"
     )
     await callback.answer()
+
+@router.error(ExceptionTypeFilter(ApiError))
+async def api_error(event: ErrorEvent):
+    """Ошибка API: сообщить пользователю вместо молчаливого падения обработчика"""
+    error = event.exception
+    text = f"❌ Ошибка API ({error.status}): {error.detail}"
+    if event.update.callback_query:
+        await event.update.callback_query.answer(text[:200], show_alert=True)
+    elif event.update.message:
+        await event.update.message.answer(text)
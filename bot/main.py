@@ -4,17 +4,96 @@ import sys
 import os
 sys.path.append(os.path.dirname(__file__))
 
+from aiohttp import web
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.fsm.storage.memory import MemoryStorage
-from config import BOT_TOKEN  # ← config.py, НЕ cobalt!
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from api import ApiClient
+from cache import PageCache, UserDirectory
+from config import (  # ← config.py, НЕ cobalt!
+    BOT_ADMIN_IDS, BOT_EVENTS, BOT_MODE, BOT_TOKEN, FSM_DATABASE_URL, FSM_POOL_SIZE, FSM_STORAGE,
+    TELEGRAM_API_URL, WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEB_HOST, WEB_PORT,
+)
 from handlers import router
+from notifier import ChangeNotifier
+
+def create_bot():
+    session = None
+    if TELEGRAM_API_URL:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL))
+    return Bot(token=BOT_TOKEN, session=session)
+
+def create_storage():
+    """FSM-хранилище и список подписок /watch рядом с ним"""
+    from storage import MemoryWatchers, PostgresStorage, PostgresWatchers
+    if FSM_STORAGE == "memory":
+        return MemoryStorage(), MemoryWatchers(admins=BOT_ADMIN_IDS)
+    storage = PostgresStorage(FSM_DATABASE_URL, pool_size=FSM_POOL_SIZE)
+    return storage, PostgresWatchers(storage.pool, admins=BOT_ADMIN_IDS)
+
+def create_dispatcher():
+    storage, watchers = create_storage()
+    # Клиент API живёт столько же, сколько диспетчер, и передаётся
+    # в обработчики аргументом api; рядом — кэши пользователей API и
+    # страниц задач (аргументы users и pages)
+    api = ApiClient()
+    dp = Dispatcher(storage=storage, api=api, watchers=watchers,
+                    users=UserDirectory(api), pages=PageCache())
+    # shutdown-обработчики выполняются в порядке регистрации: рассылка
+    # останавливается раньше, чем закрывается хранилище подписок
+    notifier = ChangeNotifier(watchers) if BOT_EVENTS else None
+    if notifier:
+        dp.shutdown.register(notifier.close)
+    if hasattr(storage, "open"):
+        dp.startup.register(storage.open)
+        dp.shutdown.register(storage.close)
+    dp.startup.register(api.start)
+    dp.shutdown.register(api.close)
+    if notifier:
+        dp.startup.register(notifier.start)
+    dp.include_router(router)
+    return dp
+
+async def set_webhook(bot: Bot):
+    """Зарегистрировать webhook; реплики делают это одинаково, поэтому повтор безвреден"""
+    url = WEBHOOK_BASE_URL.rstrip("/") + WEBHOOK_PATH
+    info = await bot.get_webhook_info()
+    if info.url != url:
+        await bot.set_webhook(url, secret_token=WEBHOOK_SECRET)
+        print(f"✓ Webhook: {url}")
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    if not WEBHOOK_BASE_URL:
+        raise RuntimeError("Для BOT_MODE=webhook нужен WEBHOOK_BASE_URL")
+    dp.startup.register(set_webhook)
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET).register(
+        app, path=WEBHOOK_PATH
+    )
+    # startup/shutdown диспетчера выполняются вместе с веб-приложением
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, WEB_HOST, WEB_PORT).start()
+        print(f"🤖 Bot started (webhook on {WEB_HOST}:{WEB_PORT}{WEBHOOK_PATH})!")
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
 
 async def main():
     logging.basicConfig(level=logging.INFO)
-    bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher(storage=MemoryStorage())
-    dp.include_router(router)
+    bot = create_bot()
+    dp = create_dispatcher()
+    if BOT_MODE == "webhook":
+        await run_webhook(dp, bot)
+        return
     print("🤖 Bot started!")
+    # Polling не работает, пока зарегистрирован webhook
+    await bot.delete_webhook()
     await dp.start_polling(bot)
 
 if __name__ == "__main__":
@@ -0,0 +1,105 @@
+import asyncio
+import html
+import json
+import logging
+
+import aiohttp
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramForbiddenError
+
+from config import APP_URL, EVENTS_RETRY_DELAY
+
+logger = logging.getLogger(__name__)
+
+
+def format_event(event):
+    """Текст уведомления или None, если о событии не сообщаем"""
+    kind = event.get('type')
+    task = html.escape(event.get('task') or '')
+    if kind == 'todo.created':
+        return f"🆕 Задача <code>{event['id']}</code>: {task}"
+    if kind == 'todo.updated':
+        status = "✅ Выполнена" if event.get('completed') else "✏️ Изменена"
+        return f"{status} задача <code>{event['id']}</code>: {task}"
+    if kind == 'todo.deleted':
+        return f"🗑 Удалена задача <code>{event['id']}</code>: {task}"
+    if kind == 'todo.bulk':
+        return f"📦 Задач пользователя {event['user_id']} ({event['action']}): {event['count']}"
+    if kind == 'user.created':
+        return f"👤 Новый пользователь <code>{event['id']}</code>: {html.escape(event.get('name') or '')}"
+    return None
+
+
+async def read_events(content):
+    """События из потока text/event-stream (aiohttp StreamReader)"""
+    data = []
+    async for raw in content:
+        line = raw.decode('utf-8').rstrip('\r\n')
+        if line.startswith('data:'):
+            data.append(line[5:].lstrip())
+        elif not line and data:
+            yield json.loads('\n'.join(data))
+            data = []
+
+
+class ChangeNotifier:
+    """Слушает GET /events и рассылает уведомления чатам из списка /watch.
+
+    Вместо того чтобы перечитывать /todos, бот получает изменения сразу.
+    Поток переподключается после любого сбоя; между репликами рассылку
+    ведёт одна — та, что получила watchers.leadership().
+    """
+
+    def __init__(self, watchers, url=f"{APP_URL}/events", retry_delay=EVENTS_RETRY_DELAY):
+        self.watchers = watchers
+        self.url = url
+        self.retry_delay = retry_delay
+        self._task = None
+
+    async def start(self, bot: Bot):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(bot))
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, bot):
+        while True:
+            try:
+                async with self.watchers.leadership():
+                    await self._consume(bot)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Поток событий %s прерван: %s, повтор через %g с",
+                               self.url, e, self.retry_delay)
+            await asyncio.sleep(self.retry_delay)
+
+    async def _consume(self, bot):
+        # Без общего таймаута: поток бесконечный, а пинги приходят регулярно
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=5, sock_read=60)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            async with session.get(self.url) as resp:
+                resp.raise_for_status()
+                logger.info("Подписка на %s", self.url)
+                async for event in read_events(resp.content):
+                    await self.deliver(bot, event)
+
+    async def deliver(self, bot, event):
+        text = format_event(event)
+        if text is None:
+            return
+        for chat_id in await self.watchers.chats(event.get('user_id')):
+            try:
+                await bot.send_message(chat_id, text, parse_mode="HTML")
+            except TelegramForbiddenError:
+                # Бот заблокирован или удалён из чата
+                await self.watchers.remove(chat_id)
+            except TelegramAPIError as e:
+                logger.warning("Уведомление в чат %s не отправлено: %s", chat_id, e)
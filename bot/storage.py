@@ -0,0 +1,202 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+from aiogram.fsm.state import State
+import psycopg
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from psycopg.types.json import Jsonb
+from psycopg_pool import AsyncConnectionPool
+
+# Ключ advisory-блокировки: реплики, стартующие одновременно, не столкнутся на CREATE TABLE
+LOCK_KEY = 7_300_101
+# Ключ блокировки, которую держит единственная реплика, рассылающая уведомления
+NOTIFIER_LOCK_KEY = 7_300_102
+# Как часто остальные реплики пробуют взять эту блокировку
+LEADERSHIP_RETRY = 10
+
+CREATE_TABLE = '''
+    CREATE TABLE IF NOT EXISTS bot_fsm (
+        key TEXT PRIMARY KEY,
+        state TEXT,
+        data JSONB NOT NULL DEFAULT '{}',
+        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+CREATE_WATCHERS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS bot_watchers (
+        chat_id BIGINT PRIMARY KEY,
+        user_id INTEGER
+    )
+'''
+
+
+class PostgresStorage(BaseStorage):
+    """FSM-хранилище aiogram в таблице bot_fsm.
+
+    Состояния и данные диалогов видны всем репликам бота и не теряются
+    при перезапуске. Таблицы (bot_fsm и bot_watchers) хранилище создаёт
+    само при open(): бот разворачивается отдельно от миграций API.
+    """
+
+    def __init__(self, dsn, pool_size=5, key_builder=None):
+        self.key_builder = key_builder or DefaultKeyBuilder(with_destiny=True)
+        self.pool = AsyncConnectionPool(
+            dsn, min_size=1, max_size=pool_size, open=False,
+            kwargs={'autocommit': True},
+        )
+
+    async def open(self):
+        await self.pool.open(wait=True)
+        async with self.pool.connection() as conn:
+            async with conn.transaction():
+                await conn.execute('SELECT pg_advisory_xact_lock(%s)', (LOCK_KEY,))
+                await conn.execute(CREATE_TABLE)
+                await conn.execute(CREATE_WATCHERS_TABLE)
+
+    async def close(self) -> None:
+        await self.pool.close()
+
+    def _key(self, key: StorageKey) -> str:
+        return self.key_builder.build(key)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        async with self.pool.connection() as conn:
+            await conn.execute('''
+                INSERT INTO bot_fsm (key, state) VALUES (%s, %s)
+                ON CONFLICT (key) DO UPDATE
+                    SET state = EXCLUDED.state, updated_at = CURRENT_TIMESTAMP
+            ''', (self._key(key), state))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute(
+                'SELECT state FROM bot_fsm WHERE key = %s', (self._key(key),)
+            )
+            row = await cursor.fetchone()
+        return row[0] if row else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        async with self.pool.connection() as conn:
+            await conn.execute('''
+                INSERT INTO bot_fsm (key, data) VALUES (%s, %s)
+                ON CONFLICT (key) DO UPDATE
+                    SET data = EXCLUDED.data, updated_at = CURRENT_TIMESTAMP
+            ''', (self._key(key), Jsonb(data)))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute(
+                'SELECT data FROM bot_fsm WHERE key = %s', (self._key(key),)
+            )
+            row = await cursor.fetchone()
+        return row[0] if row else {}
+
+    async def update_data(self, key: StorageKey, data: Dict[str, Any]) -> Dict[str, Any]:
+        # Слияние на стороне БД: две реплики не затрут изменения друг друга
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute('''
+                INSERT INTO bot_fsm AS f (key, data) VALUES (%s, %s)
+                ON CONFLICT (key) DO UPDATE
+                    SET data = f.data || EXCLUDED.data, updated_at = CURRENT_TIMESTAMP
+                RETURNING data
+            ''', (self._key(key), Jsonb(data)))
+            row = await cursor.fetchone()
+        return row[0]
+
+
+# ===== Watchers =====
+class MemoryWatchers:
+    """Чаты, подписанные на уведомления (/watch), в памяти одного процесса.
+
+    user_id — чьи задачи присылать; None — все изменения, но только чатам
+    из admins: подписка, оставшаяся у чата вне списка, ничего не получает.
+    """
+
+    def __init__(self, admins=frozenset()):
+        self.admins = admins
+        self._chats = {}
+
+    async def add(self, chat_id: int, user_id: Optional[int] = None) -> None:
+        self._chats[chat_id] = user_id
+
+    async def remove(self, chat_id: int) -> bool:
+        return self._chats.pop(chat_id, False) is not False
+
+    async def chats(self, user_id: Optional[int]) -> List[int]:
+        # Событие без user_id — только тем, кто подписан на все изменения
+        return [chat for chat, watched in self._chats.items()
+                if (watched is None and chat in self.admins)
+                or (user_id is not None and watched == user_id)]
+
+    @asynccontextmanager
+    async def leadership(self):
+        # Процесс один — он и рассылает
+        yield
+
+
+class PostgresWatchers(MemoryWatchers):
+    """Подписки в таблице bot_watchers, общие для всех реплик бота.
+
+    Уведомления рассылает только реплика, взявшая advisory-блокировку в
+    leadership(), иначе каждый чат получал бы их по разу от каждой реплики.
+    Блокировка держится на отдельном соединении, а не на соединении пула:
+    пул остаётся FSM и подпискам. Таблицу создаёт PostgresStorage.open().
+    """
+
+    def __init__(self, pool, admins=frozenset()):
+        self.pool = pool
+        self.admins = admins
+
+    async def add(self, chat_id: int, user_id: Optional[int] = None) -> None:
+        async with self.pool.connection() as conn:
+            await conn.execute('''
+                INSERT INTO bot_watchers (chat_id, user_id) VALUES (%s, %s)
+                ON CONFLICT (chat_id) DO UPDATE SET user_id = EXCLUDED.user_id
+            ''', (chat_id, user_id))
+
+    async def remove(self, chat_id: int) -> bool:
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute(
+                'DELETE FROM bot_watchers WHERE chat_id = %s', (chat_id,)
+            )
+        return cursor.rowcount > 0
+
+    async def chats(self, user_id: Optional[int]) -> List[int]:
+        async with self.pool.connection() as conn:
+            cursor = await conn.execute('''
+                SELECT chat_id FROM bot_watchers
+                WHERE (user_id IS NULL AND chat_id = ANY(%(admins)s)) OR user_id = %(user_id)s
+            ''', {'user_id': user_id, 'admins': list(self.admins)})
+            return [row[0] for row in await cursor.fetchall()]
+
+    async def _try_lock(self):
+        """Отдельное соединение со взятой блокировкой рассылки или None"""
+        conn = await psycopg.AsyncConnection.connect(self.pool.conninfo, autocommit=True)
+        try:
+            cursor = await conn.execute('SELECT pg_try_advisory_lock(%s)', (NOTIFIER_LOCK_KEY,))
+            if (await cursor.fetchone())[0]:
+                return conn
+        except BaseException:
+            await conn.close()
+            raise
+        await conn.close()
+        return None
+
+    @asynccontextmanager
+    async def leadership(self):
+        """Ждать, пока эта реплика не станет рассылающей, и держать блокировку на время блока.
+
+        Между попытками соединение закрыто: ожидающие реплики его не держат.
+        """
+        conn = await self._try_lock()
+        while conn is None:
+            await asyncio.sleep(LEADERSHIP_RETRY)
+            conn = await self._try_lock()
+        try:
+            yield
+        finally:
+            # Блокировка уровня сеанса снимается вместе с соединением
+            await conn.close()
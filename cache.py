@@ -0,0 +1,165 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import Request, Response
+from prometheus_client import Counter, Gauge
+
+import settings
+
+# ===== Metrics =====
+CACHE_REQUESTS = Counter(
+    'cache_requests_total', 'Обращения к кэшу', ['cache', 'result']
+)
+CACHE_EVICTIONS = Counter(
+    'cache_evictions_total', 'Вытесненные из кэша записи', ['cache', 'reason']
+)
+CACHE_ENTRIES = Gauge(
+    'cache_entries', 'Записи в кэше', ['cache'],
+    multiprocess_mode='livesum'
+)
+
+
+class CacheEntry:
+    __slots__ = ('value', 'etag', 'expires_at')
+
+    def __init__(self, value, etag, expires_at):
+        self.value = value
+        self.etag = etag
+        self.expires_at = expires_at
+
+
+def make_etag(value) -> str:
+    raw = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str).encode()
+    return '"' + hashlib.sha1(raw).hexdigest() + '"'
+
+
+class TTLCache:
+    """LRU-кэш с ограничением по числу записей и времени жизни.
+
+    Кэш живёт внутри процесса: в каждом воркере свой. Записи, сделанные
+    другими воркерами, сбрасывает apply_event по событиям LISTEN; TTL
+    ограничивает устаревание, если событие потерялось (канал недоступен).
+    """
+
+    def __init__(self, name, maxsize=settings.CACHE_MAX_ENTRIES, ttl=settings.CACHE_TTL):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        # Растёт при каждой инвалидации: загрузка, начавшаяся до неё,
+        # не должна положить в кэш уже устаревшее значение
+        self._epoch = 0
+
+        self._hits = CACHE_REQUESTS.labels(name, 'hit')
+        self._misses = CACHE_REQUESTS.labels(name, 'miss')
+        self._evicted_size = CACHE_EVICTIONS.labels(name, 'size')
+        self._evicted_expired = CACHE_EVICTIONS.labels(name, 'expired')
+        self._entries = CACHE_ENTRIES.labels(name)
+
+    def get(self, key):
+        """Запись из кэша или None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry.expires_at <= now:
+                del self._data[key]
+                self._evicted_expired.inc()
+                self._entries.set(len(self._data))
+                entry = None
+            if entry is None:
+                self._misses.inc()
+                return None
+            self._data.move_to_end(key)
+            self._hits.inc()
+            return entry
+
+    def set(self, key, value, epoch=None):
+        """Положить значение; при epoch, устаревшем из-за инвалидации, — пропустить"""
+        entry = CacheEntry(value, make_etag(value), time.monotonic() + self.ttl)
+        with self._lock:
+            if epoch is not None and epoch != self._epoch:
+                return entry
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._evicted_size.inc()
+            self._entries.set(len(self._data))
+        return entry
+
+    def invalidate(self, *keys):
+        with self._lock:
+            self._epoch += 1
+            for key in keys:
+                self._data.pop(key, None)
+            self._entries.set(len(self._data))
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._data.clear()
+            self._entries.set(0)
+
+    async def get_or_load(self, key, loader, refresh=False):
+        """Запись из кэша, а при промахе — из loader(); None не кэшируется.
+
+        refresh=True — не смотреть в кэш, а загрузить и обновить запись.
+        """
+        entry = None if refresh else self.get(key)
+        if entry is not None:
+            return entry
+        epoch = self._epoch
+        value = await loader()
+        if value is None:
+            return None
+        return self.set(key, value, epoch)
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Совпадает ли If-None-Match запроса с ETag (слабое сравнение)"""
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    tags = {tag.strip().removeprefix('W/') for tag in header.split(',')}
+    return etag.removeprefix('W/') in tags
+
+
+def conditional(request: Request, response: Response, entry: CacheEntry):
+    """Тело записи с ETag или пустой 304, если клиент уже его видел"""
+    headers = {'ETag': entry.etag, 'Cache-Control': 'no-cache'}
+    if etag_matches(request, entry.etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return entry.value
+
+
+users_cache = TTLCache('users')
+todos_cache = TTLCache('todos')
+
+
+def apply_event(event):
+    """Сбросить записи, изменённые другим воркером, по событию канала changes.
+
+    Воркер, выполнивший запись, сбрасывает свой кэш сам; остальные узнают
+    о ней из LISTEN (events.EventHub) через миллисекунды после COMMIT.
+    События без id (todo.bulk, import, archive) и resync после разрыва
+    LISTEN сбрасывают кэш целиком.
+    """
+    kind = event.get('type', '')
+    if kind in ('todo.created', 'todo.updated', 'todo.deleted'):
+        todos_cache.invalidate(event['id'])
+    elif kind == 'user.created':
+        users_cache.invalidate(event['id'])
+    elif kind in ('todo.bulk', 'archive'):
+        todos_cache.clear()
+    elif kind == 'import':
+        (users_cache if event.get('table') == 'users' else todos_cache).clear()
+    elif kind == 'resync':
+        users_cache.clear()
+        todos_cache.clear()
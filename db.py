@@ -0,0 +1,790 @@
+import itertools
+import logging
+import re
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+import psycopg
+import psycopg2
+import psycopg_pool
+from psycopg.pq import TransactionStatus
+from psycopg.rows import dict_row, tuple_row
+from psycopg2 import extensions
+from psycopg2.extras import RealDictCursor
+from prometheus_client import Counter, Gauge, Histogram
+from starlette.concurrency import run_in_threadpool
+
+import settings
+# Исключения целостности общие для всех бэкендов; db переводит в них ошибки драйверов
+from storage import ForeignKeyViolation, IntegrityError, UniqueViolation
+
+# ===== Metrics =====
+POOL_CONNECTIONS = Gauge(
+    'db_pool_connections', 'Соединения пула БД по состоянию', ['pool', 'state'],
+    multiprocess_mode='livesum'
+)
+POOL_ACQUIRE_SECONDS = Histogram(
+    'db_pool_acquire_seconds', 'Время ожидания соединения из пула', ['pool'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+POOL_TIMEOUTS = Counter(
+    'db_pool_timeouts_total', 'Запросы, не дождавшиеся соединения из пула', ['pool']
+)
+POOL_DISCARDED = Counter(
+    'db_pool_discarded_total', 'Соединения, закрытые пулом как неисправные', ['pool']
+)
+# query — имя запроса (name=...), у запросов без имени — unnamed
+QUERY_SECONDS = Histogram(
+    'db_query_seconds', 'Время запроса по фазам: acquire, execute, fetch', ['query', 'phase'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+QUERY_ROWS = Histogram(
+    'db_query_rows', 'Строк вернул или затронул запрос', ['query'],
+    buckets=(0, 1, 10, 100, 1000, 10_000, 100_000)
+)
+QUERY_ERRORS = Counter(
+    'db_query_errors_total', 'Запросы, завершившиеся ошибкой', ['query']
+)
+
+slow_log = logging.getLogger('db.slow_query')
+
+
+class PoolTimeout(Exception):
+    """Свободное соединение не появилось за отведённое время"""
+
+
+class PoolClosed(Exception):
+    """Пул уже закрыт"""
+
+
+_INTEGRITY_ERRORS = {
+    '23505': UniqueViolation,
+    '23503': ForeignKeyViolation,
+}
+
+
+@contextmanager
+def _translate_errors():
+    """Привести исключения psycopg2/psycopg 3 к исключениям этого модуля и storage"""
+    try:
+        yield
+    except psycopg2.IntegrityError as e:
+        raise _INTEGRITY_ERRORS.get(e.pgcode, IntegrityError)(str(e), e.pgcode) from e
+    except psycopg.IntegrityError as e:
+        raise _INTEGRITY_ERRORS.get(e.sqlstate, IntegrityError)(str(e), e.sqlstate) from e
+    except psycopg_pool.PoolTimeout as e:
+        raise PoolTimeout(str(e)) from e
+    except psycopg_pool.PoolClosed as e:
+        raise PoolClosed(str(e)) from e
+
+
+class PreparingConnection(extensions.connection):
+    """Соединение psycopg2, помнящее имена подготовленных на нём запросов"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+
+class ConnectionPool:
+    """Ограниченный пул соединений psycopg2 (в режиме autocommit).
+
+    Держит не меньше min_size и не больше max_size соединений. Если все
+    заняты, getconn() ждёт не дольше timeout и бросает PoolTimeout.
+    Простаивавшие дольше check_idle соединения проверяются перед выдачей,
+    а лишние соединения закрываются после max_idle секунд простоя.
+    """
+
+    def __init__(self, dsn, name='primary', min_size=settings.DB_POOL_MIN_SIZE,
+                 max_size=settings.DB_POOL_MAX_SIZE, timeout=settings.DB_POOL_TIMEOUT,
+                 check_idle=settings.DB_POOL_CHECK_IDLE, max_idle=settings.DB_POOL_MAX_IDLE,
+                 connect_timeout=settings.DB_CONNECT_TIMEOUT):
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError(f"Некорректный размер пула: min={min_size}, max={max_size}")
+        self.dsn = dsn
+        self.name = name
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_idle = check_idle
+        self.max_idle = max_idle
+        self.connect_timeout = connect_timeout
+
+        self._idle = deque()  # (conn, время возврата в пул); справа самые свежие
+        self._size = 0        # открытые + открываемые соединения
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self._in_use_gauge = POOL_CONNECTIONS.labels(name, 'in_use')
+        self._idle_gauge = POOL_CONNECTIONS.labels(name, 'idle')
+        self._acquire_hist = POOL_ACQUIRE_SECONDS.labels(name)
+
+    def _connect(self):
+        conn = psycopg2.connect(
+            self.dsn,
+            connect_timeout=self.connect_timeout,
+            connection_factory=PreparingConnection,
+        )
+        # Одиночный запрос — один round trip, без отдельного COMMIT
+        conn.autocommit = True
+        return conn
+
+    def _release_slot(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, conn, idle_since):
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.check_idle:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            return True
+        except psycopg2.Error:
+            return False
+
+    def open(self):
+        """Заранее открыть min_size соединений"""
+        opened = []
+        with self._cond:
+            missing = max(0, self.min_size - self._size)
+            self._size += missing
+        try:
+            for _ in range(missing):
+                opened.append(self._connect())
+        except Exception:
+            for conn in opened:
+                self._close_quietly(conn)
+            with self._cond:
+                self._size -= missing
+                self._cond.notify_all()
+            raise
+        now = time.monotonic()
+        with self._cond:
+            self._idle.extend((conn, now) for conn in opened)
+            self._idle_gauge.set(len(self._idle))
+            self._cond.notify_all()
+
+    def getconn(self, timeout=None):
+        """Взять соединение из пула, при необходимости открыв новое"""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        while True:
+            conn = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolClosed(f"Пул {self.name} закрыт")
+                    if self._idle:
+                        conn, idle_since = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        POOL_TIMEOUTS.labels(self.name).inc()
+                        raise PoolTimeout(
+                            f"Нет свободных соединений в пуле {self.name} за {timeout:g} с"
+                        )
+                    self._cond.wait(remaining)
+                self._idle_gauge.set(len(self._idle))
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    self._release_slot()
+                    raise
+            elif not self._is_healthy(conn, idle_since):
+                POOL_DISCARDED.labels(self.name).inc()
+                self._close_quietly(conn)
+                self._release_slot()
+                continue
+
+            self._acquire_hist.observe(time.monotonic() - started)
+            self._in_use_gauge.inc()
+            return conn
+
+    def putconn(self, conn, discard=False):
+        """Вернуть соединение в пул (или закрыть, если оно неисправно)"""
+        self._in_use_gauge.dec()
+        if not discard and not conn.closed:
+            status = conn.info.transaction_status
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                discard = True
+            else:
+                try:
+                    if status != extensions.TRANSACTION_STATUS_IDLE:
+                        conn.rollback()
+                    conn.autocommit = True
+                except psycopg2.Error:
+                    discard = True
+        if discard or conn.closed or self._closed:
+            if not self._closed:
+                POOL_DISCARDED.labels(self.name).inc()
+            self._close_quietly(conn)
+            self._release_slot()
+            return
+
+        stale = []
+        now = time.monotonic()
+        with self._cond:
+            self._idle.append((conn, now))
+            # Самые старые простаивающие соединения лежат слева
+            while (self._size > self.min_size and self._idle
+                   and now - self._idle[0][1] > self.max_idle):
+                stale.append(self._idle.popleft()[0])
+                self._size -= 1
+            self._idle_gauge.set(len(self._idle))
+            self._cond.notify()
+        for old in stale:
+            self._close_quietly(old)
+
+    @contextmanager
+    def connection(self, timeout=None, transaction=False):
+        """Соединение на время блока.
+
+        С transaction=True блок выполняется в одной транзакции: commit при
+        успехе, rollback при ошибке. Иначе каждый запрос фиксируется сам.
+        """
+        conn = self.getconn(timeout)
+        discard = False
+        try:
+            if transaction:
+                conn.autocommit = False
+            yield conn
+            conn.commit()
+        except psycopg2.OperationalError:
+            discard = True
+            raise
+        finally:
+            self.putconn(conn, discard=discard)
+
+    def close(self):
+        """Закрыть пул и все простаивающие соединения"""
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._idle_gauge.set(0)
+            self._cond.notify_all()
+        for conn in idle:
+            self._close_quietly(conn)
+
+    def stats(self):
+        with self._cond:
+            idle = len(self._idle)
+            return {
+                "name": self.name,
+                "size": self._size,
+                "idle": idle,
+                "in_use": self._size - idle,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+            }
+
+
+# ===== Async interface =====
+class _Queries:
+    """fetch_one / fetch_all / execute поверх абстрактного _run().
+
+    Запрос с именем name выполняется как подготовленный на сервере:
+    на каждом соединении он разбирается и планируется один раз.
+    Одно имя всегда должно соответствовать одному тексту запроса.
+    """
+
+    async def _run(self, query, params, fetch, name):
+        raise NotImplementedError
+
+    async def fetch_one(self, query, params=None, name=None):
+        """Первая строка результата как dict или None"""
+        return await self._run(query, params, 'one', name)
+
+    async def fetch_all(self, query, params=None, name=None):
+        """Все строки результата как список dict"""
+        return await self._run(query, params, 'all', name)
+
+    async def fetch_rows(self, query, params=None, name=None):
+        """(имена колонок, строки-кортежи): без построения dict на каждую строку"""
+        return await self._run(query, params, 'rows', name)
+
+    async def execute(self, query, params=None, name=None):
+        """Выполнить запрос и вернуть число затронутых строк"""
+        return await self._run(query, params, 'none', name)
+
+
+_PLACEHOLDER = re.compile(r'%[s%]')
+
+
+def _to_numbered(query):
+    """Запрос с %s → запрос с $1, $2, ... для PREPARE"""
+    counter = iter(range(1, 10_000))
+    return _PLACEHOLDER.sub(lambda m: '%' if m[0] == '%%' else f'${next(counter)}', query)
+
+
+# ===== Query metrics and slow-query log =====
+def _label(name):
+    return name or 'unnamed'
+
+
+_WRITE = re.compile(r'\b(INSERT|UPDATE|DELETE|MERGE)\b', re.IGNORECASE)
+
+
+def _explainable(query):
+    """EXPLAIN ANALYZE выполняет запрос, поэтому снимаем его только для чтения"""
+    head = query.lstrip()[:6].upper()
+    if head == 'SELECT':
+        return True
+    return head.startswith('WITH') and not _WRITE.search(query)
+
+
+def _params_shape(params):
+    """Типы и размеры параметров без значений: в логе не должно быть данных"""
+    def shape(value):
+        if isinstance(value, (list, tuple)):
+            return f'{type(value).__name__}[{len(value)}]'
+        if isinstance(value, (str, bytes)):
+            return f'{type(value).__name__}[{len(value)}]'
+        return type(value).__name__
+
+    if not params:
+        return '()'
+    if isinstance(params, dict):
+        return '{' + ', '.join(f'{key}: {shape(value)}' for key, value in params.items()) + '}'
+    return '(' + ', '.join(shape(value) for value in params) + ')'
+
+
+def _observe(name, started, executed, fetched, rowcount):
+    """Записать метрики запроса; True, если он медленный"""
+    label = _label(name)
+    QUERY_SECONDS.labels(label, 'execute').observe(executed - started)
+    QUERY_SECONDS.labels(label, 'fetch').observe(fetched - executed)
+    if rowcount is not None and rowcount >= 0:
+        QUERY_ROWS.labels(label).observe(rowcount)
+    return settings.DB_SLOW_QUERY_MS > 0 and (fetched - started) * 1000 >= settings.DB_SLOW_QUERY_MS
+
+
+def _log_slow(name, query, params, started, executed, fetched, rowcount, plan=None):
+    message = (
+        f"Медленный запрос {_label(name)}: {(fetched - started) * 1000:.1f} мс "
+        f"(execute {(executed - started) * 1000:.1f}, fetch {(fetched - executed) * 1000:.1f}), "
+        f"строк {rowcount}, параметры {_params_shape(params)}\n"
+        f"SQL: {' '.join(query.split())}"
+    )
+    if plan:
+        message += '\nПлан:\n' + plan
+    slow_log.warning(message)
+
+
+def _sync_explain(conn, query, params):
+    # В открытой транзакции ошибка EXPLAIN оборвала бы её, поэтому только в autocommit
+    if not (settings.DB_SLOW_QUERY_EXPLAIN and conn.autocommit and _explainable(query)):
+        return None
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + query, params)
+            return '\n'.join(row[0] for row in cursor.fetchall())
+    except psycopg2.Error as e:
+        return f'EXPLAIN не удался: {e}'
+
+
+async def _async_explain(conn, query, params):
+    if not (settings.DB_SLOW_QUERY_EXPLAIN and _explainable(query)
+            and conn.info.transaction_status == TransactionStatus.IDLE):
+        return None
+    try:
+        cursor = conn.cursor(row_factory=tuple_row)
+        await cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + query, params)
+        return '\n'.join(row[0] for row in await cursor.fetchall())
+    except psycopg.Error as e:
+        return f'EXPLAIN не удался: {e}'
+
+
+def _sync_query(conn, query, params, fetch, name=None):
+    cursor_factory = None if fetch == 'rows' else RealDictCursor
+    with conn.cursor(cursor_factory=cursor_factory) as cursor:
+        started = time.perf_counter()
+        try:
+            if name is None:
+                cursor.execute(query, params)
+            else:
+                if name not in conn.prepared:
+                    cursor.execute(f'PREPARE {name} AS {_to_numbered(query)}')
+                    conn.prepared.add(name)
+                if params:
+                    cursor.execute(f'EXECUTE {name} ({", ".join(["%s"] * len(params))})', params)
+                else:
+                    cursor.execute(f'EXECUTE {name}')
+            executed = time.perf_counter()
+            if fetch == 'one':
+                result = cursor.fetchone()
+            elif fetch == 'all':
+                result = cursor.fetchall()
+            elif fetch == 'rows':
+                result = [column[0] for column in cursor.description], cursor.fetchall()
+            else:
+                result = cursor.rowcount
+        except Exception:
+            QUERY_ERRORS.labels(_label(name)).inc()
+            raise
+        fetched = time.perf_counter()
+        rowcount = cursor.rowcount
+
+    if _observe(name, started, executed, fetched, rowcount):
+        plan = _sync_explain(conn, query, params)
+        _log_slow(name, query, params, started, executed, fetched, rowcount, plan)
+    return result
+
+
+class _ThreadedTransaction(_Queries):
+    def __init__(self, conn):
+        self._conn = conn
+
+    async def _run(self, query, params, fetch, name):
+        with _translate_errors():
+            return await run_in_threadpool(_sync_query, self._conn, query, params, fetch, name)
+
+
+class ThreadedDatabase(_Queries):
+    """Асинхронный фасад над пулом psycopg2: запросы выполняются в threadpool"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.name = pool.name
+
+    def _run_sync(self, query, params, fetch, name):
+        started = time.perf_counter()
+        with self.pool.connection() as conn:
+            QUERY_SECONDS.labels(_label(name), 'acquire').observe(time.perf_counter() - started)
+            return _sync_query(conn, query, params, fetch, name)
+
+    async def _run(self, query, params, fetch, name):
+        with _translate_errors():
+            return await run_in_threadpool(self._run_sync, query, params, fetch, name)
+
+    def _begin(self):
+        conn = self.pool.getconn()
+        conn.autocommit = False
+        return conn
+
+    @asynccontextmanager
+    async def transaction(self):
+        """Несколько запросов на одном соединении в одной транзакции"""
+        conn = await run_in_threadpool(self._begin)
+        discard = False
+        try:
+            yield _ThreadedTransaction(conn)
+            with _translate_errors():
+                await run_in_threadpool(conn.commit)
+        except psycopg2.OperationalError:
+            discard = True
+            raise
+        finally:
+            await run_in_threadpool(self.pool.putconn, conn, discard)
+
+    async def stream(self, query, params=None, batch_size=settings.DB_STREAM_BATCH_SIZE, name=None):
+        """Строки результата по одной, через серверный курсор (порциями batch_size).
+
+        name здесь только подпись в метриках: серверный курсор не подготавливается.
+        """
+        started = time.perf_counter()
+        conn = await run_in_threadpool(self._begin)
+        QUERY_SECONDS.labels(_label(name), 'acquire').observe(time.perf_counter() - started)
+        cursor = conn.cursor(name='stream', cursor_factory=RealDictCursor)
+        count = 0
+        try:
+            with _translate_errors():
+                await run_in_threadpool(cursor.execute, query, params)
+                while True:
+                    rows = await run_in_threadpool(cursor.fetchmany, batch_size)
+                    if not rows:
+                        break
+                    count += len(rows)
+                    for row in rows:
+                        yield row
+        finally:
+            QUERY_ROWS.labels(_label(name)).observe(count)
+            await run_in_threadpool(self._close_stream, conn, cursor)
+
+    def _close_stream(self, conn, cursor):
+        discard = False
+        try:
+            cursor.close()
+        except psycopg2.Error:
+            discard = True
+        self.pool.putconn(conn, discard=discard)
+
+    async def open(self):
+        await run_in_threadpool(self.pool.open)
+
+    async def close(self):
+        await run_in_threadpool(self.pool.close)
+
+    def stats(self):
+        return self.pool.stats()
+
+
+async def _async_query(conn, query, params, fetch, name=None):
+    # psycopg 3 сам подбирает имя подготовленного запроса по его тексту
+    row_factory = tuple_row if fetch == 'rows' else dict_row
+    cursor = conn.cursor(row_factory=row_factory)
+    started = time.perf_counter()
+    try:
+        await cursor.execute(query, params, prepare=True if name else None)
+        executed = time.perf_counter()
+        if fetch == 'one':
+            result = await cursor.fetchone()
+        elif fetch == 'all':
+            result = await cursor.fetchall()
+        elif fetch == 'rows':
+            result = [column.name for column in cursor.description], await cursor.fetchall()
+        else:
+            result = cursor.rowcount
+    except Exception:
+        QUERY_ERRORS.labels(_label(name)).inc()
+        raise
+    fetched = time.perf_counter()
+
+    if _observe(name, started, executed, fetched, cursor.rowcount):
+        plan = await _async_explain(conn, query, params)
+        _log_slow(name, query, params, started, executed, fetched, cursor.rowcount, plan)
+    return result
+
+
+class _AsyncTransaction(_Queries):
+    def __init__(self, conn):
+        self._conn = conn
+
+    async def _run(self, query, params, fetch, name):
+        with _translate_errors():
+            return await _async_query(self._conn, query, params, fetch, name)
+
+
+class AsyncDatabase(_Queries):
+    """Асинхронный драйвер psycopg 3 со своим пулом соединений (autocommit)"""
+
+    def __init__(self, dsn, name='primary', min_size=settings.DB_POOL_MIN_SIZE,
+                 max_size=settings.DB_POOL_MAX_SIZE, timeout=settings.DB_POOL_TIMEOUT,
+                 max_idle=settings.DB_POOL_MAX_IDLE, connect_timeout=settings.DB_CONNECT_TIMEOUT):
+        self.name = name
+        self.pool = psycopg_pool.AsyncConnectionPool(
+            dsn,
+            min_size=min_size,
+            max_size=max_size,
+            timeout=timeout,
+            max_idle=max_idle,
+            check=psycopg_pool.AsyncConnectionPool.check_connection,
+            kwargs={'row_factory': dict_row, 'connect_timeout': connect_timeout, 'autocommit': True},
+            name=name,
+            open=False,
+        )
+        self._in_use_gauge = POOL_CONNECTIONS.labels(name, 'in_use')
+        self._idle_gauge = POOL_CONNECTIONS.labels(name, 'idle')
+        self._acquire_hist = POOL_ACQUIRE_SECONDS.labels(name)
+
+    @asynccontextmanager
+    async def _connection(self, name=None):
+        started = time.monotonic()
+        with _translate_errors():
+            try:
+                conn = await self.pool.getconn()
+            except psycopg_pool.PoolTimeout:
+                POOL_TIMEOUTS.labels(self.name).inc()
+                raise
+        self._acquire_hist.observe(time.monotonic() - started)
+        QUERY_SECONDS.labels(_label(name), 'acquire').observe(time.monotonic() - started)
+        self._in_use_gauge.inc()
+        self._idle_gauge.set(self.pool.get_stats()['pool_available'])
+        try:
+            yield conn
+        finally:
+            await self.pool.putconn(conn)
+            self._in_use_gauge.dec()
+            self._idle_gauge.set(self.pool.get_stats()['pool_available'])
+
+    async def _run(self, query, params, fetch, name):
+        async with self._connection(name) as conn:
+            with _translate_errors():
+                return await _async_query(conn, query, params, fetch, name)
+
+    @asynccontextmanager
+    async def transaction(self):
+        """Несколько запросов на одном соединении в одной транзакции"""
+        async with self._connection() as conn:
+            with _translate_errors():
+                async with conn.transaction():
+                    yield _AsyncTransaction(conn)
+
+    async def stream(self, query, params=None, batch_size=settings.DB_STREAM_BATCH_SIZE, name=None):
+        """Строки результата по одной, через серверный курсор (порциями batch_size).
+
+        name здесь только подпись в метриках: серверный курсор не подготавливается.
+        """
+        count = 0
+        async with self._connection(name) as conn:
+            try:
+                with _translate_errors():
+                    async with conn.transaction():
+                        async with conn.cursor(name='stream') as cursor:
+                            cursor.itersize = batch_size
+                            await cursor.execute(query, params)
+                            async for row in cursor:
+                                count += 1
+                                yield row
+            finally:
+                QUERY_ROWS.labels(_label(name)).observe(count)
+
+    async def open(self):
+        # pool.wait() при неудаче закрыл бы пул насовсем; так пул остаётся
+        # открытым и продолжает подключаться в фоне, пока БД не поднимется
+        await self.pool.open()
+        async with self._connection():
+            pass
+
+    async def close(self):
+        await self.pool.close()
+
+    def stats(self):
+        stats = self.pool.get_stats()
+        return {
+            "name": self.name,
+            "size": stats['pool_size'],
+            "idle": stats['pool_available'],
+            "in_use": stats['pool_size'] - stats['pool_available'],
+            "min_size": stats['pool_min'],
+            "max_size": stats['pool_max'],
+        }
+
+
+# ===== Replicas =====
+REPLICA_FAILOVERS = Counter(
+    'db_replica_failovers_total', 'Сколько раз реплика выводилась из ротации', ['pool']
+)
+
+# БД (или пул) недоступна, а не отвергла конкретные данные: после таких ошибок
+# реплика временно исключается из ротации
+UNAVAILABLE = (PoolTimeout, PoolClosed, psycopg2.OperationalError, psycopg.OperationalError)
+
+# True — чтения текущего запроса идут на primary (read-your-writes)
+_read_from_primary = ContextVar('read_from_primary', default=False)
+
+
+@contextmanager
+def read_from_primary():
+    """Блок, в котором ReplicaSet читает с primary"""
+    token = _read_from_primary.set(True)
+    try:
+        yield
+    finally:
+        _read_from_primary.reset(token)
+
+
+def reading_from_primary():
+    """True внутри read_from_primary()"""
+    return _read_from_primary.get()
+
+
+class ReplicaSet(_Queries):
+    """Чтения по кругу с реплик, с переходом на следующую при отказе.
+
+    Реплика, на которой запрос упал с ошибкой соединения или не дождался
+    пула, исключается из ротации на retry_after секунд. Если доступных
+    реплик нет (или их не задано), а также внутри read_from_primary(),
+    запрос выполняется на primary. Транзакций здесь нет: записи всегда
+    идут напрямую в primary.
+    """
+
+    def __init__(self, primary, replicas, retry_after=settings.DB_REPLICA_RETRY_AFTER):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.retry_after = retry_after
+        self._down_until = {replica.name: 0.0 for replica in self.replicas}
+        self._next = itertools.count()
+
+    def _candidates(self):
+        if _read_from_primary.get() or not self.replicas:
+            return []
+        now = time.monotonic()
+        start = next(self._next)
+        ordered = [self.replicas[(start + i) % len(self.replicas)]
+                   for i in range(len(self.replicas))]
+        return [replica for replica in ordered if self._down_until[replica.name] <= now]
+
+    def _mark_down(self, replica, error):
+        self._down_until[replica.name] = time.monotonic() + self.retry_after
+        REPLICA_FAILOVERS.labels(replica.name).inc()
+        logging.getLogger('db').warning(
+            "Реплика %s недоступна на %g с: %s", replica.name, self.retry_after, error
+        )
+
+    async def _run(self, query, params, fetch, name):
+        for replica in self._candidates():
+            try:
+                return await replica._run(query, params, fetch, name)
+            except UNAVAILABLE as e:
+                self._mark_down(replica, e)
+        return await self.primary._run(query, params, fetch, name)
+
+    async def stream(self, query, params=None, batch_size=settings.DB_STREAM_BATCH_SIZE, name=None):
+        """Как Database.stream(); на другую реплику переходит, только пока не отдано ни строки"""
+        for replica in self._candidates():
+            started = False
+            try:
+                async for row in replica.stream(query, params, batch_size, name):
+                    started = True
+                    yield row
+                return
+            except UNAVAILABLE as e:
+                self._mark_down(replica, e)
+                if started:
+                    raise
+        async for row in self.primary.stream(query, params, batch_size, name):
+            yield row
+
+    async def open(self):
+        for replica in self.replicas:
+            try:
+                await replica.open()
+            except Exception as e:
+                self._mark_down(replica, e)
+
+    async def close(self):
+        for replica in self.replicas:
+            await replica.close()
+
+    def stats(self):
+        now = time.monotonic()
+        return [
+            {**replica.stats(), "available": self._down_until[replica.name] <= now}
+            for replica in self.replicas
+        ]
+
+
+def _create_database(dsn, name):
+    # Пул psycopg2 нужен только потоковому режиму: в DB_ASYNC всё идёт через psycopg 3
+    if settings.DB_ASYNC:
+        return AsyncDatabase(dsn, name)
+    return ThreadedDatabase(ConnectionPool(dsn, name))
+
+
+database = _create_database(settings.DATABASE_URL, 'primary')
+
+replicas = ReplicaSet(database, [
+    _create_database(dsn, f'replica{number}')
+    for number, dsn in enumerate(settings.DATABASE_REPLICA_URLS, 1)
+])
@@ -0,0 +1,168 @@
+"""Лента изменений: NOTIFY из Postgres → подписчики GET /events (SSE).
+
+Триггеры (migrations/0005_change_events.sql) публикуют события в канал
+changes при каждой записи в users и todos. Каждый воркер API держит одно
+соединение с LISTEN и раздаёт события своим подписчикам из памяти.
+"""
+import asyncio
+import json
+import logging
+
+import psycopg
+from prometheus_client import Counter, Gauge
+
+import settings
+
+CHANNEL = 'changes'
+
+# ===== Metrics =====
+EVENTS_RECEIVED = Counter('events_received_total', 'События, полученные из канала NOTIFY')
+EVENTS_DROPPED = Counter(
+    'events_dropped_subscribers_total', 'Подписчики, отключённые из-за переполненной очереди'
+)
+EVENTS_SUBSCRIBERS = Gauge(
+    'events_subscribers', 'Подключённые подписчики /events', multiprocess_mode='livesum'
+)
+
+log = logging.getLogger('events')
+
+
+class Subscription:
+    """Очередь событий одного подписчика; user_id — фильтр (None — все события)"""
+
+    __slots__ = ('queue', 'user_id')
+
+    def __init__(self, user_id=None, size=settings.EVENTS_QUEUE_SIZE):
+        self.queue = asyncio.Queue(size)
+        self.user_id = user_id
+
+    def wants(self, event):
+        # События без user_id (import, resync) нужны всем
+        return self.user_id is None or event.get('user_id', self.user_id) == self.user_id
+
+
+class EventHub:
+    """LISTEN на отдельном соединении и раздача событий подписчикам.
+
+    Подписчик, не успевающий забирать события, отключается: лучше, чтобы
+    клиент переподключился и перечитал данные, чем чтобы отставание росло
+    без предела. После разрыва соединения с БД hub переподключается и
+    рассылает событие resync: пропущенное за это время не восстановить.
+
+    listeners — функции, которые получают каждое событие до подписчиков
+    (например, сброс кэша воркера, cache.apply_event).
+    """
+
+    def __init__(self, dsn=settings.DATABASE_URL, retry_delay=settings.EVENTS_RETRY_DELAY):
+        self.dsn = dsn
+        self.retry_delay = retry_delay
+        self._subscribers = set()
+        self._task = None
+        self.listeners = []
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for subscription in list(self._subscribers):
+            self._drop(subscription)
+
+    def subscribe(self, user_id=None):
+        subscription = Subscription(user_id)
+        self._subscribers.add(subscription)
+        EVENTS_SUBSCRIBERS.inc()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        if subscription in self._subscribers:
+            self._subscribers.discard(subscription)
+            EVENTS_SUBSCRIBERS.dec()
+
+    def _drop(self, subscription):
+        """Отключить подписчика: вместо следующего события он получит None"""
+        self.unsubscribe(subscription)
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+        subscription.queue.put_nowait(None)
+
+    def publish(self, event):
+        for listener in self.listeners:
+            listener(event)
+        for subscription in list(self._subscribers):
+            if not subscription.wants(event):
+                continue
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                EVENTS_DROPPED.inc()
+                self._drop(subscription)
+
+    async def _listen(self, resync):
+        conn = await psycopg.AsyncConnection.connect(
+            self.dsn, autocommit=True, connect_timeout=settings.DB_CONNECT_TIMEOUT
+        )
+        try:
+            await conn.execute(f'LISTEN {CHANNEL}')
+            log.info("Подписка на канал %s", CHANNEL)
+            if resync:
+                self.publish({'type': 'resync'})
+            async for notify in conn.notifies():
+                try:
+                    event = json.loads(notify.payload)
+                except ValueError:
+                    log.warning("Некорректное событие: %r", notify.payload)
+                    continue
+                EVENTS_RECEIVED.inc()
+                self.publish(event)
+        finally:
+            await conn.close()
+
+    async def _run(self):
+        resync = False
+        while True:
+            try:
+                await self._listen(resync)
+            except (psycopg.Error, OSError) as e:
+                log.warning("Канал %s недоступен, повтор через %g с: %s", CHANNEL, self.retry_delay, e)
+            # Всё, что пришло между разрывом и новым LISTEN, потеряно
+            resync = True
+            await asyncio.sleep(self.retry_delay)
+
+
+def sse(event):
+    """Событие в формате text/event-stream"""
+    data = json.dumps(event, ensure_ascii=False)
+    return f"event: {event.get('type', 'message')}\ndata: {data}\n\n".encode()
+
+
+async def stream(hub, subscription, heartbeat=settings.EVENTS_HEARTBEAT):
+    """Тело ответа SSE: события подписчика и комментарии-пинги между ними"""
+    get = None
+    try:
+        # retry: через сколько миллисекунд EventSource переподключится сам
+        yield f"retry: {int(hub.retry_delay * 1000)}\n\n".encode()
+        while True:
+            if get is None:
+                get = asyncio.ensure_future(subscription.queue.get())
+            done, _ = await asyncio.wait({get}, timeout=heartbeat)
+            if not done:
+                # Пинг держит соединение через прокси и замечает ушедших клиентов
+                yield b": ping\n\n"
+                continue
+            event, get = get.result(), None
+            if event is None:
+                yield sse({'type': 'resync', 'reason': 'slow consumer'})
+                return
+            yield sse(event)
+    finally:
+        if get is not None:
+            get.cancel()
+        hub.unsubscribe(subscription)
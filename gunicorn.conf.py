@@ -0,0 +1,41 @@
+"""Production-запуск API: gunicorn с воркерами uvicorn.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Метрики воркеров собираются через каталог PROMETHEUS_MULTIPROC_DIR: каждый
+процесс пишет туда свои значения, а /metrics любого воркера отдаёт сумму
+по всем. Каталог очищается при старте мастера, файлы умершего воркера
+помечаются в child_exit, чтобы его gauge-метрики не оставались в сумме.
+"""
+import os
+import shutil
+
+# Должно быть задано до импорта prometheus_client — в мастере и, через
+# наследование окружения, в воркерах
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus_multiproc')
+
+import settings
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+worker_class = 'uvicorn.workers.UvicornWorker'
+workers = settings.WEB_WORKERS
+max_requests = settings.WEB_MAX_REQUESTS
+max_requests_jitter = settings.WEB_MAX_REQUESTS_JITTER
+graceful_timeout = settings.WEB_GRACEFUL_TIMEOUT
+timeout = 60
+keepalive = 5
+accesslog = '-'
+
+
+def on_starting(server):
+    path = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    # Файлы прошлого запуска исказили бы счётчики
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    pool = f"пул БД до {settings.DB_POOL_MAX_SIZE} соединений на воркер"
+    server.log.info(f"✓ Воркеров: {workers}, {pool}")
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,77 @@
+import asyncio
+import time
+
+from prometheus_client import Gauge
+
+import settings
+
+# Под gunicorn — минимум по живым воркерам: 0, если БД не видит хотя бы один
+DB_UP = Gauge('db_up', 'Результат последней фоновой проверки БД (1 — доступна)',
+              multiprocess_mode='livemin')
+
+
+class DatabaseMonitor:
+    """Фоновая проверка БД для /readyz и /health.
+
+    Пробы читают только сохранённый результат и сами в БД не ходят, поэтому
+    частые healthcheck'и не добавляют нагрузки. Результат старше трёх
+    интервалов считается недействительным: значит, проверка зависла.
+    """
+
+    def __init__(self, check, interval=settings.HEALTH_CHECK_INTERVAL,
+                 timeout=settings.HEALTH_CHECK_TIMEOUT):
+        self.check = check
+        self.interval = interval
+        self.timeout = timeout
+        self.ok = False
+        self.error = "проверка ещё не выполнялась"
+        self.latency_ms = None
+        self.checked_at = None
+        self._task = None
+
+    async def check_once(self):
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(self.check(), self.timeout)
+        except Exception as e:
+            self.ok = False
+            self.error = str(e) or type(e).__name__
+        else:
+            self.ok = True
+            self.error = None
+        self.latency_ms = round((time.monotonic() - started) * 1000, 1)
+        self.checked_at = time.monotonic()
+        DB_UP.set(1 if self.ok else 0)
+
+    async def _run(self):
+        while True:
+            await self.check_once()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    @property
+    def ready(self):
+        if not self.ok or self.checked_at is None:
+            return False
+        return time.monotonic() - self.checked_at <= 3 * self.interval
+
+    def status(self):
+        age = None if self.checked_at is None else round(time.monotonic() - self.checked_at, 1)
+        return {
+            "database": "connected" if self.ready else "unavailable",
+            "error": None if self.ready else (self.error or "результат проверки устарел"),
+            "latency_ms": self.latency_ms,
+            "checked_ago_s": age,
+        }
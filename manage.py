@@ -0,0 +1,196 @@
+"""Служебные команды: python manage.py <команда> --help"""
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta
+
+import psycopg2
+
+import migrate
+import partitions
+import settings
+import transfer
+
+
+def connect(wait=0):
+    """Подключение к БД; до wait секунд ждём, пока Postgres поднимется"""
+    deadline = time.monotonic() + wait
+    while True:
+        try:
+            return psycopg2.connect(settings.DATABASE_URL, connect_timeout=settings.DB_CONNECT_TIMEOUT)
+        except psycopg2.OperationalError as e:
+            if time.monotonic() >= deadline:
+                raise
+            print(f"✗ БД недоступна, ждём: {e}")
+            time.sleep(2)
+
+
+def cmd_migrate(args):
+    conn = connect(args.wait)
+    try:
+        if args.status:
+            for migration, applied in migrate.status(conn):
+                mark = "✓" if applied else " "
+                print(f"[{mark}] {migration.version:04d}_{migration.name}")
+            return
+        applied = migrate.migrate(conn, target=args.target)
+        print(f"✓ Применено миграций: {len(applied)}")
+    finally:
+        conn.close()
+
+
+# Фактические счётчики по todos и todos_archive (user_id 0 — задачи без пользователя)
+ACTUAL_STATS = '''
+    SELECT user_id, sum(total) AS total, sum(completed) AS completed, sum(archived) AS archived
+    FROM (
+        SELECT COALESCE(user_id, 0) AS user_id, 1 AS total, completed::int AS completed, 0 AS archived
+        FROM todos
+        UNION ALL
+        SELECT COALESCE(user_id, 0), 0, 0, 1
+        FROM todos_archive
+    ) t
+    GROUP BY user_id
+'''
+
+STATS_DRIFT = f'''
+    SELECT COALESCE(a.user_id, s.user_id) AS user_id,
+           s.total AS stored_total, a.total AS actual_total,
+           s.completed AS stored_completed, a.completed AS actual_completed,
+           s.archived AS stored_archived, a.archived AS actual_archived
+    FROM ({ACTUAL_STATS}) a
+    FULL JOIN user_todo_stats s ON s.user_id = a.user_id
+    WHERE (s.total, s.completed, s.archived) IS DISTINCT FROM (a.total, a.completed, a.archived)
+      AND NOT (a.user_id IS NULL AND s.total = 0 AND s.completed = 0 AND s.archived = 0)
+    ORDER BY 1
+'''
+
+
+def cmd_rebuild_stats(args):
+    conn = connect(args.wait)
+    try:
+        with conn:
+            with conn.cursor() as cursor:
+                # Запись в todos и архив ждёт окончания пересчёта, чтение не блокируется
+                cursor.execute('LOCK TABLE todos, todos_archive IN SHARE MODE')
+                cursor.execute(STATS_DRIFT)
+                drift = cursor.fetchall()
+                for (user_id, stored_total, actual_total, stored_completed, actual_completed,
+                     stored_archived, actual_archived) in drift:
+                    print(f"✗ user {user_id}: total {stored_total} → {actual_total}, "
+                          f"completed {stored_completed} → {actual_completed}, "
+                          f"archived {stored_archived} → {actual_archived}")
+                if args.check:
+                    print(f"Расхождений: {len(drift)}")
+                    return 1 if drift else 0
+
+                cursor.execute('DELETE FROM user_todo_stats')
+                cursor.execute(
+                    f'INSERT INTO user_todo_stats (user_id, total, completed, archived) {ACTUAL_STATS}'
+                )
+                print(f"✓ Счётчики пересобраны, исправлено расхождений: {len(drift)}")
+    finally:
+        conn.close()
+
+
+def cmd_partitions(args):
+    conn = connect(args.wait)
+    try:
+        created = partitions.create_partitions(conn, args.ahead)
+    finally:
+        conn.close()
+    for name in created:
+        print(f"→ {name}")
+    print(f"✓ Создано секций todos: {len(created)}")
+
+
+def cmd_archive(args):
+    before = datetime.now() - timedelta(days=args.older_than)
+    conn = connect(args.wait)
+    try:
+        result = partitions.archive(conn, before)
+    finally:
+        conn.close()
+    print(f"✓ Архив до {before:%Y-%m-%d %H:%M}: секций перенесено {len(result['attached'])}, "
+          f"задач перенесено построчно {result['rows']}, пустых секций удалено {len(result['dropped'])}")
+
+
+def cmd_export(args):
+    conn = connect(args.wait)
+    try:
+        if args.output == '-':
+            transfer.export_to_file(conn, args.table, args.format, sys.stdout.buffer)
+        else:
+            with open(args.output, 'wb') as f:
+                transfer.export_to_file(conn, args.table, args.format, f)
+            print(f"✓ {args.table} выгружена в {args.output}")
+    finally:
+        conn.close()
+
+
+def cmd_import(args):
+    conn = connect(args.wait)
+    try:
+        if args.input == '-':
+            result = transfer.import_from_file(conn, args.table, args.format, sys.stdin.buffer,
+                                               args.on_conflict)
+        else:
+            with open(args.input, 'rb') as f:
+                result = transfer.import_from_file(conn, args.table, args.format, f, args.on_conflict)
+    except (transfer.InvalidData, psycopg2.DataError, psycopg2.IntegrityError) as e:
+        print(f"✗ Загрузка отменена: {str(e).strip()}")
+        return 1
+    finally:
+        conn.close()
+    print(f"✓ {args.table}: прочитано строк {result['received']}, записано {result['merged']}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('migrate', help="применить миграции схемы БД")
+    p.add_argument('--status', action='store_true', help="только показать применённые миграции")
+    p.add_argument('--target', type=int, help="применить миграции до этой версии включительно")
+    p.add_argument('--wait', type=float, default=30, help="сколько секунд ждать доступности БД")
+    p.set_defaults(func=cmd_migrate)
+
+    p = commands.add_parser('rebuild-stats', help="пересчитать user_todo_stats по таблице todos")
+    p.add_argument('--check', action='store_true', help="только показать расхождения")
+    p.add_argument('--wait', type=float, default=30, help="сколько секунд ждать доступности БД")
+    p.set_defaults(func=cmd_rebuild_stats)
+
+    p = commands.add_parser('partitions', help="создать месячные секции todos наперёд")
+    p.add_argument('--ahead', type=int, default=settings.TODO_PARTITIONS_AHEAD,
+                   help="на сколько месяцев вперёд от текущего")
+    p.add_argument('--wait', type=float, default=30, help="сколько секунд ждать доступности БД")
+    p.set_defaults(func=cmd_partitions)
+
+    p = commands.add_parser('archive', help="перенести старые завершённые задачи в todos_archive")
+    p.add_argument('--older-than', type=int, default=settings.TODO_ARCHIVE_AFTER_DAYS,
+                   help="возраст задачи (created_at) в днях")
+    p.add_argument('--wait', type=float, default=30, help="сколько секунд ждать доступности БД")
+    p.set_defaults(func=cmd_archive)
+
+    p = commands.add_parser('export', help="выгрузить таблицу через COPY")
+    p.add_argument('table', choices=sorted(transfer.TABLES))
+    p.add_argument('--format', choices=transfer.FORMATS, default='csv')
+    p.add_argument('--output', '-o', default='-', help="файл (по умолчанию stdout)")
+    p.add_argument('--wait', type=float, default=30, help="сколько секунд ждать доступности БД")
+    p.set_defaults(func=cmd_export)
+
+    p = commands.add_parser('import', help="загрузить таблицу через COPY и временную таблицу")
+    p.add_argument('table', choices=sorted(transfer.TABLES))
+    p.add_argument('input', nargs='?', default='-', help="файл (по умолчанию stdin)")
+    p.add_argument('--format', choices=transfer.FORMATS, default='csv')
+    p.add_argument('--on-conflict', choices=transfer.CONFLICTS, default='skip',
+                   help="строки с существующим id: пропустить или обновить")
+    p.add_argument('--wait', type=float, default=30, help="сколько секунд ждать доступности БД")
+    p.set_defaults(func=cmd_import)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,486 @@
+"""Хранилище в памяти процесса (STORAGE_BACKEND=memory).
+
+Те же операции storage.Storage, что у repository.Repository, без сетевых
+запросов: для тестов, бенчмарков и небольших установок, где данных мало
+и БД не нужна.
+Записи — объекты со __slots__; задачи проиндексированы по id, по
+(created_at, id) и по пользователю, счётчики статистики обновляются при
+каждой записи, как user_todo_stats в Postgres. Все операции синхронны
+внутри событийного цикла и потому атомарны без блокировок.
+
+Сводки для /stats/timeseries — словари (user_id, начало интервала) ->
+[создано, завершено], по пользователям и общие (user_id None); как
+таблицы todo_rollup_* в Postgres, удаление задач их не уменьшает.
+
+Снимок (STORAGE_SNAPSHOT_PATH) — JSON-файл со всеми пользователями,
+задачами и сводками: читается при open(), пишется периодически, если были изменения,
+и при close(). Файл заменяется атомарно (запись во временный и rename).
+"""
+import asyncio
+import logging
+import os
+import re
+import time
+from bisect import bisect_left, insort
+from datetime import datetime
+
+import orjson
+from prometheus_client import Histogram
+
+import settings
+from pagination import decode_cursor
+from serialization import dumps
+from storage import BUCKETS, Storage, UniqueViolation, bucket_start
+
+TODO_COLUMNS = ['id', 'user_id', 'task', 'completed', 'created_at', 'completed_at']
+USER_COLUMNS = ['id', 'name', 'email', 'created_at']
+# Как в триггерах 0005: крупный оператор даёт события todo.bulk по пользователям
+EVENT_ROWS_LIMIT = 100
+
+SNAPSHOT_SECONDS = Histogram(
+    'memory_snapshot_seconds', 'Запись снимка хранилища в памяти',
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+
+log = logging.getLogger('memory_storage')
+
+_WORD = re.compile(r'\w+')
+
+
+class UserRecord:
+    __slots__ = ('id', 'name', 'email', 'created_at')
+
+    def __init__(self, id, name, email, created_at):
+        self.id = id
+        self.name = name
+        self.email = email
+        self.created_at = created_at
+
+    def as_dict(self):
+        return {'id': self.id, 'name': self.name, 'email': self.email,
+                'created_at': str(self.created_at)}
+
+
+class TodoRecord:
+    __slots__ = ('id', 'user_id', 'task', 'completed', 'created_at', 'completed_at')
+
+    def __init__(self, id, user_id, task, completed, created_at, completed_at=None):
+        self.id = id
+        self.user_id = user_id
+        self.task = task
+        self.completed = completed
+        self.created_at = created_at
+        self.completed_at = completed_at
+
+    @property
+    def key(self):
+        """Ключ сортировки страниц: (created_at, id)"""
+        return (self.created_at, self.id)
+
+    def as_tuple(self):
+        return (self.id, self.user_id, self.task, self.completed, str(self.created_at),
+                str(self.completed_at) if self.completed_at else None)
+
+    def as_dict(self):
+        return dict(zip(TODO_COLUMNS, self.as_tuple()))
+
+
+class MemoryStorage(Storage):
+    """Реализация storage.Storage на словарях и отсортированных списках.
+
+    on_change — необязательный callback(event) с событиями в формате
+    канала changes (migrations/0005): без Postgres их некому прислать.
+    """
+
+    def __init__(self, snapshot_path=settings.STORAGE_SNAPSHOT_PATH,
+                 snapshot_interval=settings.STORAGE_SNAPSHOT_INTERVAL):
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.on_change = None
+        self._task = None
+        self._saved_at = None
+        self._reset()
+
+    def _reset(self):
+        self._users = {}            # id -> UserRecord, в порядке id
+        self._emails = {}           # email -> id
+        self._todos = {}            # id -> TodoRecord
+        self._by_created = []       # отсортированные (created_at, id)
+        self._by_user = {}          # user_id -> отсортированные (created_at, id)
+        self._stats = {}            # user_id (0 — без пользователя) -> [total, completed]
+        self._rollups = {bucket: {} for bucket in BUCKETS}  # (user_id, начало) -> [created, completed]
+        self._next_user_id = 1
+        self._next_todo_id = 1
+        self._changes = 0           # записей с последнего снимка
+
+    # ===== Lifecycle =====
+    async def open(self):
+        if self.snapshot_path and os.path.exists(self.snapshot_path):
+            data = await asyncio.to_thread(_read_snapshot, self.snapshot_path)
+            self._load(data)
+            print(f"✓ Снимок {self.snapshot_path} загружен: "
+                  f"пользователей {len(self._users)}, задач {len(self._todos)}")
+        if self.snapshot_path and self.snapshot_interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._snapshot_loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.snapshot_path and self._changes:
+            await self.snapshot()
+
+    def status(self):
+        return {
+            "database": "memory",
+            "users": len(self._users),
+            "todos": len(self._todos),
+            "snapshot": {"path": self.snapshot_path or None, "saved_at": self._saved_at,
+                         "unsaved_changes": self._changes},
+        }
+
+    async def ping(self):
+        pass
+
+    async def warm_up(self):
+        pass
+
+    # ===== Snapshot =====
+    async def snapshot(self):
+        """Записать снимок в snapshot_path"""
+        started = time.perf_counter()
+        changes = self._changes
+        # Данные собираются в цикле событий (согласованный срез), пишутся в потоке
+        data = {
+            'version': 2,
+            'next_user_id': self._next_user_id,
+            'next_todo_id': self._next_todo_id,
+            'users': [[u.id, u.name, u.email, u.created_at] for u in self._users.values()],
+            'todos': [[t.id, t.user_id, t.task, t.completed, t.created_at, t.completed_at]
+                      for t in self._todos.values()],
+            # Общие ряды (user_id None) восстанавливаются из рядов пользователей
+            'rollups': {
+                bucket: [[user_id, start, *counters] for (user_id, start), counters in rollups.items()
+                         if user_id is not None]
+                for bucket, rollups in self._rollups.items()
+            },
+        }
+        await asyncio.to_thread(_write_snapshot, self.snapshot_path, data)
+        self._changes -= changes
+        self._saved_at = datetime.now().isoformat(sep=' ', timespec='seconds')
+        SNAPSHOT_SECONDS.observe(time.perf_counter() - started)
+
+    async def _snapshot_loop(self):
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            if not self._changes:
+                continue
+            try:
+                await self.snapshot()
+            except OSError as e:
+                log.warning("Снимок %s не записан: %s", self.snapshot_path, e)
+
+    def _load(self, data):
+        self._reset()
+        for id, name, email, created_at in data['users']:
+            self._users[id] = UserRecord(id, name, email, datetime.fromisoformat(created_at))
+            self._emails[email] = id
+        for id, user_id, task, completed, created_at, *rest in data['todos']:
+            # В снимках версии 1 нет completed_at
+            completed_at = datetime.fromisoformat(rest[0]) if rest and rest[0] else None
+            todo = TodoRecord(id, user_id, task, completed, datetime.fromisoformat(created_at), completed_at)
+            self._todos[id] = todo
+            self._by_created.append(todo.key)
+            self._by_user.setdefault(user_id, []).append(todo.key)
+            self._count(todo, 1)
+            if 'rollups' not in data:
+                self._roll(todo.user_id, todo.created_at, 0, 1)
+        for bucket, rows in data.get('rollups', {}).items():
+            for user_id, start, created, completed in rows:
+                start = datetime.fromisoformat(start)
+                for key in ((user_id, start), (None, start)):
+                    counters = self._rollups[bucket].setdefault(key, [0, 0])
+                    counters[0] += created
+                    counters[1] += completed
+        # Индексы сортируются один раз, а не вставкой каждой строки
+        self._by_created.sort()
+        for keys in self._by_user.values():
+            keys.sort()
+        self._next_user_id = data['next_user_id']
+        self._next_todo_id = data['next_todo_id']
+        self._changes = 0
+
+    # ===== Indexes =====
+    def _add_todo(self, todo):
+        self._todos[todo.id] = todo
+        # Новые задачи почти всегда самые свежие: insort дописывает в конец
+        insort(self._by_created, todo.key)
+        insort(self._by_user.setdefault(todo.user_id, []), todo.key)
+        self._count(todo, 1)
+
+    def _remove_todo(self, todo):
+        del self._todos[todo.id]
+        _remove_key(self._by_created, todo.key)
+        user_keys = self._by_user[todo.user_id]
+        _remove_key(user_keys, todo.key)
+        if not user_keys:
+            del self._by_user[todo.user_id]
+        self._count(todo, -1)
+
+    def _count(self, todo, sign):
+        counters = self._stats.setdefault(todo.user_id or 0, [0, 0])
+        counters[0] += sign
+        if todo.completed:
+            counters[1] += sign
+
+    def _roll(self, user_id, moment, index, sign):
+        """Сводки: index 0 — созданные, 1 — завершённые в момент moment"""
+        for bucket, rollups in self._rollups.items():
+            start = bucket_start(moment, bucket)
+            for key in ((user_id or 0, start), (None, start)):
+                rollups.setdefault(key, [0, 0])[index] += sign
+
+    def _emit(self, kind, todos):
+        """События об изменении задач, как у триггеров todo_change_events"""
+        self._changes += len(todos)
+        if self.on_change is None or not todos:
+            return
+        if len(todos) <= EVENT_ROWS_LIMIT:
+            for todo in todos:
+                self.on_change({'type': f'todo.{kind}', 'id': todo.id, 'user_id': todo.user_id,
+                                'task': todo.task[:200], 'completed': todo.completed})
+            return
+        counts = {}
+        for todo in todos:
+            counts[todo.user_id] = counts.get(todo.user_id, 0) + 1
+        for user_id, count in sorted(counts.items(), key=lambda item: item[0] or 0):
+            self.on_change({'type': 'todo.bulk', 'action': kind, 'user_id': user_id, 'count': count})
+
+    # ===== Users =====
+    async def list_users(self):
+        return USER_COLUMNS, [
+            (u.id, u.name, u.email, str(u.created_at)) for u in self._users.values()
+        ]
+
+    async def get_user(self, user_id):
+        user = self._users.get(user_id)
+        return user.as_dict() if user else None
+
+    async def get_user_by_email(self, email):
+        user_id = self._emails.get(email)
+        return self._users[user_id].as_dict() if user_id is not None else None
+
+    async def user_exists(self, user_id):
+        return user_id in self._users
+
+    async def create_user(self, name, email):
+        if email in self._emails:
+            raise UniqueViolation(f"Email {email} уже существует", '23505')
+        user = UserRecord(self._next_user_id, name, email, datetime.now())
+        self._next_user_id += 1
+        self._users[user.id] = user
+        self._emails[email] = user.id
+        self._changes += 1
+        if self.on_change is not None:
+            self.on_change({'type': 'user.created', 'id': user.id, 'user_id': user.id,
+                            'name': name[:200]})
+        return user.id
+
+    # ===== Todos =====
+    async def get_todo(self, todo_id):
+        todo = self._todos.get(todo_id)
+        return todo.as_dict() if todo else None
+
+    async def get_archived_todo(self, todo_id):
+        # Архива у хранилища в памяти нет
+        return None
+
+    def _page(self, after, user_id, limit):
+        """Задачи от новых к старым после ключа after (created_at, id)"""
+        keys = self._by_created if user_id is None else self._by_user.get(user_id, [])
+        end = len(keys)
+        if after is not None:
+            end = bisect_left(keys, after)
+        start = max(0, end - limit)
+        return [self._todos[key[1]] for key in reversed(keys[start:end])]
+
+    async def list_todos(self, limit, after=None, user_id=None, include_archived=False):
+        key = _cursor_key(after)
+        return TODO_COLUMNS, [todo.as_tuple() for todo in self._page(key, user_id, limit)]
+
+    async def stream_todos(self, after=None, user_id=None, include_archived=False):
+        # Порциями по ключу последней строки: записи между порциями не сбивают обход
+        key = _cursor_key(after)
+        while True:
+            todos = self._page(key, user_id, settings.DB_STREAM_BATCH_SIZE)
+            if not todos:
+                return
+            for todo in todos:
+                yield todo.as_dict()
+            key = todos[-1].key
+            await asyncio.sleep(0)
+
+    async def search_todos(self, text, limit, offset=0, user_id=None, completed=None):
+        """Все слова запроса среди слов задачи, а от трёх символов — и подстрока.
+
+        rank — доля слов задачи, совпавших со словами запроса (0 для совпадений
+        только по подстроке); как и в Postgres, ранжируются все совпадения,
+        а листать можно в пределах первых SEARCH_MAX_RESULTS.
+        """
+        words = _WORD.findall(text.lower())
+        substring = text.lower() if len(text) >= 3 else None
+        matches = []
+        for key in reversed(self._by_created):
+            todo = self._todos[key[1]]
+            if user_id is not None and todo.user_id != user_id:
+                continue
+            if completed is not None and todo.completed != completed:
+                continue
+            task = todo.task.lower()
+            task_words = _WORD.findall(task)
+            if words and all(word in task_words for word in words):
+                rank = sum(task_words.count(word) for word in set(words)) / len(task_words)
+            elif substring and substring in task:
+                rank = 0.0
+            else:
+                continue
+            matches.append((rank, todo))
+        matches.sort(key=lambda match: (match[0], match[1].id), reverse=True)
+        end = min(offset + limit, settings.SEARCH_MAX_RESULTS)
+        return TODO_COLUMNS + ['rank'], [
+            (*todo.as_tuple(), rank) for rank, todo in matches[offset:end]
+        ]
+
+    async def create_todo(self, user_id, task, completed):
+        ids = await self.create_todos([(user_id, task, completed)])
+        return ids[0]
+
+    async def update_todo(self, todo_id, task, completed):
+        return todo_id in await self.update_todos([(todo_id, task, completed)])
+
+    async def delete_todo(self, todo_id):
+        todo = self._todos.get(todo_id)
+        if todo is None:
+            return None
+        await self.delete_todos([todo_id])
+        return todo.task
+
+    # ===== Bulk =====
+    async def create_todos(self, items):
+        now = datetime.now()
+        ids, created = [], []
+        for user_id, task, completed in items:
+            if user_id not in self._users:
+                ids.append(None)
+                continue
+            todo = TodoRecord(self._next_todo_id, user_id, task, bool(completed), now,
+                              now if completed else None)
+            self._next_todo_id += 1
+            self._add_todo(todo)
+            self._roll(user_id, now, 0, 1)
+            if completed:
+                self._roll(user_id, now, 1, 1)
+            ids.append(todo.id)
+            created.append(todo)
+        self._emit('created', created)
+        return ids
+
+    async def update_todos(self, items):
+        now = datetime.now()
+        updated = []
+        for todo_id, task, completed in items:
+            todo = self._todos.get(todo_id)
+            if todo is None:
+                continue
+            # Ключи индексов (created_at, id) не меняются — только счётчики
+            self._count(todo, -1)
+            if task is not None:
+                todo.task = task
+            if completed is not None and completed != todo.completed:
+                # Как в repository: время завершения ставится и сбрасывается
+                # только при смене completed
+                if todo.completed_at is not None:
+                    self._roll(todo.user_id, todo.completed_at, 1, -1)
+                todo.completed = completed
+                todo.completed_at = now if completed else None
+                if completed:
+                    self._roll(todo.user_id, now, 1, 1)
+            self._count(todo, 1)
+            updated.append(todo)
+        self._emit('updated', updated)
+        return {todo.id for todo in updated}
+
+    async def delete_todos(self, ids):
+        deleted = []
+        for todo_id in set(ids):
+            todo = self._todos.get(todo_id)
+            if todo is not None:
+                self._remove_todo(todo)
+                deleted.append(todo)
+        deleted.sort(key=lambda todo: todo.id)
+        self._emit('deleted', deleted)
+        return {todo.id for todo in deleted}
+
+    # ===== Stats =====
+    async def get_stats(self, include_archived=False):
+        total = sum(counters[0] for counters in self._stats.values())
+        completed = sum(counters[1] for counters in self._stats.values())
+        stats = {'total': total, 'completed': completed, 'pending': total - completed}
+        if include_archived:
+            stats['archived'] = 0
+        return stats
+
+    async def get_users_stats(self, include_archived=False):
+        columns = ['id', 'name', 'email', 'total_todos', 'completed_todos', 'pending_todos']
+        rows = []
+        for user in self._users.values():
+            total, completed = self._stats.get(user.id, (0, 0))
+            row = (user.id, user.name, user.email, total, completed, total - completed)
+            rows.append((*row, 0) if include_archived else row)
+        if include_archived:
+            columns.append('archived_todos')
+        return columns, rows
+
+    async def get_timeseries(self, bucket, start, end, user_id=None):
+        rollups, step = self._rollups[bucket], BUCKETS[bucket]
+        rows = []
+        while start <= end:
+            created, completed = rollups.get((user_id, start), (0, 0))
+            rows.append((str(start), created, completed))
+            start += step
+        return ['bucket', 'created', 'completed'], rows
+
+
+def _cursor_key(after):
+    """Ключ (created_at, id) из курсора страницы; ValueError, если курсор испорчен"""
+    if not after:
+        return None
+    created_at, todo_id = decode_cursor(after)
+    try:
+        return (datetime.fromisoformat(created_at), todo_id)
+    except ValueError:
+        raise ValueError(f"Некорректный курсор: {after}")
+
+
+def _remove_key(keys, key):
+    index = bisect_left(keys, key)
+    if index < len(keys) and keys[index] == key:
+        del keys[index]
+
+
+def _read_snapshot(path):
+    with open(path, 'rb') as f:
+        return orjson.loads(f.read())
+
+
+def _write_snapshot(path, data):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(dumps(data))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
@@ -0,0 +1,102 @@
+import os
+import re
+from collections import namedtuple
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+# Ключ advisory-блокировки: два одновременных запуска не применят миграции дважды
+LOCK_KEY = 7_300_001
+NO_TRANSACTION_MARK = '-- migrate: no-transaction'
+
+Migration = namedtuple('Migration', 'version name path')
+
+CREATE_TABLE = '''
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+
+def load_migrations(directory=MIGRATIONS_DIR):
+    """Файлы NNNN_name.sql, отсортированные по версии"""
+    migrations = []
+    for filename in os.listdir(directory):
+        match = re.fullmatch(r'(\d+)_(\w+)\.sql', filename)
+        if match:
+            migrations.append(Migration(int(match[1]), match[2], os.path.join(directory, filename)))
+    migrations.sort()
+    versions = [m.version for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"Повторяющиеся версии миграций в {directory}")
+    return migrations
+
+
+def split_statements(sql):
+    """Разбить скрипт на команды по ';' в конце строки (для no-transaction миграций)"""
+    statements = re.split(r';\s*$', sql, flags=re.MULTILINE)
+    return [s.strip() for s in statements if re.sub(r'--.*', '', s).strip()]
+
+
+def applied_versions(cursor):
+    cursor.execute('SELECT version FROM schema_migrations')
+    return {row[0] for row in cursor.fetchall()}
+
+
+def apply_migration(cursor, migration):
+    with open(migration.path) as f:
+        sql = f.read()
+
+    if NO_TRANSACTION_MARK in sql:
+        # Например, CREATE INDEX CONCURRENTLY: каждая команда в своей транзакции,
+        # поэтому такие миграции обязаны быть идемпотентными
+        for statement in split_statements(sql):
+            cursor.execute(statement)
+        cursor.execute(
+            'INSERT INTO schema_migrations (version, name) VALUES (%s, %s)',
+            (migration.version, migration.name)
+        )
+        return
+
+    cursor.execute('BEGIN')
+    try:
+        cursor.execute(sql)
+        cursor.execute(
+            'INSERT INTO schema_migrations (version, name) VALUES (%s, %s)',
+            (migration.version, migration.name)
+        )
+        cursor.execute('COMMIT')
+    except Exception:
+        cursor.execute('ROLLBACK')
+        raise
+
+
+def migrate(conn, target=None, log=print):
+    """Применить все ещё не применённые миграции (до версии target включительно)"""
+    conn.autocommit = True
+    applied = []
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_lock(%s)', (LOCK_KEY,))
+        try:
+            cursor.execute(CREATE_TABLE)
+            done = applied_versions(cursor)
+            for migration in load_migrations():
+                if migration.version in done:
+                    continue
+                if target is not None and migration.version > target:
+                    break
+                log(f"→ {migration.version:04d}_{migration.name}")
+                apply_migration(cursor, migration)
+                applied.append(migration)
+        finally:
+            cursor.execute('SELECT pg_advisory_unlock(%s)', (LOCK_KEY,))
+    return applied
+
+
+def status(conn):
+    """[(миграция, применена ли)] по всем известным миграциям"""
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute(CREATE_TABLE)
+        done = applied_versions(cursor)
+    return [(migration, migration.version in done) for migration in load_migrations()]
@@ -1,4 +1,4 @@
--- schema.sql
+-- 0001: пользователи и задачи
 CREATE TABLE IF NOT EXISTS users (
     id SERIAL PRIMARY KEY,
     name TEXT NOT NULL,
@@ -0,0 +1,21 @@
+-- 0002: индексы под горячие запросы к todos
+-- migrate: no-transaction
+-- Индексы строятся CONCURRENTLY, чтобы не блокировать запись в большую таблицу.
+-- Каждая команда выполняется отдельно; IF NOT EXISTS позволяет перезапуск.
+
+UPDATE todos SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL;
+
+ALTER TABLE todos ALTER COLUMN created_at SET NOT NULL;
+
+-- GET /todos: ORDER BY created_at DESC, id DESC + keyset
+CREATE INDEX CONCURRENTLY IF NOT EXISTS todos_created_at_id_idx
+    ON todos (created_at DESC, id DESC);
+
+-- GET /todos/user/{id}: WHERE user_id = ... ORDER BY created_at DESC, id DESC;
+-- он же обслуживает JOIN по todos.user_id в /stats/users
+CREATE INDEX CONCURRENTLY IF NOT EXISTS todos_user_created_at_id_idx
+    ON todos (user_id, created_at DESC, id DESC);
+
+-- Незавершённые задачи: обычно это малая часть таблицы
+CREATE INDEX CONCURRENTLY IF NOT EXISTS todos_pending_user_created_at_idx
+    ON todos (user_id, created_at DESC) WHERE NOT completed;
@@ -0,0 +1,83 @@
+-- 0003: счётчики задач по пользователям, поддерживаемые триггерами
+-- /stats и /stats/users читают их вместо агрегации всей таблицы todos.
+
+UPDATE todos SET completed = FALSE WHERE completed IS NULL;
+ALTER TABLE todos ALTER COLUMN completed SET NOT NULL;
+
+-- Не даём писать в todos, пока создаём триггеры и заполняем счётчики
+LOCK TABLE todos IN SHARE ROW EXCLUSIVE MODE;
+
+-- user_id = 0 — задачи без пользователя (todos.user_id IS NULL)
+CREATE TABLE IF NOT EXISTS user_todo_stats (
+    user_id INTEGER PRIMARY KEY,
+    total BIGINT NOT NULL DEFAULT 0,
+    completed BIGINT NOT NULL DEFAULT 0
+);
+
+-- Триггеры уровня оператора: многострочный INSERT/UPDATE/DELETE
+-- обновляет каждую строку счётчиков один раз, а не на каждую задачу.
+-- Строки счётчиков блокируются в порядке user_id, чтобы не ловить deadlock.
+CREATE OR REPLACE FUNCTION user_todo_stats_apply() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO user_todo_stats AS s (user_id, total, completed)
+        SELECT COALESCE(user_id, 0), count(*), count(*) FILTER (WHERE completed)
+        FROM new_rows
+        GROUP BY 1
+        ORDER BY 1
+        ON CONFLICT (user_id) DO UPDATE
+            SET total = s.total + EXCLUDED.total,
+                completed = s.completed + EXCLUDED.completed;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO user_todo_stats AS s (user_id, total, completed)
+        SELECT COALESCE(user_id, 0), -count(*), -count(*) FILTER (WHERE completed)
+        FROM old_rows
+        GROUP BY 1
+        ORDER BY 1
+        ON CONFLICT (user_id) DO UPDATE
+            SET total = s.total + EXCLUDED.total,
+                completed = s.completed + EXCLUDED.completed;
+    ELSE
+        INSERT INTO user_todo_stats AS s (user_id, total, completed)
+        SELECT user_id, sum(total), sum(completed)
+        FROM (
+            SELECT COALESCE(user_id, 0) AS user_id, 1 AS total, completed::int AS completed
+            FROM new_rows
+            UNION ALL
+            SELECT COALESCE(user_id, 0), -1, -completed::int
+            FROM old_rows
+        ) d
+        GROUP BY user_id
+        HAVING sum(total) <> 0 OR sum(completed) <> 0
+        ORDER BY user_id
+        ON CONFLICT (user_id) DO UPDATE
+            SET total = s.total + EXCLUDED.total,
+                completed = s.completed + EXCLUDED.completed;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS todos_stats_insert ON todos;
+CREATE TRIGGER todos_stats_insert
+    AFTER INSERT ON todos
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION user_todo_stats_apply();
+
+DROP TRIGGER IF EXISTS todos_stats_update ON todos;
+CREATE TRIGGER todos_stats_update
+    AFTER UPDATE ON todos
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION user_todo_stats_apply();
+
+DROP TRIGGER IF EXISTS todos_stats_delete ON todos;
+CREATE TRIGGER todos_stats_delete
+    AFTER DELETE ON todos
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION user_todo_stats_apply();
+
+TRUNCATE user_todo_stats;
+INSERT INTO user_todo_stats (user_id, total, completed)
+SELECT COALESCE(user_id, 0), count(*), count(*) FILTER (WHERE completed)
+FROM todos
+GROUP BY 1;
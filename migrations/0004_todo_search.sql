@@ -0,0 +1,15 @@
+-- 0004: индексы поиска по тексту задач (GET /todos/search)
+-- migrate: no-transaction
+-- Индексы строятся CONCURRENTLY; команды идемпотентны, миграцию можно перезапустить.
+
+-- pg_trgm входит в contrib (есть в официальном образе postgres)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Полнотекстовый поиск по словам; конфигурация simple — без стемминга,
+-- одинаково для русского и английского текста
+CREATE INDEX CONCURRENTLY IF NOT EXISTS todos_task_fts_idx
+    ON todos USING gin (to_tsvector('simple', task));
+
+-- Поиск подстроки: task ILIKE '%...%' от трёх символов
+CREATE INDEX CONCURRENTLY IF NOT EXISTS todos_task_trgm_idx
+    ON todos USING gin (task gin_trgm_ops);
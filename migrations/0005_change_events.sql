@@ -0,0 +1,99 @@
+-- 0005: события об изменениях users и todos через NOTIFY (канал changes)
+-- API слушает канал и раздаёт события подписчикам GET /events.
+-- NOTIFY уходит только при COMMIT, поэтому подписчики не видят откатившихся записей.
+
+-- Триггеры уровня оператора, как у user_todo_stats. Оператор, затронувший
+-- до 100 строк, даёт событие на строку; более крупный — одно событие
+-- todo.bulk на каждого затронутого пользователя, чтобы не забить очередь
+-- NOTIFY. Текст задачи обрезается: полезная нагрузка NOTIFY — до 8000 байт.
+-- SET LOCAL app.change_events = 'off' отключает события в транзакции
+-- (например, при загрузке файла через COPY).
+CREATE OR REPLACE FUNCTION todo_change_event(kind TEXT, t todos) RETURNS void AS $$
+    SELECT pg_notify('changes', json_build_object(
+        'type', 'todo.' || kind,
+        'id', t.id,
+        'user_id', t.user_id,
+        'task', left(t.task, 200),
+        'completed', t.completed
+    )::text)
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION todo_bulk_event(kind TEXT, user_id INTEGER, affected BIGINT) RETURNS void AS $$
+    SELECT pg_notify('changes', json_build_object(
+        'type', 'todo.bulk',
+        'action', kind,
+        'user_id', user_id,
+        'count', affected
+    )::text)
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION todo_change_events() RETURNS trigger AS $$
+DECLARE
+    affected BIGINT;
+BEGIN
+    IF current_setting('app.change_events', true) = 'off' THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP = 'DELETE' THEN
+        SELECT count(*) INTO affected FROM old_rows;
+        IF affected <= 100 THEN
+            PERFORM todo_change_event('deleted', o) FROM old_rows o ORDER BY o.id;
+        ELSE
+            PERFORM todo_bulk_event('deleted', user_id, count(*))
+            FROM old_rows GROUP BY user_id ORDER BY user_id;
+        END IF;
+    ELSE
+        SELECT count(*) INTO affected FROM new_rows;
+        IF affected <= 100 THEN
+            PERFORM todo_change_event(CASE TG_OP WHEN 'INSERT' THEN 'created' ELSE 'updated' END, n)
+            FROM new_rows n ORDER BY n.id;
+        ELSE
+            PERFORM todo_bulk_event(CASE TG_OP WHEN 'INSERT' THEN 'created' ELSE 'updated' END,
+                                    user_id, count(*))
+            FROM new_rows GROUP BY user_id ORDER BY user_id;
+        END IF;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION user_change_events() RETURNS trigger AS $$
+BEGIN
+    IF current_setting('app.change_events', true) = 'off' THEN
+        RETURN NULL;
+    END IF;
+    PERFORM pg_notify('changes', json_build_object(
+        'type', 'user.created',
+        'id', id,
+        'user_id', id,
+        'name', left(name, 200)
+    )::text)
+    FROM (SELECT * FROM new_rows ORDER BY id LIMIT 100) AS created;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS todos_events_insert ON todos;
+CREATE TRIGGER todos_events_insert
+    AFTER INSERT ON todos
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION todo_change_events();
+
+DROP TRIGGER IF EXISTS todos_events_update ON todos;
+CREATE TRIGGER todos_events_update
+    AFTER UPDATE ON todos
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION todo_change_events();
+
+DROP TRIGGER IF EXISTS todos_events_delete ON todos;
+CREATE TRIGGER todos_events_delete
+    AFTER DELETE ON todos
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION todo_change_events();
+
+DROP TRIGGER IF EXISTS users_events_insert ON users;
+CREATE TRIGGER users_events_insert
+    AFTER INSERT ON users
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION user_change_events();
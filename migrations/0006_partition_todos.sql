@@ -0,0 +1,143 @@
+-- 0006: todos секционирована по месяцам created_at, старые завершённые задачи — в todos_archive
+-- Горячие запросы (страницы задач, задачи пользователя) читают только живые
+-- секции; архив читается, только если его явно попросили (include_archived).
+-- Секции на будущие месяцы создаёт manage.py partitions, перенос в архив —
+-- manage.py archive.
+
+-- Запись в todos ждёт окончания миграции
+LOCK TABLE todos IN ACCESS EXCLUSIVE MODE;
+
+-- Последовательность id переходит к новой таблице: иначе её удалит DROP старой
+ALTER SEQUENCE todos_id_seq OWNED BY NONE;
+ALTER TABLE todos RENAME TO todos_unpartitioned;
+
+-- Первичный ключ секционированной таблицы обязан включать ключ секционирования;
+-- уникальность id по-прежнему обеспечивает последовательность
+CREATE TABLE todos (
+    id INTEGER NOT NULL DEFAULT nextval('todos_id_seq'),
+    user_id INTEGER REFERENCES users(id),
+    task TEXT NOT NULL,
+    completed BOOLEAN NOT NULL DEFAULT FALSE,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+ALTER SEQUENCE todos_id_seq OWNED BY todos.id;
+
+-- Строки за месяцы без своей секции (например, из загруженного файла)
+CREATE TABLE todos_default PARTITION OF todos DEFAULT;
+
+-- Архив: те же колонки и те же месячные секции, поэтому целиком завершённая
+-- секция todos переезжает в архив через DETACH/ATTACH, без копирования строк
+CREATE TABLE todos_archive (
+    id INTEGER NOT NULL,
+    user_id INTEGER,
+    task TEXT NOT NULL,
+    completed BOOLEAN NOT NULL,
+    created_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+CREATE TABLE todos_archive_default PARTITION OF todos_archive DEFAULT;
+
+-- Секция <parent>_pYYYYMM за месяц month; NULL, если она уже есть.
+-- Строки этого месяца, попавшие в секцию по умолчанию, переносятся в новую.
+CREATE OR REPLACE FUNCTION create_todo_partition(parent TEXT, month DATE) RETURNS TEXT AS $$
+DECLARE
+    start_at TIMESTAMP := date_trunc('month', month);
+    end_at TIMESTAMP := date_trunc('month', month) + INTERVAL '1 month';
+    partition TEXT := parent || '_p' || to_char(month, 'YYYYMM');
+BEGIN
+    IF to_regclass(partition) IS NOT NULL THEN
+        RETURN NULL;
+    END IF;
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS)', partition, parent);
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM %I WHERE created_at >= %L AND created_at < %L RETURNING *) '
+        'INSERT INTO %I SELECT * FROM moved',
+        parent || '_default', start_at, end_at, partition
+    );
+    EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                   parent, partition, start_at, end_at);
+    RETURN partition;
+END
+$$ LANGUAGE plpgsql;
+
+-- Секции за месяцы, где есть задачи, и на три месяца вперёд
+SELECT create_todo_partition('todos', month::date)
+FROM (
+    SELECT DISTINCT date_trunc('month', created_at) AS month FROM todos_unpartitioned
+    UNION
+    SELECT generate_series(date_trunc('month', CURRENT_TIMESTAMP),
+                           date_trunc('month', CURRENT_TIMESTAMP) + INTERVAL '3 months',
+                           INTERVAL '1 month')
+) months
+ORDER BY month;
+
+-- Копирование до индексов и триггеров: индексы строятся один раз,
+-- а счётчики user_todo_stats уже учитывают эти строки
+INSERT INTO todos (id, user_id, task, completed, created_at)
+SELECT id, user_id, task, completed, created_at FROM todos_unpartitioned;
+
+-- todo_change_event (0005) принимает строку старой таблицы: пересоздаём
+-- её для строки новой
+DROP FUNCTION todo_change_event(TEXT, todos_unpartitioned);
+DROP TABLE todos_unpartitioned;
+
+CREATE FUNCTION todo_change_event(kind TEXT, t todos) RETURNS void AS $$
+    SELECT pg_notify('changes', json_build_object(
+        'type', 'todo.' || kind,
+        'id', t.id,
+        'user_id', t.user_id,
+        'task', left(t.task, 200),
+        'completed', t.completed
+    )::text)
+$$ LANGUAGE sql;
+
+-- Индексы 0002 и 0004 на новой таблице (создаются на каждой секции)
+CREATE INDEX todos_created_at_id_idx ON todos (created_at DESC, id DESC);
+CREATE INDEX todos_user_created_at_id_idx ON todos (user_id, created_at DESC, id DESC);
+CREATE INDEX todos_pending_user_created_at_idx ON todos (user_id, created_at DESC) WHERE NOT completed;
+CREATE INDEX todos_task_fts_idx ON todos USING gin (to_tsvector('simple', task));
+CREATE INDEX todos_task_trgm_idx ON todos USING gin (task gin_trgm_ops);
+-- Поиск задачи по id без created_at: по индексу в каждой секции
+CREATE INDEX todos_id_idx ON todos (id);
+
+-- Те же индексы, что у todos: при переносе секции в архив они переиспользуются
+CREATE INDEX todos_archive_created_at_id_idx ON todos_archive (created_at DESC, id DESC);
+CREATE INDEX todos_archive_user_created_at_id_idx ON todos_archive (user_id, created_at DESC, id DESC);
+CREATE INDEX todos_archive_id_idx ON todos_archive (id);
+
+-- Триггеры 0003 и 0005: на секционированной таблице они срабатывают
+-- по одному разу на оператор, во сколько бы секций он ни попал
+CREATE TRIGGER todos_stats_insert
+    AFTER INSERT ON todos
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION user_todo_stats_apply();
+
+CREATE TRIGGER todos_stats_update
+    AFTER UPDATE ON todos
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION user_todo_stats_apply();
+
+CREATE TRIGGER todos_stats_delete
+    AFTER DELETE ON todos
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION user_todo_stats_apply();
+
+CREATE TRIGGER todos_events_insert
+    AFTER INSERT ON todos
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION todo_change_events();
+
+CREATE TRIGGER todos_events_update
+    AFTER UPDATE ON todos
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION todo_change_events();
+
+CREATE TRIGGER todos_events_delete
+    AFTER DELETE ON todos
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION todo_change_events();
+
+-- Архивные задачи по пользователям: их ведёт manage.py archive,
+-- total и completed по-прежнему считают только todos
+ALTER TABLE user_todo_stats ADD COLUMN archived BIGINT NOT NULL DEFAULT 0;
@@ -0,0 +1,96 @@
+-- 0007: время завершения задач и почасовые/посуточные сводки созданных и завершённых задач
+-- GET /stats/timeseries читает сводки, а не todos: время ответа зависит от
+-- запрошенного интервала, а не от размера таблицы.
+
+-- Не даём писать в todos, пока создаём триггеры и заполняем сводки
+LOCK TABLE todos, todos_archive IN SHARE ROW EXCLUSIVE MODE;
+
+-- Колонка добавляется в обе таблицы последней: порядок колонок todos и
+-- todos_archive должен совпадать (перенос секций и строк в архив, 0006).
+-- У задач, завершённых до этой миграции, время завершения неизвестно: NULL
+ALTER TABLE todos ADD COLUMN completed_at TIMESTAMP;
+ALTER TABLE todos_archive ADD COLUMN completed_at TIMESTAMP;
+
+-- bucket — начало часа или суток; user_id = 0 — задачи без пользователя.
+-- Сводки — история: удаление и архивация задач их не уменьшают
+CREATE TABLE IF NOT EXISTS todo_rollup_hourly (
+    user_id INTEGER NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    created BIGINT NOT NULL DEFAULT 0,
+    completed BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, bucket)
+);
+-- Общий ряд по всем пользователям: интервалы берутся по bucket
+CREATE INDEX IF NOT EXISTS todo_rollup_hourly_bucket_idx ON todo_rollup_hourly (bucket);
+
+CREATE TABLE IF NOT EXISTS todo_rollup_daily (
+    user_id INTEGER NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    created BIGINT NOT NULL DEFAULT 0,
+    completed BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, bucket)
+);
+CREATE INDEX IF NOT EXISTS todo_rollup_daily_bucket_idx ON todo_rollup_daily (bucket);
+
+-- Триггер уровня оператора, как user_todo_stats_apply: новая версия строки
+-- даёт +1, старая (при UPDATE) — -1 к интервалам своих created_at и
+-- completed_at; неизменившиеся строки взаимно сокращаются и не пишутся.
+-- Строки сводок блокируются в порядке ключа, чтобы не ловить deadlock.
+CREATE OR REPLACE FUNCTION todo_rollups_apply() RETURNS trigger AS $$
+DECLARE
+    changes TEXT := 'SELECT user_id, created_at, completed_at, 1 AS sign FROM new_rows';
+    granularity TEXT;
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        changes := changes || ' UNION ALL SELECT user_id, created_at, completed_at, -1 FROM old_rows';
+    END IF;
+    FOREACH granularity IN ARRAY ARRAY['hour', 'day'] LOOP
+        EXECUTE format($sql$
+            INSERT INTO %I AS r (user_id, bucket, created, completed)
+            SELECT user_id, bucket, sum(created), sum(completed)
+            FROM (
+                SELECT COALESCE(user_id, 0) AS user_id, date_trunc(%L, created_at) AS bucket,
+                       sign AS created, 0 AS completed
+                FROM (%s) c
+                UNION ALL
+                SELECT COALESCE(user_id, 0), date_trunc(%L, completed_at), 0, sign
+                FROM (%s) c
+                WHERE completed_at IS NOT NULL
+            ) d
+            GROUP BY 1, 2
+            HAVING sum(created) <> 0 OR sum(completed) <> 0
+            ORDER BY 1, 2
+            ON CONFLICT (user_id, bucket) DO UPDATE
+                SET created = r.created + EXCLUDED.created,
+                    completed = r.completed + EXCLUDED.completed
+        $sql$,
+            CASE granularity WHEN 'hour' THEN 'todo_rollup_hourly' ELSE 'todo_rollup_daily' END,
+            granularity, changes, granularity, changes);
+    END LOOP;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS todos_rollups_insert ON todos;
+CREATE TRIGGER todos_rollups_insert
+    AFTER INSERT ON todos
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION todo_rollups_apply();
+
+DROP TRIGGER IF EXISTS todos_rollups_update ON todos;
+CREATE TRIGGER todos_rollups_update
+    AFTER UPDATE ON todos
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION todo_rollups_apply();
+
+-- Созданные задачи за всю историю, включая архив
+TRUNCATE todo_rollup_hourly, todo_rollup_daily;
+INSERT INTO todo_rollup_hourly (user_id, bucket, created)
+SELECT COALESCE(user_id, 0), date_trunc('hour', created_at), count(*)
+FROM (SELECT user_id, created_at FROM todos UNION ALL SELECT user_id, created_at FROM todos_archive) t
+GROUP BY 1, 2;
+
+INSERT INTO todo_rollup_daily (user_id, bucket, created)
+SELECT user_id, date_trunc('day', bucket), sum(created)
+FROM todo_rollup_hourly
+GROUP BY 1, 2;
@@ -0,0 +1,91 @@
+import base64
+
+from fastapi.responses import StreamingResponse
+
+from serialization import dumps
+
+# Строк в одном куске NDJSON-ответа
+NDJSON_CHUNK_ROWS = 500
+
+
+def encode_cursor(row) -> str:
+    """Курсор keyset-пагинации по (created_at, id) последней строки страницы"""
+    raw = f"{row['created_at']}|{row['id']}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str):
+    """(created_at, id) из курсора; ValueError, если курсор испорчен"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, todo_id = base64.urlsafe_b64decode(padded).decode().rsplit('|', 1)
+        return created_at, int(todo_id)
+    except Exception:
+        raise ValueError(f"Некорректный курсор: {cursor}")
+
+
+def keyset_query(select: str, where: list, params: list, after, limit=None):
+    """Дописать к SELECT условие keyset-пагинации, сортировку и LIMIT.
+
+    Страницы идут от новых задач к старым: (created_at, id) убывают.
+    """
+    where = list(where)
+    params = list(params)
+    if after:
+        where.append('(created_at, id) < (%s::timestamp, %s)')
+        params.extend(decode_cursor(after))
+    query = select
+    if where:
+        query += ' WHERE ' + ' AND '.join(where)
+    # Колонки квалифицированы таблицей: иначе ORDER BY возьмёт выходную колонку
+    # created_at (created_at::text из SELECT) и отсортирует текст без индекса
+    query += ' ORDER BY todos.created_at DESC, todos.id DESC'
+    if limit is not None:
+        query += ' LIMIT %s'
+        params.append(limit)
+    return query, params
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """StreamingResponse, который после ответа закрывает source (aclose).
+
+    Если клиент отключился до начала тела, генератор тела так и не
+    запускается, и без этого серверный курсор и соединение пула остались
+    бы занятыми до сборки мусора.
+    """
+
+    def __init__(self, content, source, **kwargs):
+        super().__init__(content, **kwargs)
+        self.source = source
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.source.aclose()
+
+
+async def ndjson_response(rows):
+    """Потоковый NDJSON-ответ из асинхронного генератора строк.
+
+    Первая строка читается ещё до отправки заголовков, поэтому ошибки
+    подключения и запроса превращаются в обычные HTTP-ошибки.
+    """
+    rows = rows.__aiter__()
+    try:
+        first = await rows.__anext__()
+    except StopAsyncIteration:
+        first = None
+
+    async def body():
+        if first is None:
+            return
+        chunk = [dumps(first)]
+        async for row in rows:
+            chunk.append(dumps(row))
+            if len(chunk) >= NDJSON_CHUNK_ROWS:
+                yield b'\n'.join(chunk) + b'\n'
+                chunk = []
+        yield b'\n'.join(chunk) + b'\n'
+
+    return ClosingStreamingResponse(body(), rows, media_type='application/x-ndjson')
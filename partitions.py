@@ -0,0 +1,211 @@
+"""Месячные секции todos и перенос старых завершённых задач в todos_archive.
+
+Секции называются <таблица>_pYYYYMM и создаются SQL-функцией
+create_todo_partition (migrations/0006). Используется manage.py
+partitions и manage.py archive через соединение psycopg2; каждая
+секция обрабатывается в своей транзакции, чтобы не держать блокировки
+на всё время обслуживания. Секции наперёд создаёт и API
+(Repository.create_partitions раз в TODO_PARTITIONS_INTERVAL), иначе
+долго работающий контейнер писал бы новые месяцы в секцию по умолчанию.
+
+Первичный ключ секционированных таблиц — (id, created_at): уникальность
+одного id в todos и todos_archive БД не проверяет. Её обеспечивают
+пишущие пути: id выдаёт todos_id_seq, перенос в архив перемещает строки,
+а загрузка (transfer.py) сопоставляет строки по id под блокировкой.
+"""
+import re
+from datetime import datetime
+
+import settings
+
+PARTITION_NAME = re.compile(r'(todos|todos_archive)_p(\d{4})(\d{2})')
+# Ключ advisory-блокировки: воркеры API и manage.py partitions не создают
+# одну секцию одновременно (второй дождётся и увидит, что она уже есть)
+LOCK_KEY = 7_300_002
+
+# Одна секция todos за месяц; NULL, если она уже есть
+CREATE_PARTITION = '''
+    SELECT create_todo_partition('todos', %s)
+    FROM (SELECT pg_advisory_xact_lock(%s)) AS locked
+'''
+
+LIST_PARTITIONS = '''
+    SELECT c.relname
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = %s::regclass
+'''
+
+# Секция целиком уходит в архив: счётчики переносятся из total/completed в archived
+ARCHIVE_PARTITION_STATS = '''
+    INSERT INTO user_todo_stats AS s (user_id, total, completed, archived)
+    SELECT COALESCE(user_id, 0), -count(*), -count(*), count(*)
+    FROM {partition}
+    GROUP BY 1
+    ORDER BY 1
+    ON CONFLICT (user_id) DO UPDATE
+        SET total = s.total + EXCLUDED.total,
+            completed = s.completed + EXCLUDED.completed,
+            archived = s.archived + EXCLUDED.archived
+'''
+
+# Построчный перенос: total/completed уменьшит триггер на DELETE из todos
+ARCHIVE_ROWS = '''
+    WITH moved AS (
+        DELETE FROM todos
+        WHERE completed AND created_at >= %s AND created_at < %s
+        RETURNING *
+    ),
+    archived AS (
+        INSERT INTO todos_archive SELECT * FROM moved RETURNING user_id
+    ),
+    counted AS (
+        INSERT INTO user_todo_stats AS s (user_id, archived)
+        SELECT COALESCE(user_id, 0), count(*) FROM archived GROUP BY 1 ORDER BY 1
+        ON CONFLICT (user_id) DO UPDATE SET archived = s.archived + EXCLUDED.archived
+    )
+    SELECT count(*) FROM archived
+'''
+
+# Одно событие вместо todo.deleted на каждую перенесённую задачу (см. 0005)
+ARCHIVE_EVENT = "SELECT pg_notify('changes', json_build_object('type', 'archive', 'table', 'todos')::text)"
+
+
+def month_start(moment):
+    return datetime(moment.year, moment.month, 1)
+
+
+def next_month(month):
+    return datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def partitions(cursor, parent):
+    """{первое число месяца: имя секции} у parent, без секции по умолчанию"""
+    cursor.execute(LIST_PARTITIONS, (parent,))
+    found = {}
+    for (name,) in cursor.fetchall():
+        match = PARTITION_NAME.fullmatch(name)
+        if match and match[1] == parent:
+            found[datetime(int(match[2]), int(match[3]), 1)] = name
+    return found
+
+
+def months_ahead(ahead, now=None):
+    """Первые числа месяцев: текущего и ahead следующих"""
+    months = [month_start(now or datetime.now())]
+    for _ in range(ahead):
+        months.append(next_month(months[-1]))
+    return months
+
+
+def create_partitions(conn, ahead=settings.TODO_PARTITIONS_AHEAD, now=None):
+    """Секции todos с текущего месяца на ahead месяцев вперёд; имена созданных"""
+    created = []
+    for month in months_ahead(ahead, now):
+        with conn:
+            with conn.cursor() as cursor:
+                cursor.execute(CREATE_PARTITION, (month.date(), LOCK_KEY))
+                name = cursor.fetchone()[0]
+        if name:
+            created.append(name)
+    return created
+
+
+def _attach_to_archive(conn, name, month):
+    """Перевесить секцию todos в todos_archive без копирования строк.
+
+    False (и ничего не меняется), если в секции есть незавершённые задачи.
+    """
+    try:
+        with conn.cursor() as cursor:
+            # DETACH держит todos заблокированной до COMMIT: пока проверяем
+            # и считаем строки секции, их никто не изменит
+            cursor.execute(f'ALTER TABLE todos DETACH PARTITION {name}')
+            cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {name} WHERE NOT completed)')
+            if cursor.fetchone()[0]:
+                conn.rollback()
+                return False
+            cursor.execute(ARCHIVE_PARTITION_STATS.format(partition=name))
+            archive_name = f'todos_archive_p{month:%Y%m}'
+            cursor.execute(f'ALTER TABLE {name} RENAME TO {archive_name}')
+            cursor.execute(
+                f'ALTER TABLE todos_archive ATTACH PARTITION {archive_name} FOR VALUES FROM (%s) TO (%s)',
+                (month, next_month(month))
+            )
+            cursor.execute(ARCHIVE_EVENT)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return True
+
+
+def _archive_rows(conn, start, end):
+    """Перенести завершённые задачи из [start, end) в архив; сколько перенесено"""
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SET LOCAL app.change_events = 'off'")
+            cursor.execute('SELECT create_todo_partition(%s, %s)', ('todos_archive', start.date()))
+            cursor.execute(ARCHIVE_ROWS, (start, end))
+            moved = cursor.fetchone()[0]
+            if moved:
+                cursor.execute(ARCHIVE_EVENT)
+    return moved
+
+
+def _drop_if_empty(conn, name):
+    """Отсоединить и удалить опустевшую секцию todos; True, если удалена"""
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE todos DETACH PARTITION {name}')
+            cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {name})')
+            if cursor.fetchone()[0]:
+                conn.rollback()
+                return False
+            cursor.execute(f'DROP TABLE {name}')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return True
+
+
+def archive(conn, before, log=print):
+    """Перенести в todos_archive завершённые задачи, созданные раньше before.
+
+    Секции, целиком лежащие до before и без незавершённых задач, переезжают
+    в архив через DETACH/ATTACH; из остальных завершённые задачи переносятся
+    построчно, по месяцу за транзакцию; опустевшие старые секции удаляются.
+    Незавершённые задачи остаются в todos, сколько бы им ни было лет.
+    """
+    with conn:
+        with conn.cursor() as cursor:
+            live = partitions(cursor, 'todos')
+            archived = partitions(cursor, 'todos_archive')
+
+    result = {"attached": [], "rows": 0, "dropped": []}
+    for month, name in sorted(live.items()):
+        if next_month(month) <= before and month not in archived:
+            if _attach_to_archive(conn, name, month):
+                log(f"→ {name} перенесена в архив целиком")
+                result["attached"].append(name)
+                del live[month]
+
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT DISTINCT date_trunc('month', created_at) FROM todos "
+                "WHERE completed AND created_at < %s ORDER BY 1",
+                (before,)
+            )
+            months = [row[0] for row in cursor.fetchall()]
+    for month in months:
+        moved = _archive_rows(conn, month, min(next_month(month), before))
+        log(f"→ {month:%Y-%m}: перенесено задач {moved}")
+        result["rows"] += moved
+
+    for month, name in sorted(live.items()):
+        if next_month(month) <= before and _drop_if_empty(conn, name):
+            log(f"→ {name} опустела и удалена")
+            result["dropped"].append(name)
+    return result
@@ -0,0 +1,417 @@
+"""Все SQL-запросы приложения: реализация storage.Storage на Postgres.
+
+Каждый метод — один запрос к БД (один round trip): записи сделаны одним
+оператором с RETURNING, а отсутствие строки или нарушение внешнего ключа
+возвращается как None/False, без предварительного SELECT. У каждого
+запроса есть имя, под которым он подготавливается на сервере.
+"""
+import asyncio
+import logging
+from datetime import datetime
+
+import db
+import partitions
+import settings
+from pagination import keyset_query
+from storage import ForeignKeyViolation, Storage
+
+TODO_COLUMNS = 'id, user_id, task, completed, created_at::text, completed_at::text'
+TODO_SELECT = f'SELECT {TODO_COLUMNS} FROM todos'
+# Живые задачи вместе с архивом (todos_archive). Подзапрос назван todos,
+# поэтому условия и сортировка keyset_query подходят без изменений
+TODO_SELECT_WITH_ARCHIVE = (
+    f'SELECT {TODO_COLUMNS} FROM (SELECT * FROM todos UNION ALL SELECT * FROM todos_archive) AS todos'
+)
+# Сводки созданных и завершённых задач (migrations/0007) по размеру интервала
+ROLLUP_TABLES = {'hour': 'todo_rollup_hourly', 'day': 'todo_rollup_daily'}
+
+log = logging.getLogger('repository')
+
+
+class Repository(Storage):
+    """Записи идут в database, чтения — в reader (по умолчанию туда же).
+
+    reader — обычно db.ReplicaSet: чтения с реплик, а при read-your-writes
+    или недоступности реплик — с primary.
+
+    Пока хранилище открыто, раз в partitions_interval секунд (0 — никогда)
+    создаются секции todos наперёд.
+    """
+
+    def __init__(self, database, reader=None, partitions_interval=settings.TODO_PARTITIONS_INTERVAL):
+        self.db = database
+        self.reader = reader or database
+        self.partitions_interval = partitions_interval
+        self._task = None
+
+    async def open(self):
+        # Цикл секций запускается до открытия пула: если БД пока недоступна,
+        # он повторит попытку сам
+        if self.partitions_interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._partitions_loop())
+        await self.db.open()
+        if self.reader is not self.db:
+            await self.reader.open()
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.reader is not self.db:
+            await self.reader.close()
+        await self.db.close()
+
+    def status(self):
+        status = {"database": "connected", "pool": self.db.stats()}
+        if self.reader is not self.db:
+            status["replicas"] = self.reader.stats()
+        return status
+
+    async def ping(self):
+        await self.db.fetch_one('SELECT 1', name='ping')
+
+    async def warm_up(self):
+        """Подготовить самые частые запросы на соединении пула.
+
+        Выполняются чтения, которые ничего не находят и не меняют: id 0 не
+        бывает, а stats_total читает одну строку сводки. Заодно первый
+        запрос не платит за PREPARE.
+        """
+        await self.ping()
+        await self.get_user(0)
+        await self.user_exists(0)
+        await self.get_todo(0)
+        await self.list_todos(1)
+        await self.get_stats()
+
+    # ===== Partitions =====
+    async def create_partitions(self, ahead=settings.TODO_PARTITIONS_AHEAD):
+        """Секции todos с текущего месяца на ahead месяцев вперёд; имена созданных.
+
+        Как partitions.create_partitions, но через пул: каждая секция — свой
+        запрос и своя транзакция.
+        """
+        created = []
+        for month in partitions.months_ahead(ahead):
+            row = await self.db.fetch_one(
+                partitions.CREATE_PARTITION, (month.date(), partitions.LOCK_KEY),
+                name='todo_partition_create'
+            )
+            if row['create_todo_partition']:
+                created.append(row['create_todo_partition'])
+        return created
+
+    async def _partitions_loop(self):
+        while True:
+            try:
+                for name in await self.create_partitions():
+                    log.info("Создана секция %s", name)
+            except Exception as e:
+                log.warning("Секции todos не созданы: %s", e)
+            await asyncio.sleep(self.partitions_interval)
+
+    # ===== Users =====
+    async def list_users(self):
+        """(колонки, строки-кортежи) всех пользователей"""
+        return await self.reader.fetch_rows(
+            'SELECT id, name, email, created_at::text FROM users ORDER BY id',
+            name='users_list'
+        )
+
+    async def get_user(self, user_id):
+        return await self.reader.fetch_one(
+            'SELECT id, name, email, created_at::text FROM users WHERE id = %s',
+            (user_id,), name='users_get'
+        )
+
+    async def get_user_by_email(self, email):
+        return await self.reader.fetch_one(
+            'SELECT id, name, email, created_at::text FROM users WHERE email = %s',
+            (email,), name='users_get_by_email'
+        )
+
+    async def user_exists(self, user_id):
+        row = await self.reader.fetch_one(
+            'SELECT EXISTS (SELECT 1 FROM users WHERE id = %s) AS found',
+            (user_id,), name='users_exists'
+        )
+        return row['found']
+
+    async def create_user(self, name, email):
+        """id нового пользователя; storage.UniqueViolation, если email занят"""
+        row = await self.db.fetch_one(
+            'INSERT INTO users (name, email) VALUES (%s, %s) RETURNING id',
+            (name, email), name='users_create'
+        )
+        return row['id']
+
+    # ===== Todos =====
+    async def get_todo(self, todo_id):
+        return await self.reader.fetch_one(
+            f'{TODO_SELECT} WHERE id = %s', (todo_id,), name='todos_get'
+        )
+
+    async def get_archived_todo(self, todo_id):
+        return await self.reader.fetch_one(
+            f'SELECT {TODO_COLUMNS} FROM todos_archive WHERE id = %s', (todo_id,), name='todos_get_archived'
+        )
+
+    async def list_todos(self, limit, after=None, user_id=None, include_archived=False):
+        """Страница задач от новых к старым (keyset по created_at, id):
+        (колонки, строки-кортежи); include_archived — вместе с архивом"""
+        query, params, name = self._todos_query(after, user_id, include_archived, limit)
+        return await self.reader.fetch_rows(query, params, name=name)
+
+    def stream_todos(self, after=None, user_id=None, include_archived=False):
+        """Все задачи от новых к старым через серверный курсор"""
+        query, params, name = self._todos_query(after, user_id, include_archived)
+        return self.reader.stream(query, params, name=name + '_stream')
+
+    def _todos_query(self, after, user_id, include_archived, limit=None):
+        select, where, params, name = TODO_SELECT, [], [], 'todos_page'
+        if include_archived:
+            select = TODO_SELECT_WITH_ARCHIVE
+            name += '_archived'
+        if user_id is not None:
+            where.append('user_id = %s')
+            params.append(user_id)
+            name += '_user'
+        if after:
+            name += '_after'
+        query, params = keyset_query(select, where, params, after, limit)
+        return query, params, name
+
+    async def search_todos(self, text, limit, offset=0, user_id=None, completed=None):
+        """Задачи, подходящие под text, по убыванию релевантности:
+        (колонки, строки-кортежи) с дополнительной колонкой rank.
+
+        Слова ищутся полнотекстово, а от трёх символов ещё и подстрокой
+        (индексы GIN). Ранжируются все совпадения, поэтому первая страница —
+        действительно лучшие; время растёт с числом совпадений (частое слово
+        дороже редкого), но не с размером таблицы. Листать можно только в
+        пределах первых SEARCH_MAX_RESULTS по релевантности.
+        """
+        match = "to_tsvector('simple', task) @@ websearch_to_tsquery('simple', %s)"
+        where, params, name = [], [text], 'todos_search'
+        if len(text) >= 3:
+            where.append(f'({match} OR task ILIKE %s)')
+            params.append('%' + escape_like(text) + '%')
+            name += '_substr'
+        else:
+            where.append(match)
+        if user_id is not None:
+            where.append('user_id = %s')
+            params.append(user_id)
+            name += '_user'
+        if completed is not None:
+            where.append('completed = %s')
+            params.append(completed)
+            name += '_completed'
+
+        query = f'''
+            SELECT {TODO_COLUMNS},
+                   ts_rank(to_tsvector('simple', task), websearch_to_tsquery('simple', %s)) AS rank
+            FROM todos
+            WHERE {' AND '.join(where)}
+            ORDER BY rank DESC, id DESC
+            LIMIT %s OFFSET %s
+        '''
+        limit = max(0, min(limit, settings.SEARCH_MAX_RESULTS - offset))
+        params = [text, *params, limit, offset]
+        return await self.reader.fetch_rows(query, params, name=name)
+
+    async def create_todo(self, user_id, task, completed):
+        """id новой задачи или None, если пользователя нет"""
+        now = datetime.now()
+        try:
+            row = await self.db.fetch_one(
+                'INSERT INTO todos (user_id, task, completed, created_at, completed_at) '
+                'VALUES (%s, %s, %s, %s, %s) RETURNING id',
+                (user_id, task, completed, now, now if completed else None), name='todos_create'
+            )
+        except ForeignKeyViolation:
+            return None
+        return row['id']
+
+    async def update_todo(self, todo_id, task, completed):
+        """True, если задача нашлась и обновлена.
+
+        completed_at ставится, когда задача становится завершённой, и
+        сбрасывается, когда перестаёт; у уже завершённой не меняется.
+        """
+        row = await self.db.fetch_one(
+            'UPDATE todos SET task = %s, completed = %s, '
+            'completed_at = CASE WHEN NOT %s THEN NULL WHEN completed THEN completed_at ELSE %s END '
+            'WHERE id = %s RETURNING id',
+            (task, completed, completed, datetime.now(), todo_id), name='todos_update'
+        )
+        return row is not None
+
+    async def delete_todo(self, todo_id):
+        """Текст удалённой задачи или None, если её не было"""
+        row = await self.db.fetch_one(
+            'DELETE FROM todos WHERE id = %s RETURNING task', (todo_id,), name='todos_delete'
+        )
+        return row['task'] if row else None
+
+    # ===== Bulk =====
+    async def create_todos(self, items):
+        """Вставить задачи [(user_id, task, completed)] одним оператором.
+
+        Возвращает список id той же длины; None — у задач, чей пользователь
+        не найден.
+        """
+        now = datetime.now()
+        row = await self.db.fetch_one('''
+            WITH v AS (
+                SELECT * FROM unnest(%s::int[], %s::text[], %s::bool[])
+                    WITH ORDINALITY AS v(user_id, task, completed, n)
+            ),
+            valid AS (
+                SELECT v.* FROM v WHERE EXISTS (SELECT 1 FROM users u WHERE u.id = v.user_id)
+            ),
+            inserted AS (
+                INSERT INTO todos (user_id, task, completed, created_at, completed_at)
+                SELECT user_id, task, completed, %s::timestamp,
+                       CASE WHEN completed THEN %s::timestamp END
+                FROM valid ORDER BY n
+                RETURNING id
+            )
+            SELECT (SELECT array_agg(n ORDER BY n) FROM valid) AS positions,
+                   (SELECT array_agg(id ORDER BY id) FROM inserted) AS ids
+        ''', (
+            [item[0] for item in items],
+            [item[1] for item in items],
+            [bool(item[2]) for item in items],
+            now,
+            now,
+        ), name='todos_create_bulk')
+
+        ids = [None] * len(items)
+        # id выдаются из последовательности в порядке вставки строк
+        for position, todo_id in zip(row['positions'] or [], row['ids'] or []):
+            ids[position - 1] = todo_id
+        return ids
+
+    async def update_todos(self, items):
+        """Обновить задачи [(id, task|None, completed|None)]; множество найденных id"""
+        rows = await self.db.fetch_all('''
+            UPDATE todos AS t
+            SET task = COALESCE(v.task, t.task),
+                completed = COALESCE(v.completed, t.completed),
+                completed_at = CASE
+                    WHEN v.completed IS NULL OR v.completed = t.completed THEN t.completed_at
+                    WHEN v.completed THEN %s::timestamp
+                END
+            FROM unnest(%s::int[], %s::text[], %s::bool[]) AS v(id, task, completed)
+            WHERE t.id = v.id
+            RETURNING t.id
+        ''', (
+            datetime.now(),
+            [item[0] for item in items],
+            [item[1] for item in items],
+            [item[2] for item in items],
+        ), name='todos_update_bulk')
+        return {row['id'] for row in rows}
+
+    async def delete_todos(self, ids):
+        """Удалить задачи; множество действительно удалённых id"""
+        rows = await self.db.fetch_all(
+            'DELETE FROM todos WHERE id = ANY(%s::int[]) RETURNING id',
+            (list(ids),), name='todos_delete_bulk'
+        )
+        return {row['id'] for row in rows}
+
+    # ===== Stats =====
+    # Архивные задачи все завершены: с архивом они добавляются к total и completed
+    async def get_stats(self, include_archived=False):
+        if include_archived:
+            return await self.reader.fetch_one('''
+                SELECT
+                    COALESCE(SUM(total + archived), 0)::bigint as total,
+                    COALESCE(SUM(completed + archived), 0)::bigint as completed,
+                    COALESCE(SUM(total - completed), 0)::bigint as pending,
+                    COALESCE(SUM(archived), 0)::bigint as archived
+                FROM user_todo_stats
+            ''', name='stats_total_archived')
+        return await self.reader.fetch_one('''
+            SELECT
+                COALESCE(SUM(total), 0)::bigint as total,
+                COALESCE(SUM(completed), 0)::bigint as completed,
+                COALESCE(SUM(total - completed), 0)::bigint as pending
+            FROM user_todo_stats
+        ''', name='stats_total')
+
+    async def get_users_stats(self, include_archived=False):
+        """(колонки, строки-кортежи) со статистикой каждого пользователя"""
+        if include_archived:
+            return await self.reader.fetch_rows('''
+                SELECT
+                    u.id,
+                    u.name,
+                    u.email,
+                    COALESCE(s.total + s.archived, 0) as total_todos,
+                    COALESCE(s.completed + s.archived, 0) as completed_todos,
+                    COALESCE(s.total - s.completed, 0) as pending_todos,
+                    COALESCE(s.archived, 0) as archived_todos
+                FROM users u
+                LEFT JOIN user_todo_stats s ON s.user_id = u.id
+                ORDER BY u.id
+            ''', name='stats_users_archived')
+        return await self.reader.fetch_rows('''
+            SELECT
+                u.id,
+                u.name,
+                u.email,
+                COALESCE(s.total, 0) as total_todos,
+                COALESCE(s.completed, 0) as completed_todos,
+                COALESCE(s.total - s.completed, 0) as pending_todos
+            FROM users u
+            LEFT JOIN user_todo_stats s ON s.user_id = u.id
+            ORDER BY u.id
+        ''', name='stats_users')
+
+    async def get_timeseries(self, bucket, start, end, user_id=None):
+        """(колонки, строки-кортежи): созданные и завершённые задачи по интервалам.
+
+        Интервалы от start до end включительно (оба — начала интервалов
+        размера bucket), пустые — с нулями. Читаются только строки сводки
+        за эти интервалы, сколько бы задач ни было в todos.
+        """
+        join, params, name = 'r.bucket = b.bucket', [start, end, f'1 {bucket}'], f'stats_timeseries_{bucket}'
+        if user_id is not None:
+            join += ' AND r.user_id = %s'
+            params.append(user_id)
+            name += '_user'
+        return await self.reader.fetch_rows(f'''
+            SELECT
+                b.bucket::text AS bucket,
+                COALESCE(SUM(r.created), 0)::bigint AS created,
+                COALESCE(SUM(r.completed), 0)::bigint AS completed
+            FROM generate_series(%s::timestamp, %s::timestamp, %s::interval) AS b(bucket)
+            LEFT JOIN {ROLLUP_TABLES[bucket]} r ON {join}
+            GROUP BY b.bucket
+            ORDER BY b.bucket
+        ''', params, name=name)
+
+
+def escape_like(text):
+    """Экранировать %, _ и \\ для подстановки в шаблон LIKE"""
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def create_storage(backend=settings.STORAGE_BACKEND):
+    """Хранилище по настройке STORAGE_BACKEND"""
+    if backend == 'postgres':
+        return Repository(db.database, db.replicas)
+    if backend == 'memory':
+        from memory_storage import MemoryStorage
+        return MemoryStorage()
+    raise ValueError(f"Неизвестный STORAGE_BACKEND: {backend}")
+
+
+repository = create_storage()
@@ -0,0 +1,33 @@
+import time
+
+import orjson
+from fastapi import Response
+from prometheus_client import Histogram
+
+SERIALIZE_SECONDS = Histogram(
+    'response_serialize_seconds', 'Время построения JSON-тела ответа из строк БД', ['response'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+)
+
+
+def dumps(value) -> bytes:
+    """JSON через orjson; незнакомые типы (Decimal и т.п.) — строкой"""
+    return orjson.dumps(value, default=str)
+
+
+class RowsResponse(Response):
+    """JSON-массив объектов из (колонки, строки-кортежи) курсора.
+
+    Строки из БД уже соответствуют response_model, поэтому эндпоинт
+    возвращает этот ответ напрямую: FastAPI не валидирует его повторно
+    через Pydantic, а тело кодируется один раз orjson без промежуточного
+    jsonable_encoder.
+    """
+
+    media_type = 'application/json'
+
+    def __init__(self, columns, rows, status_code=200, headers=None, name='rows'):
+        started = time.perf_counter()
+        body = dumps([dict(zip(columns, row)) for row in rows])
+        SERIALIZE_SECONDS.labels(name).observe(time.perf_counter() - started)
+        super().__init__(body, status_code=status_code, headers=headers)
@@ -0,0 +1,183 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ===== Storage =====
+# postgres — данные в Postgres (repository.Repository); memory — в памяти
+# процесса (memory_storage.py): для тестов, бенчмарков и маленьких установок
+# без БД. У хранилища в памяти данные свои в каждом процессе, поэтому с ним
+# gunicorn запускает один воркер без перезапусков
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'postgres')
+# Файл снимка хранилища memory (пусто — без снимков): читается при старте,
+# записывается раз в STORAGE_SNAPSHOT_INTERVAL секунд, если были изменения,
+# и при остановке
+STORAGE_SNAPSHOT_PATH = os.getenv('STORAGE_SNAPSHOT_PATH', '')
+STORAGE_SNAPSHOT_INTERVAL = float(os.getenv('STORAGE_SNAPSHOT_INTERVAL', 60))
+
+# ===== Database =====
+DB_HOST = os.getenv('POSTGRESQL_HOST', 'postgres')
+DB_PORT = int(os.getenv('POSTGRESQL_PORT', 5432))
+DB_NAME = os.getenv('POSTGRESQL_NAME', 'myapp')
+DB_USER = os.getenv('POSTGRESQL_USER', 'admin')
+DB_PASSWORD = os.getenv('POSTGRESQL_PASSWORD', 'admin')
+DATABASE_URL = os.getenv(
+    'DATABASE_URL',
+    f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+)
+DB_CONNECT_TIMEOUT = int(os.getenv('DB_CONNECT_TIMEOUT', 5))
+
+# ===== Replicas =====
+# DSN реплик через запятую; чтения идут на них по кругу, записи — в DATABASE_URL
+DATABASE_REPLICA_URLS = [
+    dsn.strip() for dsn in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if dsn.strip()
+]
+# На сколько секунд реплика выводится из ротации после ошибки соединения
+DB_REPLICA_RETRY_AFTER = float(os.getenv('DB_REPLICA_RETRY_AFTER', 10))
+# Сколько секунд после записи клиент читает с primary (cookie read_primary_until),
+# чтобы видеть свои изменения несмотря на отставание реплик
+READ_YOUR_WRITES_SECONDS = float(os.getenv('READ_YOUR_WRITES_SECONDS', 5))
+
+# ===== Connection pool =====
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', 2))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 10))
+# Сколько секунд запрос ждёт свободное соединение, прежде чем получить 503
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 5))
+# Соединение, простаивавшее дольше, проверяется SELECT 1 перед выдачей
+DB_POOL_CHECK_IDLE = float(os.getenv('DB_POOL_CHECK_IDLE', 30))
+# Лишние (сверх min) соединения закрываются после такого простоя
+DB_POOL_MAX_IDLE = float(os.getenv('DB_POOL_MAX_IDLE', 300))
+# Соединений на все воркеры gunicorn вместе (0 — без ограничения): у каждого
+# воркера свой пул, и DB_POOL_MAX_SIZE делится между ними
+DB_POOL_BUDGET = int(os.getenv('DB_POOL_BUDGET', 0))
+
+# ===== Server =====
+# Число процессов-воркеров gunicorn (gunicorn.conf.py); python app.py — всегда один
+WEB_WORKERS = int(os.getenv('WEB_WORKERS', os.cpu_count() or 1))
+# Воркер перезапускается после стольких запросов (+ случайно до JITTER),
+# чтобы утечки памяти не копились и воркеры не уходили на рестарт разом
+WEB_MAX_REQUESTS = int(os.getenv('WEB_MAX_REQUESTS', 10_000))
+WEB_MAX_REQUESTS_JITTER = int(os.getenv('WEB_MAX_REQUESTS_JITTER', 1_000))
+# Сколько секунд воркер дорабатывает текущие запросы при перезапуске
+WEB_GRACEFUL_TIMEOUT = int(os.getenv('WEB_GRACEFUL_TIMEOUT', 30))
+
+if STORAGE_BACKEND == 'memory':
+    WEB_WORKERS = 1
+    WEB_MAX_REQUESTS = 0
+
+if DB_POOL_BUDGET:
+    DB_POOL_MAX_SIZE = max(1, DB_POOL_BUDGET // WEB_WORKERS)
+    DB_POOL_MIN_SIZE = min(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE)
+
+# ===== Admission control =====
+# Лимиты эндпоинтов, которые ходят в БД (admission.py), по классам: read —
+# чтения users и todos, stats — агрегаты /stats и поиск, write — записи.
+# ADMISSION_<КЛАСС>_RATE / _BURST — запросов в секунду на клиента и запас
+# сверх этого (0 — без лимита, сверх — 429); _CONCURRENCY — одновременных
+# запросов класса в воркере (0 — без лимита); _QUEUE и _QUEUE_TIMEOUT_MS —
+# сколько запросов и сколько миллисекунд ждут места, прежде чем получить 503
+ADMISSION = os.getenv('ADMISSION', '1') == '1'
+# 1 — клиент определяется по последнему адресу X-Forwarded-For (его дописывает
+# nginx); включать, только если API доступен исключительно через прокси
+ADMISSION_TRUST_PROXY = os.getenv('ADMISSION_TRUST_PROXY', '0') == '1'
+# Запросы с заголовком X-Service-Token: <этот токен> не ограничиваются token
+# bucket'ами (только числом одновременных): бот ходит в API один за всех своих
+# пользователей и передаёт тот же токен в API_SERVICE_TOKEN. Пусто — исключений нет
+ADMISSION_SERVICE_TOKEN = os.getenv('ADMISSION_SERVICE_TOKEN', '')
+# Сколько клиентов помнят token bucket'ы каждого класса
+ADMISSION_MAX_CLIENTS = int(os.getenv('ADMISSION_MAX_CLIENTS', 10_000))
+_ADMISSION_DEFAULTS = {
+    # класс: (rate, burst, concurrency, queue, queue timeout ms)
+    'read': (100, 200, DB_POOL_MAX_SIZE, 4 * DB_POOL_MAX_SIZE, 1000),
+    'stats': (5, 20, max(1, DB_POOL_MAX_SIZE // 4), DB_POOL_MAX_SIZE, 2000),
+    'write': (50, 100, max(1, DB_POOL_MAX_SIZE // 2), 2 * DB_POOL_MAX_SIZE, 1000),
+}
+ADMISSION_CLASSES = {
+    name: {
+        'rate': float(os.getenv(f'ADMISSION_{name.upper()}_RATE', rate)),
+        'burst': float(os.getenv(f'ADMISSION_{name.upper()}_BURST', burst)),
+        'concurrency': int(os.getenv(f'ADMISSION_{name.upper()}_CONCURRENCY', concurrency)),
+        'queue': int(os.getenv(f'ADMISSION_{name.upper()}_QUEUE', queue)),
+        'queue_timeout': float(os.getenv(f'ADMISSION_{name.upper()}_QUEUE_TIMEOUT_MS', timeout)) / 1000,
+    }
+    for name, (rate, burst, concurrency, queue, timeout) in _ADMISSION_DEFAULTS.items()
+}
+
+# ===== Query log =====
+# Запросы дольше стольких миллисекунд попадают в лог медленных запросов (0 — выключено)
+DB_SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', 500))
+# 1 — для медленных SELECT дополнительно снимать EXPLAIN (ANALYZE, BUFFERS).
+# Запрос при этом выполняется повторно, поэтому по умолчанию выключено
+DB_SLOW_QUERY_EXPLAIN = os.getenv('DB_SLOW_QUERY_EXPLAIN', '0') == '1'
+
+# ===== Async mode =====
+# 1 — эндпоинты работают через асинхронный драйвер psycopg 3 со своим пулом,
+# 0 — через пул psycopg2, вызовы которого выполняются в threadpool
+DB_ASYNC = os.getenv('DB_ASYNC', '0') == '1'
+
+# ===== Pagination =====
+PAGE_SIZE_DEFAULT = int(os.getenv('PAGE_SIZE_DEFAULT', 100))
+PAGE_SIZE_MAX = int(os.getenv('PAGE_SIZE_MAX', 1000))
+# Сколько строк серверный курсор отдаёт за одно обращение при потоковой выгрузке
+DB_STREAM_BATCH_SIZE = int(os.getenv('DB_STREAM_BATCH_SIZE', 1000))
+
+# ===== Partitions and archive =====
+# todos секционирована по месяцам created_at (migrations/0006). manage.py
+# partitions создаёт секции на столько месяцев вперёд; manage.py archive
+# переносит завершённые задачи старше стольких дней в todos_archive
+TODO_PARTITIONS_AHEAD = int(os.getenv('TODO_PARTITIONS_AHEAD', 3))
+# API досоздаёт секции наперёд при старте и раз в столько секунд (0 — только manage.py)
+TODO_PARTITIONS_INTERVAL = float(os.getenv('TODO_PARTITIONS_INTERVAL', 6 * 3600))
+TODO_ARCHIVE_AFTER_DAYS = int(os.getenv('TODO_ARCHIVE_AFTER_DAYS', 90))
+
+# ===== Bulk endpoints =====
+BULK_MAX_ITEMS = int(os.getenv('BULK_MAX_ITEMS', 10000))
+
+# ===== Write batching =====
+# 1 — POST /todos не пишет сам, а ставит задачу в очередь, которая уходит
+# в БД пачками (batching.py): одна фиксация на пачку вместо каждой задачи
+WRITE_BATCHING = os.getenv('WRITE_BATCHING', '0') == '1'
+WRITE_BATCH_MAX_SIZE = int(os.getenv('WRITE_BATCH_MAX_SIZE', 500))
+# Сколько миллисекунд пачка ждёт новых задач после первой
+WRITE_BATCH_MAX_DELAY = float(os.getenv('WRITE_BATCH_MAX_DELAY_MS', 5)) / 1000
+# Переполненная очередь отвечает 503
+WRITE_BATCH_QUEUE_SIZE = int(os.getenv('WRITE_BATCH_QUEUE_SIZE', 10000))
+
+# ===== Cache =====
+# Кэш пользователей и задач по id внутри процесса (см. cache.py); записи
+# других воркеров сбрасывают его по событиям канала changes (LISTEN)
+CACHE_TTL = float(os.getenv('CACHE_TTL', 30))
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 10000))
+
+# ===== Export / import =====
+# Сколько выгрузок и загрузок через COPY идёт одновременно: у каждой своё
+# соединение вне пула; лишние получают 503
+TRANSFER_MAX_CONCURRENT = int(os.getenv('TRANSFER_MAX_CONCURRENT', 2))
+
+# ===== Change events =====
+# Событий в очереди одного подписчика /events; кто не успевает — отключается
+EVENTS_QUEUE_SIZE = int(os.getenv('EVENTS_QUEUE_SIZE', 1000))
+# Секунды между пингами в потоке SSE и между попытками переподключить LISTEN
+EVENTS_HEARTBEAT = float(os.getenv('EVENTS_HEARTBEAT', 15))
+EVENTS_RETRY_DELAY = float(os.getenv('EVENTS_RETRY_DELAY', 2))
+
+# ===== Search =====
+SEARCH_LIMIT_DEFAULT = int(os.getenv('SEARCH_LIMIT_DEFAULT', 20))
+# Сколько лучших по релевантности совпадений можно пролистать (offset + limit).
+# Ранжируются все совпадения: первая страница точна, а время ответа растёт
+# с числом совпадений запроса (частые слова дороже), но не с размером таблицы
+SEARCH_MAX_RESULTS = int(os.getenv('SEARCH_MAX_RESULTS', 1000))
+
+# ===== Stats timeseries =====
+# GET /stats/timeseries: сколько интервалов отдаётся без start и сколько
+# можно запросить за раз (2000 часов — почти три месяца)
+STATS_TIMESERIES_DEFAULT_BUCKETS = int(os.getenv('STATS_TIMESERIES_DEFAULT_BUCKETS', 30))
+STATS_TIMESERIES_MAX_BUCKETS = int(os.getenv('STATS_TIMESERIES_MAX_BUCKETS', 2000))
+
+# ===== Startup and probes =====
+# Сколько секунд старт тратит на прогрев пула; дальше приложение стартует как есть,
+# а готовность (/readyz) определит фоновая проверка БД
+STARTUP_WARMUP_TIMEOUT = float(os.getenv('STARTUP_WARMUP_TIMEOUT', 10))
+# Как часто фоновая задача проверяет БД и сколько ждёт ответа
+HEALTH_CHECK_INTERVAL = float(os.getenv('HEALTH_CHECK_INTERVAL', 5))
+HEALTH_CHECK_TIMEOUT = float(os.getenv('HEALTH_CHECK_TIMEOUT', 2))
@@ -0,0 +1,147 @@
+"""Интерфейс хранилища данных API"""
+from abc import ABC, abstractmethod
+from datetime import timedelta
+
+# Размеры интервалов /stats/timeseries
+BUCKETS = {'hour': timedelta(hours=1), 'day': timedelta(days=1)}
+
+
+def bucket_start(moment, bucket):
+    """Начало интервала bucket ('hour' или 'day'), в который попадает moment"""
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0) if bucket == 'day' else moment
+
+
+# ===== Errors =====
+class IntegrityError(Exception):
+    """Нарушено ограничение целостности (не зависит от бэкенда и драйвера)"""
+
+    def __init__(self, message, sqlstate=None):
+        super().__init__(message)
+        self.sqlstate = sqlstate
+
+
+class UniqueViolation(IntegrityError):
+    """Нарушено ограничение уникальности"""
+
+
+class ForeignKeyViolation(IntegrityError):
+    """Ссылка на несуществующую строку"""
+
+
+class Storage(ABC):
+    """Операции с пользователями, задачами и статистикой, которыми пользуется API.
+
+    Реализации: repository.Repository (Postgres) и memory_storage.MemoryStorage
+    (в памяти процесса); какую использовать, решает STORAGE_BACKEND
+    (repository.create_storage). Страницы и выборки возвращаются как
+    (колонки, строки-кортежи), одиночные записи — как dict или None,
+    created_at и completed_at — строкой. Нарушение уникальности email — UniqueViolation
+    этого модуля.
+
+    Все операции, кроме open/close/warm_up, абстрактные: бэкенд, в котором
+    какой-то не хватает, не создастся, а не упадёт посреди запроса.
+    """
+
+    # ===== Lifecycle =====
+    async def open(self):
+        """Подготовить хранилище к запросам (пул соединений, загрузка снимка)"""
+
+    async def close(self):
+        """Освободить ресурсы; после close запросы не выполняются"""
+
+    @abstractmethod
+    def status(self) -> dict:
+        """Состояние хранилища для /health"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def ping(self):
+        """Исключение, если хранилище недоступно"""
+        raise NotImplementedError
+
+    async def warm_up(self):
+        """Подготовить частые запросы; вызывается при старте"""
+
+    # ===== Users =====
+    @abstractmethod
+    async def list_users(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_user(self, user_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_user_by_email(self, email):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def user_exists(self, user_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def create_user(self, name, email):
+        raise NotImplementedError
+
+    # ===== Todos =====
+    @abstractmethod
+    async def get_todo(self, todo_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_archived_todo(self, todo_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list_todos(self, limit, after=None, user_id=None, include_archived=False):
+        raise NotImplementedError
+
+    @abstractmethod
+    def stream_todos(self, after=None, user_id=None, include_archived=False):
+        """Асинхронный итератор dict-строк в порядке list_todos"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def search_todos(self, text, limit, offset=0, user_id=None, completed=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def create_todo(self, user_id, task, completed):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update_todo(self, todo_id, task, completed):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete_todo(self, todo_id):
+        raise NotImplementedError
+
+    # ===== Bulk =====
+    @abstractmethod
+    async def create_todos(self, items):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update_todos(self, items):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete_todos(self, ids):
+        raise NotImplementedError
+
+    # ===== Stats =====
+    @abstractmethod
+    async def get_stats(self, include_archived=False):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_users_stats(self, include_archived=False):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_timeseries(self, bucket, start, end, user_id=None):
+        """(колонки bucket, created, completed, строки-кортежи) по интервалам
+        от start до end включительно; user_id=None — по всем пользователям"""
+        raise NotImplementedError
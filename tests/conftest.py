@@ -0,0 +1,48 @@
+"""Тесты API на хранилище в памяти (STORAGE_BACKEND=memory): без Postgres.
+
+Настройки читаются при импорте settings, поэтому окружение задаётся здесь,
+до импорта app.
+"""
+import os
+import sys
+
+os.environ['STORAGE_BACKEND'] = 'memory'
+os.environ['STORAGE_SNAPSHOT_PATH'] = ''
+os.environ['WRITE_BATCHING'] = '0'
+os.environ['DB_POOL_MIN_SIZE'] = '1'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import admission
+import app as app_module
+import settings
+from cache import todos_cache, users_cache
+
+
+@pytest.fixture
+def client():
+    """Клиент API с пустым хранилищем, кэшами и лимитами"""
+    app_module.repository._reset()
+    users_cache.clear()
+    todos_cache.clear()
+    admission.classes.update(
+        {name: admission.EndpointClass(name, **limits) for name, limits in settings.ADMISSION_CLASSES.items()}
+    )
+    with TestClient(app_module.app) as client:
+        yield client
+
+
+@pytest.fixture
+def user_id(client):
+    return client.post('/users', json={'name': 'Ann', 'email': 'ann@example.com'}).json()['id']
+
+
+@pytest.fixture
+def create_todos(client):
+    """create_todos(user_id, count) — id задач, созданных через POST /todos/bulk"""
+    def create(user_id, count):
+        response = client.post('/todos/bulk', json=[{'user_id': user_id, 'task': f'task {i}'} for i in range(count)])
+        return [result['id'] for result in response.json()['results']]
+    return create
@@ -0,0 +1,73 @@
+import asyncio
+
+import admission
+import app as app_module
+
+
+def set_class(name, **limits):
+    params = {'rate': 0, 'burst': 0, 'concurrency': 0, 'queue': 0, 'queue_timeout': 1}
+    params.update(limits)
+    admission.classes[name] = admission.EndpointClass(name, **params)
+    return admission.classes[name]
+
+
+def test_rate_limit_returns_429(client):
+    set_class('read', rate=1, burst=1)
+    assert client.get('/users').status_code == 200
+    response = client.get('/users')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+
+
+def test_service_token_skips_rate_limit(client, monkeypatch):
+    monkeypatch.setattr(app_module.settings, 'ADMISSION_SERVICE_TOKEN', 'secret')
+    set_class('read', rate=1, burst=1)
+    for _ in range(3):
+        assert client.get('/users', headers={'X-Service-Token': 'secret'}).status_code == 200
+    assert client.get('/users').status_code == 200
+    assert client.get('/users', headers={'X-Service-Token': 'wrong'}).status_code == 429
+
+
+def test_overload_returns_503(client):
+    limits = set_class('read', concurrency=1, queue=0)
+    limits.limiter.active = 1  # место занято другим запросом
+    response = client.get('/users')
+    assert response.status_code == 503
+    assert 'Retry-After' in response.headers
+
+
+def test_slot_released_after_response(client, user_id):
+    limits = set_class('read', concurrency=1, queue=0)
+    client.post('/todos', json={'user_id': user_id, 'task': 'x'})
+    for _ in range(3):
+        assert client.get('/todos').status_code == 200
+        assert client.get('/todos', params={'stream': True}).status_code == 200
+    assert limits.limiter.active == 0
+
+
+def test_slot_released_when_client_disconnects(client, user_id):
+    """Клиент отключился до отправки тела: место всё равно освобождается"""
+    limits = set_class('read', concurrency=1, queue=0)
+    for i in range(3):
+        client.post('/todos', json={'user_id': user_id, 'task': f'task {i}'})
+
+    async def request():
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': 'GET', 'scheme': 'http', 'path': '/todos', 'raw_path': b'/todos',
+            'query_string': b'stream=true', 'root_path': '', 'headers': [],
+            'client': ('127.0.0.1', 1234), 'server': ('testserver', 80),
+        }
+
+        async def receive():
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            await asyncio.sleep(0)
+
+        await app_module.app(scope, receive, send)
+
+    for _ in range(2):
+        asyncio.run(request())
+    assert limits.limiter.active == 0
+    assert client.get('/users').status_code == 200
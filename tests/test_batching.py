@@ -0,0 +1,49 @@
+import asyncio
+
+from batching import WriteBatcher
+
+
+class Unavailable(Exception):
+    pass
+
+
+def run_batch(items, flush, fatal=()):
+    """Отправить items одной пачкой; результат или исключение каждого submit()"""
+    async def scenario():
+        batcher = WriteBatcher('test', flush, max_size=len(items), max_delay=0.01, fatal=fatal)
+        batcher.start()
+        results = await asyncio.gather(*(batcher.submit(item) for item in items),
+                                       return_exceptions=True)
+        await batcher.stop()
+        return results
+    return asyncio.run(scenario())
+
+
+def test_bad_item_fails_only_its_caller():
+    calls = []
+
+    async def flush(items):
+        calls.append(list(items))
+        if 'bad' in items:
+            raise ValueError("bad item")
+        return [item.upper() for item in items]
+
+    results = run_batch(['a', 'bad', 'c'], flush)
+
+    assert results[0] == 'A' and results[2] == 'C'
+    assert isinstance(results[1], ValueError)
+    assert calls[0] == ['a', 'bad', 'c']
+    assert calls[1:] == [['a'], ['bad'], ['c']]
+
+
+def test_unavailable_db_fails_whole_batch_without_retries():
+    calls = []
+
+    async def flush(items):
+        calls.append(list(items))
+        raise Unavailable("no connection")
+
+    results = run_batch(['a', 'b'], flush, fatal=Unavailable)
+
+    assert all(isinstance(r, Unavailable) for r in results)
+    assert len(calls) == 1
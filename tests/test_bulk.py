@@ -0,0 +1,63 @@
+import app as app_module
+
+
+def test_bulk_delete_flags_repeated_ids(client, user_id, create_todos):
+    todo_id, = create_todos(user_id, 1)
+
+    body = client.request('DELETE', '/todos/bulk', json=[todo_id, todo_id, 999]).json()
+
+    assert body['succeeded'] == 1
+    assert body['failed'] == 2
+    assert body['results'][0]['error'] is None
+    assert body['results'][1]['error'] == 'Задача повторяется в запросе'
+    assert body['results'][2]['error'] == 'Задача не найдена'
+    assert client.get(f'/todos/{todo_id}').status_code == 404
+
+
+def test_bulk_create_reports_missing_user_per_item(client, user_id):
+    body = client.post('/todos/bulk', json=[
+        {'user_id': user_id, 'task': 'ok'},
+        {'user_id': 999, 'task': 'no such user'},
+    ]).json()
+
+    assert body['succeeded'] == 1
+    assert body['results'][0]['id'] is not None
+    assert body['results'][1]['error'] == 'Пользователь не найден'
+
+
+def test_bulk_update_reports_each_item(client, user_id, create_todos):
+    first, second = create_todos(user_id, 2)
+
+    body = client.patch('/todos/bulk', json=[
+        {'id': first, 'completed': True},
+        {'id': first, 'task': 'again'},
+        {'id': 999, 'completed': True},
+        {'id': second, 'task': 'renamed'},
+    ]).json()
+
+    assert [result['error'] for result in body['results']] == [
+        None, 'Задача повторяется в запросе', 'Задача не найдена', None,
+    ]
+    assert client.get(f'/todos/{first}').json()['completed'] is True
+    assert client.get(f'/todos/{second}').json()['task'] == 'renamed'
+
+
+def test_bulk_create_isolates_item_the_database_rejects(client, user_id, monkeypatch):
+    create = app_module.repository.create_todos
+
+    async def create_todos(items):
+        if any('\x00' in task for _, task, _ in items):
+            raise ValueError("A string literal cannot contain NUL (0x00) characters.")
+        return await create(items)
+
+    monkeypatch.setattr(app_module.repository, 'create_todos', create_todos)
+    body = client.post('/todos/bulk', json=[
+        {'user_id': user_id, 'task': 'ok'},
+        {'user_id': user_id, 'task': 'bad\x00'},
+        {'user_id': 999, 'task': 'no such user'},
+    ]).json()
+
+    assert body['succeeded'] == 1
+    assert body['results'][0]['id'] is not None
+    assert body['results'][1]['error'].startswith('Задача не записана')
+    assert body['results'][2]['error'] == 'Пользователь не найден'
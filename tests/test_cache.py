@@ -0,0 +1,66 @@
+import asyncio
+
+import app as app_module
+import db
+from cache import todos_cache
+
+
+def create_todo(client, user_id, task='buy milk'):
+    return client.post('/todos', json={'user_id': user_id, 'task': task}).json()['id']
+
+
+def test_write_from_another_worker_invalidates_cache(client, user_id):
+    """Запись мимо этого воркера доходит событием и сбрасывает его кэш"""
+    todo_id = create_todo(client, user_id)
+    first = client.get(f'/todos/{todo_id}')
+    assert first.json()['task'] == 'buy milk'
+
+    # Как будто задачу изменил другой воркер: локальной инвалидации нет,
+    # только событие канала changes
+    asyncio.run(app_module.repository.update_todo(todo_id, 'buy bread', True))
+
+    second = client.get(f'/todos/{todo_id}', headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    assert second.json()['task'] == 'buy bread'
+
+
+def test_cache_miss_loads_from_primary(client):
+    seen = []
+
+    async def loader():
+        seen.append(db.reading_from_primary())
+        return {'id': 1}
+
+    asyncio.run(app_module.cached(todos_cache, 1, loader))
+    assert seen == [True]
+
+
+def test_read_your_writes_bypasses_cache(client):
+    todos_cache.set(1, {'id': 1, 'task': 'stale'})
+
+    async def loader():
+        return {'id': 1, 'task': 'fresh'}
+
+    async def read():
+        with db.read_from_primary():
+            return await app_module.cached(todos_cache, 1, loader)
+
+    assert asyncio.run(read()).value['task'] == 'fresh'
+    # Свежее значение заменило устаревшее и для остальных клиентов
+    assert todos_cache.get(1).value['task'] == 'fresh'
+
+
+def test_etag_revalidation_follows_updates(client, user_id):
+    todo_id = create_todo(client, user_id)
+    first = client.get(f'/todos/{todo_id}')
+    etag = first.headers['ETag']
+
+    assert client.get(f'/todos/{todo_id}', headers={'If-None-Match': etag}).status_code == 304
+
+    client.put(f'/todos/{todo_id}', json={'task': 'buy bread', 'completed': False})
+    changed = client.get(f'/todos/{todo_id}', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+
+    client.delete(f'/todos/{todo_id}')
+    assert client.get(f'/todos/{todo_id}', headers={'If-None-Match': etag}).status_code == 404
@@ -0,0 +1,76 @@
+import asyncio
+import json
+
+from pagination import ndjson_response
+
+
+def test_cursor_pages_cover_every_todo_once(client, user_id, create_todos):
+    ids = create_todos(user_id, 7)
+
+    seen = []
+    params = {'limit': 3}
+    while True:
+        response = client.get('/todos', params=params)
+        assert response.status_code == 200
+        seen += [todo['id'] for todo in response.json()]
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor is None:
+            break
+        params = {'limit': 3, 'after': cursor}
+
+    # От новых к старым, без пропусков и повторов
+    assert seen == sorted(ids, reverse=True)
+
+
+def test_cursor_survives_new_todos(client, user_id, create_todos):
+    ids = create_todos(user_id, 4)
+    first = client.get('/todos', params={'limit': 2})
+    create_todos(user_id, 2)
+
+    second = client.get('/todos', params={'limit': 2, 'after': first.headers['X-Next-Cursor']})
+
+    # Новые задачи не сдвигают уже начатый обход
+    assert [todo['id'] for todo in second.json()] == sorted(ids, reverse=True)[2:]
+
+
+def test_user_pages_and_stream_agree(client, user_id, create_todos):
+    other = client.post('/users', json={'name': 'Bob', 'email': 'bob@example.com'}).json()['id']
+    ids = create_todos(user_id, 5)
+    create_todos(other, 3)
+
+    page = client.get(f'/todos/user/{user_id}', params={'limit': 10}).json()
+    stream = client.get(f'/todos/user/{user_id}', params={'stream': 'true'})
+
+    assert [todo['id'] for todo in page] == sorted(ids, reverse=True)
+    assert [json.loads(line)['id'] for line in stream.text.splitlines()] == sorted(ids, reverse=True)
+
+
+def test_malformed_cursor_is_rejected(client):
+    assert client.get('/todos', params={'after': 'not-a-cursor'}).status_code == 400
+
+
+def test_stream_source_closed_when_client_disconnects():
+    """Клиент отключился до начала тела: источник строк всё равно закрыт"""
+    closed = []
+
+    async def rows():
+        try:
+            for i in range(3):
+                yield {'id': i}
+        finally:
+            closed.append(True)
+
+    async def request():
+        response = await ndjson_response(rows())
+
+        async def receive():
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            await asyncio.sleep(0)
+
+        await response({'type': 'http'}, receive, send)
+        # Проверка внутри цикла: asyncio.run сам закрыл бы генератор при выходе
+        assert closed == [True]
+
+    asyncio.run(request())
@@ -0,0 +1,24 @@
+import settings
+
+
+def test_best_match_ranked_first_beyond_window(client, user_id, monkeypatch):
+    """Лучшее совпадение на первой странице, даже если до него в порядке
+    просмотра больше SEARCH_MAX_RESULTS худших"""
+    monkeypatch.setattr(settings, 'SEARCH_MAX_RESULTS', 5)
+    client.post('/todos', json={'user_id': user_id, 'task': 'milk milk'})
+    client.post('/todos/bulk', json=[
+        {'user_id': user_id, 'task': f'milk and other words {i}'} for i in range(10)
+    ])
+    results = client.get('/todos/search', params={'q': 'milk', 'limit': 2}).json()
+    assert results[0]['task'] == 'milk milk'
+    assert results[0]['rank'] > results[1]['rank']
+
+
+def test_paging_stops_at_window(client, user_id, monkeypatch):
+    monkeypatch.setattr(settings, 'SEARCH_MAX_RESULTS', 5)
+    client.post('/todos/bulk', json=[{'user_id': user_id, 'task': f'milk {i}'} for i in range(10)])
+    first = client.get('/todos/search', params={'q': 'milk', 'limit': 3})
+    assert first.headers['X-Next-Offset'] == '3'
+    second = client.get('/todos/search', params={'q': 'milk', 'limit': 3, 'offset': 3})
+    assert len(second.json()) == 2
+    assert 'X-Next-Offset' not in second.headers
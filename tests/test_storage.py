@@ -0,0 +1,61 @@
+import asyncio
+import json
+from datetime import datetime
+
+import pytest
+
+from memory_storage import MemoryStorage
+from storage import Storage
+
+# Снимок версии 1: без сводок и без completed_at у задач
+SNAPSHOT_V1 = {
+    'next_user_id': 2,
+    'next_todo_id': 3,
+    'users': [[1, 'Ann', 'ann@example.com', '2024-05-01T09:00:00']],
+    'todos': [
+        [1, 1, 'buy milk', False, '2024-05-01T10:15:00'],
+        [2, 1, 'call mom', True, '2024-05-01T11:30:00'],
+    ],
+}
+
+
+def test_backend_missing_an_operation_is_not_created():
+    class Partial(Storage):
+        async def get_todo(self, todo_id):
+            return None
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def test_snapshot_v1_is_rewritten_as_v2(tmp_path):
+    path = tmp_path / 'snapshot.json'
+    path.write_text(json.dumps(SNAPSHOT_V1))
+    day = datetime(2024, 5, 1)
+
+    async def reopen():
+        storage = MemoryStorage(snapshot_path=str(path), snapshot_interval=0)
+        await storage.open()
+        state = (
+            await storage.list_users(),
+            await storage.list_todos(10),
+            await storage.get_stats(),
+            await storage.get_timeseries('day', day, day),
+            await storage.get_timeseries('hour', day.replace(hour=10), day.replace(hour=11), user_id=1),
+        )
+        # Снимок перезаписывается в текущей версии
+        await storage.snapshot()
+        return state
+
+    loaded = asyncio.run(reopen())
+    _, (_, todos), _, (_, days), (_, hours) = loaded
+    assert [todo[:4] for todo in todos] == [(2, 1, 'call mom', True), (1, 1, 'buy milk', False)]
+    assert [todo[5] for todo in todos] == [None, None]
+    # Сводки версии 1 восстанавливаются по created_at задач
+    assert days == [(str(day), 2, 0)]
+    assert [row[1] for row in hours] == [1, 1]
+
+    saved = json.loads(path.read_text())
+    assert saved['version'] == 2
+    assert saved['next_user_id'] == 2 and saved['next_todo_id'] == 3
+    assert asyncio.run(reopen()) == loaded
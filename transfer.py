@@ -0,0 +1,273 @@
+"""Выгрузка и загрузка таблиц целиком через COPY.
+
+Данные идут потоком: COPY TO STDOUT отдаёт куски по мере чтения, а в
+COPY FROM STDIN куски пишутся по мере получения, так что память не
+зависит от числа строк. Загрузка идёт через временную таблицу: сначала
+COPY в неё, затем один оператор слияния в целевую таблицу (один
+statement-триггер статистики на весь файл) и сдвиг последовательности id.
+
+Строки сопоставляются с существующими по id. У секционированной todos
+первичный ключ (id, created_at), и уникальность одного id БД не проверяет:
+id выдаёт todos_id_seq, а явные id пишет только загрузка. Поэтому слияние
+держит таблицу в SHARE ROW EXCLUSIVE (чтения идут, записи ждут), пока
+вставляет строки и сдвигает последовательность, а id todos ищутся и среди
+архивных задач.
+
+Выгрузка todos — полный снимок: в неё входят и задачи из todos_archive.
+Загруженные в пустую БД, они становятся обычными задачами, и следующий
+manage.py archive снова перенесёт их в архив.
+
+Используется и API (/export, /import), и manage.py export/import.
+"""
+import csv
+import io
+
+import psycopg
+
+import settings
+from storage import IntegrityError
+
+FORMATS = ('csv', 'ndjson')
+CONFLICTS = ('skip', 'update')
+
+# Колонки таблиц: (имя, тип, значение вместо пропущенного)
+TABLES = {
+    'users': [
+        ('id', 'integer', "nextval(pg_get_serial_sequence('users', 'id'))"),
+        ('name', 'text', None),
+        ('email', 'text', None),
+        ('created_at', 'timestamp', 'CURRENT_TIMESTAMP'),
+    ],
+    'todos': [
+        ('id', 'integer', "nextval(pg_get_serial_sequence('todos', 'id'))"),
+        ('user_id', 'integer', None),
+        ('task', 'text', None),
+        ('completed', 'boolean', 'false'),
+        ('created_at', 'timestamp', 'CURRENT_TIMESTAMP'),
+        ('completed_at', 'timestamp', None),
+    ],
+}
+# Выражения UPDATE, которые не сводятся к «значение из файла или текущее»:
+# время завершения есть только у завершённой задачи
+UPDATE_EXPRESSIONS = {
+    'todos': {
+        'completed_at': 'CASE WHEN COALESCE(s.completed, t.completed) '
+                        'THEN COALESCE(s.completed_at, t.completed_at) END',
+    },
+}
+# Что выгружается: задачи — вместе с архивом
+EXPORT_SOURCES = {
+    'todos': '(SELECT * FROM todos UNION ALL SELECT * FROM todos_archive) AS todos',
+}
+# Уже занятые id: задача из архива тоже считается существующей
+EXISTING_IDS = {
+    'users': 'SELECT id FROM users',
+    'todos': 'SELECT id FROM todos UNION ALL SELECT id FROM todos_archive',
+}
+
+# NDJSON через COPY: одна колонка в CSV-режиме с символами кавычки и
+# разделителя, которых в JSON не бывает, — текст строки не экранируется
+NDJSON_COPY = "FORMAT csv, QUOTE e'\\x01', DELIMITER e'\\x02'"
+MEDIA_TYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+
+class InvalidData(Exception):
+    """Файл не разбирается или не подходит к таблице"""
+
+
+def columns(table):
+    return [name for name, _, _ in TABLES[table]]
+
+
+def export_sql(table, fmt):
+    source = EXPORT_SOURCES.get(table, table)
+    select = f"SELECT {', '.join(columns(table))} FROM {source} ORDER BY id"
+    if fmt == 'csv':
+        return f'COPY ({select}) TO STDOUT WITH (FORMAT csv, HEADER)'
+    return f'COPY (SELECT row_to_json(t) FROM ({select}) t) TO STDOUT WITH ({NDJSON_COPY})'
+
+
+def csv_header(line, table):
+    """Колонки из первой строки CSV; InvalidData, если таких колонок у таблицы нет"""
+    header = next(csv.reader(io.StringIO(line.decode('utf-8-sig'))), [])
+    unknown = [name for name in header if name not in columns(table)]
+    if not header or unknown:
+        raise InvalidData(f"Неизвестные колонки {table}: {', '.join(unknown) or 'пустой заголовок'}")
+    return header
+
+
+def staging_sql(table):
+    spec = ', '.join(f'{name} {type_}' for name, type_, _ in TABLES[table])
+    return [
+        # Вместо события на каждую строку — одно событие import (см. merge_sql)
+        "SET LOCAL app.change_events = 'off'",
+        f'CREATE TEMP TABLE import_staging ({spec}) ON COMMIT DROP',
+        'CREATE TEMP TABLE import_json (doc jsonb) ON COMMIT DROP',
+    ]
+
+
+def copy_in_sql(fmt, header=None):
+    if fmt == 'csv':
+        return f"COPY import_staging ({', '.join(header)}) FROM STDIN WITH (FORMAT csv)"
+    return f'COPY import_json (doc) FROM STDIN WITH ({NDJSON_COPY})'
+
+
+def merge_sql(table, fmt, on_conflict):
+    """Запросы после COPY; последний возвращает (получено строк, вставлено/обновлено, следующий id)"""
+    names = columns(table)
+    statements = []
+    if fmt == 'ndjson':
+        statements.append(f'''
+            INSERT INTO import_staging
+            SELECT r.* FROM import_json, jsonb_populate_record(NULL::import_staging, doc) AS r
+            WHERE doc IS NOT NULL
+        ''')
+    statements.append(f'LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE')
+
+    values = ', '.join(f'COALESCE(s.{name}, {default})' if default else f's.{name}'
+                       for name, _, default in TABLES[table])
+    new_rows = f's.id IS NULL OR NOT EXISTS (SELECT 1 FROM ({EXISTING_IDS[table]}) e WHERE e.id = s.id)'
+    if on_conflict == 'update':
+        # Пропущенное в файле значение с умолчанием оставляет текущее
+        expressions = UPDATE_EXPRESSIONS.get(table, {})
+        updates = ', '.join(
+            f'{name} = {expressions[name]}' if name in expressions
+            else f'{name} = COALESCE(s.{name}, t.{name})' if default else f'{name} = s.{name}'
+            for name, _, default in TABLES[table] if name != 'id'
+        )
+        merge = f'''
+            updated AS (
+                UPDATE {table} AS t SET {updates}
+                FROM staged s
+                WHERE t.id = s.id
+                RETURNING t.id
+            ),
+        '''
+        merged = '(SELECT id FROM updated UNION ALL SELECT id FROM inserted)'
+    else:
+        merge, merged = '', 'inserted'
+    # Явно заданные id не двигают последовательность: догоняем её,
+    # не откатывая назад значения, уже выданные другим вставкам
+    seq = f"pg_get_serial_sequence('{table}', 'id')"
+    statements.append(
+        f"SELECT pg_notify('changes', json_build_object('type', 'import', 'table', '{table}')::text)"
+    )
+    statements.append(f'''
+        WITH staged AS (
+            -- Повтор id в файле: остаётся последняя строка
+            SELECT * FROM import_staging s
+            WHERE s.id IS NULL OR NOT EXISTS (
+                SELECT 1 FROM import_staging later WHERE later.id = s.id AND later.ctid > s.ctid
+            )
+        ),
+        {merge}
+        inserted AS (
+            INSERT INTO {table} ({', '.join(names)})
+            SELECT {values} FROM staged s
+            WHERE {new_rows}
+            ON CONFLICT DO NOTHING
+            RETURNING id
+        )
+        SELECT (SELECT count(*) FROM import_staging) AS received,
+               (SELECT count(*) FROM {merged} m) AS merged,
+               setval({seq}, GREATEST(COALESCE((SELECT max(id) FROM inserted), 0) + 1,
+                                      nextval({seq})), false) AS next_id
+    ''')
+    return statements
+
+
+def translate(e):
+    """Исключение этого модуля или db для ошибки драйвера при загрузке"""
+    # Класс 22 — неразборчивые данные, 23502 — пустое обязательное поле
+    if isinstance(e, (psycopg.errors.DataError, psycopg.errors.NotNullViolation)):
+        return InvalidData(str(e).strip())
+    if isinstance(e, psycopg.IntegrityError):
+        return IntegrityError(str(e).strip(), e.sqlstate)
+    return e
+
+
+# ===== Async (API) =====
+async def connect():
+    """Отдельное соединение вне пула: долгий COPY не занимает соединения запросов"""
+    return await psycopg.AsyncConnection.connect(
+        settings.DATABASE_URL, connect_timeout=settings.DB_CONNECT_TIMEOUT
+    )
+
+
+async def export_chunks(table, fmt):
+    """Асинхронный итератор кусков выгрузки (bytes).
+
+    Соединение открывается и COPY запускается при первом обращении,
+    поэтому ошибки подключения видны до отправки заголовков ответа.
+    """
+    conn = await connect()
+    try:
+        async with conn.cursor() as cursor:
+            async with cursor.copy(export_sql(table, fmt)) as copy:
+                # COPY отдаёт по строке за раз: склеиваем в куски побольше
+                buffer = bytearray()
+                async for data in copy:
+                    buffer += data
+                    if len(buffer) >= EXPORT_CHUNK_BYTES:
+                        yield bytes(buffer)
+                        buffer.clear()
+                if buffer:
+                    yield bytes(buffer)
+    finally:
+        await conn.close()
+
+
+async def import_stream(table, fmt, chunks, on_conflict='skip'):
+    """Загрузить поток кусков файла; {"received": ..., "merged": ...}"""
+    chunks = chunks.__aiter__()
+    header, first = None, b''
+    if fmt == 'csv':
+        # Заголовок нужен до начала COPY: по нему строится список колонок
+        async for chunk in chunks:
+            first += chunk
+            if b'\n' in first:
+                break
+        line, _, first = first.partition(b'\n')
+        header = csv_header(line, table)
+
+    conn = await connect()
+    try:
+        async with conn.transaction():
+            async with conn.cursor() as cursor:
+                for statement in staging_sql(table):
+                    await cursor.execute(statement)
+                async with cursor.copy(copy_in_sql(fmt, header)) as copy:
+                    if first:
+                        await copy.write(first)
+                    async for chunk in chunks:
+                        await copy.write(chunk)
+                for statement in merge_sql(table, fmt, on_conflict):
+                    await cursor.execute(statement)
+                received, merged, _next_id = await cursor.fetchone()
+    except psycopg.Error as e:
+        raise translate(e) from e
+    finally:
+        await conn.close()
+    return {"received": received, "merged": merged}
+
+
+# ===== Sync (manage.py) =====
+def export_to_file(conn, table, fmt, file):
+    """Выгрузить таблицу в двоичный файл через соединение psycopg2"""
+    with conn.cursor() as cursor:
+        cursor.copy_expert(export_sql(table, fmt), file)
+
+
+def import_from_file(conn, table, fmt, file, on_conflict='skip'):
+    """Загрузить двоичный файл в таблицу через соединение psycopg2 (одна транзакция)"""
+    header = csv_header(file.readline(), table) if fmt == 'csv' else None
+    with conn:
+        with conn.cursor() as cursor:
+            for statement in staging_sql(table):
+                cursor.execute(statement)
+            cursor.copy_expert(copy_in_sql(fmt, header), file)
+            for statement in merge_sql(table, fmt, on_conflict):
+                cursor.execute(statement)
+            received, merged, _next_id = cursor.fetchone()
+    return {"received": received, "merged": merged}